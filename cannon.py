@@ -1,8 +1,23 @@
 import numpy as np
 import pygame as pg
 # from random import randint, choice, random
+import ast
+import bisect
+import collections
+import copy
+import gzip
+import hashlib
+import json
+import linecache
 import math
+import multiprocessing
+import os
+import pickle
 import random
+import threading
+import time
+import tracemalloc
+import zlib
 
 pg.init()
 pg.font.init()
@@ -13,18 +28,832 @@ RED = (255, 0, 0)
 BLUE = (0, 0, 255)
 GRAY = (128, 128, 128)
 
-SCREEN_SIZE = (800, 600)
+SCREEN_SIZE = (800, 600)  # Logical view: the part of the world drawn in a frame, in world units
+WORLD_SIZE = SCREEN_SIZE  # Physics bounds and spawning area, e.g. (4000, 1200) for a world the camera scrolls over
+WINDOW_SIZE = SCREEN_SIZE  # Initial size of the resizable window, the frame is scaled to fit
+RENDER_SCALE = 1.0  # Internal render resolution relative to the playfield, e.g. 0.5 on weak machines
+DISPLAY_LIST = False  # Record every frame as a DisplayList and replay it, reusing the spans that didn't change
+GRAV = 2  # Gravity applied to shells and particles every tick
+SHELL_DAMAGE = 25  # Health a tank loses when hit by the other tank's shell
+BOMB_DAMAGE = 10  # Health a tank loses when a bomb falls onto it
+MAX_SHELLS = 2000  # Global cap on live shells: shots and submunitions beyond it are dropped
+CLUSTER_COUNT = 24  # Submunitions a cluster shell (right mouse button) bursts into at the top of its flight
+CLUSTER_DEPTH = 2  # Generations of bursts: submunitions that are still rising split again until this runs out
+CLUSTER_SPEED = 8  # Speed of the submunitions relative to the bursting shell
+CLUSTER_RAD = 6  # Radius of a submunition
+PIXEL_COLLISION = False  # Hit-test ellipse and polygon targets pixel by pixel instead of by their bounding circle
+MASK_CACHE_SIZE = 128  # Collision masks kept for PIXEL_COLLISION, least recently used evicted first
+FPS = 15  # Frame rate passed to clock.tick, also the frame-time budget of the quality governor
+PACING = False  # Keep simulation ticks on a wall-clock schedule, skipping draws when behind
+MAX_FRAME_SKIP = 5  # Maximum consecutive frames skipped in pacing mode
+BOMB_INTERVAL = (10, 60)  # Range of ticks between the bomb drops of a target, drawn at random for every bomb
+WAVE_DELAY = 15  # Ticks between the last shell of a mission settling and the next wave
+
+TELEMETRY_FILE = None  # e.g. 'telemetry.jsonl' to export frame-time histograms while playing
+TELEMETRY_FORMAT = 'jsonl'  # 'jsonl' (rotating JSON lines) or 'prom' (Prometheus text file)
+TELEMETRY_BUILD = 'dev'  # Label written with every record so builds can be compared
+RECORD_FILE = None  # e.g. 'session.rec' to record the inputs of a session for replay_export.py
+TRACE_DIR = None  # e.g. 'trace' to record the full state of every tick into column files for TraceReader
+ALLOC_PROFILE = False  # Attribute memory allocations to phases and entity types with tracemalloc (slow), reported on exit
+PREFETCH_MISSIONS = True  # Build the next mission on a background thread while the shells of the last one settle
+LATENCY_PROBE = False  # Timestamp aiming, firing and moving inputs and report their input-to-display latency on exit
+
+
+def rand_color(rng=random):
+    return (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255))
+
+
+def ray_circle(origin, direction, center, rad):
+    '''
+    Intersects a ray with a circle.
+
+    Parameters:
+    - origin (list): Start of the ray.
+    - direction (list): Unit direction of the ray.
+    - center (list): Center of the circle.
+    - rad (float): Radius of the circle.
+
+    Returns:
+    - float or None: Distance along the ray to the circle (0 if the origin is inside), or None if it misses.
+    '''
+    mx, my = origin[0] - center[0], origin[1] - center[1]
+    b = mx * direction[0] + my * direction[1]
+    c = mx * mx + my * my - rad * rad
+    if c <= 0:
+        return 0.0
+    disc = b * b - c
+    if b > 0 or disc < 0:
+        return None
+    return -b - math.sqrt(disc)
+
+
+def ray_box(origin, direction, box, max_dist=math.inf):
+    '''
+    Intersects a ray with an axis-aligned box (slab test).
+
+    Parameters:
+    - origin (list): Start of the ray.
+    - direction (list): Unit direction of the ray.
+    - box (list): [left, top, right, bottom].
+    - max_dist (float): Length of the ray. Default is infinite.
+
+    Returns:
+    - float or None: Distance along the ray to the box (0 if the origin is inside), or None if it misses.
+    '''
+    near, far = 0.0, max_dist
+    for i in range(2):
+        if direction[i] == 0:
+            if origin[i] < box[i] or origin[i] > box[i + 2]:
+                return None
+            continue
+        t0 = (box[i] - origin[i]) / direction[i]
+        t1 = (box[i + 2] - origin[i]) / direction[i]
+        if t0 > t1:
+            t0, t1 = t1, t0
+        near, far = max(near, t0), min(far, t1)
+        if near > far:
+            return None
+    return near
+
+
+class RenderQuality:
+    '''
+    Rendering detail settings passed to the draw methods. Every Manager has its own, lowered step
+    by step by its QualityGovernor. They only change what is drawn, never the simulation.
+    '''
+
+    def __init__(self):
+        '''
+        Constructor method. Starts at full detail.
+        '''
+        self.focus = []  # Tank coordinates, updated by Manager.draw
+        self.reset()
+
+    def reset(self):
+        '''
+        Restores full detail.
+        '''
+        self.polygon_sides = None  # Maximum vertices drawn for PolygonTarget (None: all)
+        self.bomb_point_dist = None  # Bombs further than this from every tank are drawn as points (None: never)
+        self.tank_wheels = True  # Whether Tank.draw draws the wheels
+        self.particles = True  # Whether particle effects are drawn
+
+
+class MaskCache:
+    '''
+    Pixel masks of target and shell shapes for PIXEL_COLLISION. A mask is built the first time its
+    (shape, size, sides, rotation) key is needed and shared by every shape with that key; beyond
+    the capacity the least recently used mask is evicted.
+    '''
+
+    def __init__(self, capacity=MASK_CACHE_SIZE):
+        '''
+        Constructor method.
+
+        Parameters:
+        - capacity (int): Maximum number of masks kept. Default is MASK_CACHE_SIZE.
+        '''
+        self.capacity = capacity
+        self.masks = collections.OrderedDict()  # Key -> (mask, center of the shape within the mask)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        '''
+        Returns the mask of a shape, building it on a miss.
+
+        Parameters:
+        - key (tuple): (shape, size, sides, rotation) where shape is 'circle', 'ellipse' or 'polygon'.
+
+        Returns:
+        - tuple: (pg.mask.Mask, (x, y) of the shape's center within the mask).
+        '''
+        entry = self.masks.get(key)
+        if entry is not None:
+            self.masks.move_to_end(key)
+            self.hits += 1
+            return entry
+        self.misses += 1
+        entry = self.masks[key] = self.build(*key)
+        if len(self.masks) > self.capacity:
+            self.masks.popitem(last=False)
+        return entry
+
+    @staticmethod
+    def build(shape, size, sides, rotation):
+        '''
+        Rasterizes a shape the way its draw method does.
+
+        Parameters:
+        - shape (str): 'circle' (size is the radius), 'ellipse' (size is (width, height))
+          or 'polygon' (size is the circumradius).
+        - size (int or tuple): Size of the shape.
+        - sides (int): Number of sides of a polygon, 0 otherwise.
+        - rotation (int): Rotation of a polygon in degrees, 0 otherwise.
+
+        Returns:
+        - tuple: (pg.mask.Mask, (x, y) of the shape's center within the mask).
+        '''
+        if shape == 'ellipse':
+            surface = pg.Surface(size, pg.SRCALPHA)
+            pg.draw.ellipse(surface, WHITE, surface.get_rect())
+            return pg.mask.from_surface(surface), (size[0] / 2, size[1] / 2)
+        surface = pg.Surface((2 * size + 1, 2 * size + 1), pg.SRCALPHA)
+        if shape == 'circle':
+            pg.draw.circle(surface, WHITE, (size, size), size)
+        else:
+            angles = [math.pi * 2 * i / sides + math.radians(rotation) for i in range(sides)]
+            pg.draw.polygon(surface, WHITE, [(size + size * math.cos(angle), size + size * math.sin(angle))
+                                             for angle in angles])
+        return pg.mask.from_surface(surface), (size, size)
+
+    def collide(self, key, coord, box, ball):
+        '''
+        Tests a ball against a shape pixel by pixel. The bounding boxes are compared first,
+        so the masks are only overlapped for real candidates.
+
+        Parameters:
+        - key (tuple): Mask key of the shape.
+        - coord (list): Center of the shape.
+        - box (list): Bounding box of the shape as [left, top, right, bottom].
+        - ball (Ball): The ball, anything with coord and rad.
+
+        Returns:
+        - bool: True if a pixel of the ball overlaps a pixel of the shape, False otherwise.
+        '''
+        x, y = ball.coord[0], ball.coord[1]
+        rad = ball.rad
+        if x + rad < box[0] or x - rad > box[2] or y + rad < box[1] or y - rad > box[3]:
+            return False
+        mask, center = self.get(key)
+        ball_mask, ball_center = self.get(('circle', round(rad), 0, 0))
+        offset = (round(x - ball_center[0]) - round(coord[0] - center[0]),
+                  round(y - ball_center[1]) - round(coord[1] - center[1]))
+        return mask.overlap(ball_mask, offset) is not None
+
+
+collision_masks = MaskCache()  # Shared by all engines, so they agree on every hit
+
+
+fonts = {}  # (name, size) -> pg.font.Font, loaded once for all canvases
+
+
+def load_font(name, size):
+    '''
+    Returns a system font, loading it on first use.
+
+    Parameters:
+    - name (str): Font name for pg.font.SysFont.
+    - size (int): Font size in pixels.
+
+    Returns:
+    - pg.font.Font: The font.
+    '''
+    if (name, size) not in fonts:
+        fonts[(name, size)] = pg.font.SysFont(name, size)
+    return fonts[(name, size)]
+
+
+class Canvas:
+    '''
+    A surface addressed in world coordinates. Draw calls are moved by the view origin and scaled
+    to the surface's internal resolution, so game objects draw the same way wherever the camera
+    is and whatever the resolution. At scale 1 with the origin at (0, 0) the calls are passed to
+    pygame unchanged.
+    '''
+
+    def __init__(self, surface, scale=1.0):
+        '''
+        Constructor method.
+
+        Parameters:
+        - surface (Surface): The surface drawn on.
+        - scale (float): Surface pixels per playfield unit. Default is 1.0.
+        '''
+        self.surface = surface
+        self.scale = scale
+        self.origin = (0, 0)  # World position of the surface's top left corner
+        self.direct = scale == 1  # Coordinates need no conversion
+        self.texts = {}  # (text, color, font) -> rendered text
+        self.images = {}  # id(image) -> (image, version, scaled image)
+
+    def span(self, name):
+        '''
+        Marks the start of a named group of draw calls. A Canvas draws at once and ignores it;
+        DisplayList uses it to find the parts of a frame that didn't change.
+        '''
+
+    def view(self, origin):
+        '''
+        Moves the view: later draw calls are shifted so the world point origin is drawn at the
+        top left corner. Camera.follow() computes it; (0, 0) draws in screen coordinates, e.g. for text.
+        '''
+        self.origin = (origin[0], origin[1])
+        self.direct = self.scale == 1 and self.origin == (0, 0)
+
+    def point(self, coord):
+        '''
+        Returns a world point in surface pixels.
+        '''
+        return ((coord[0] - self.origin[0]) * self.scale, (coord[1] - self.origin[1]) * self.scale)
+
+    def area(self, rect):
+        '''
+        Returns a world rectangle in surface pixels, at least one pixel wide and high.
+        '''
+        x, y, w, h = rect
+        x, y = x - self.origin[0], y - self.origin[1]
+        s = self.scale
+        return pg.Rect(round(x * s), round(y * s), max(1, round(w * s)), max(1, round(h * s)))
+
+    def fill(self, color, rect=None):
+        if self.direct or rect is None:
+            self.surface.fill(color, rect)
+        else:
+            self.surface.fill(color, self.area(rect))
+
+    def circle(self, color, center, radius):
+        if self.direct:
+            pg.draw.circle(self.surface, color, center, radius)
+        else:
+            pg.draw.circle(self.surface, color, self.point(center), max(1, radius * self.scale))
+
+    def ellipse(self, color, rect):
+        pg.draw.ellipse(self.surface, color, rect if self.direct else self.area(rect))
+
+    def rect(self, color, rect):
+        pg.draw.rect(self.surface, color, rect if self.direct else self.area(rect))
+
+    def polygon(self, color, points):
+        if self.direct:
+            pg.draw.polygon(self.surface, color, points)
+        else:
+            pg.draw.polygon(self.surface, color, [self.point(p) for p in points])
+
+    def line(self, color, start, end, width=1):
+        if self.direct:
+            pg.draw.line(self.surface, color, start, end, width)
+        else:
+            pg.draw.line(self.surface, color, self.point(start), self.point(end), max(1, round(width * self.scale)))
+
+    def blit(self, image, dest, version=None):
+        '''
+        Draws an image with its top left corner at dest. At other scales than 1 the image is
+        resampled, once per version if a version is given, else on every call.
+
+        Parameters:
+        - image (Surface): The image.
+        - dest (tuple): Top left corner.
+        - version (int or None): Changes whenever the image's content changes. Default is None.
+        '''
+        if self.direct:
+            self.surface.blit(image, dest)
+            return
+        if self.scale == 1:
+            self.surface.blit(image, self.point(dest))  # Blits are clipped to the surface
+            return
+        cached = self.images.get(id(image))
+        if cached is not None and version is not None and cached[1] == version:
+            scaled = cached[2]
+        else:
+            width, height = image.get_size()
+            size = (max(1, round(width * self.scale)), max(1, round(height * self.scale)))
+            if image.get_colorkey() is None:
+                scaled = pg.transform.smoothscale(image, size)
+            else:
+                # Blending would smear the transparent color into the edges
+                scaled = pg.transform.scale(image, size)
+                scaled.set_colorkey(image.get_colorkey())
+            if version is not None:
+                self.images[id(image)] = (image, version, scaled)  # Keeping image alive keeps its id unique
+        self.surface.blit(scaled, self.point(dest))
+
+    def text(self, text, color, pos, font):
+        '''
+        Draws a line of text. Rendered lines are cached, so text that doesn't change costs one blit.
+
+        Parameters:
+        - text (str): The text.
+        - color (tuple): Its color.
+        - pos (tuple): Top left corner.
+        - font (tuple): (name, size) of a system font. The size is scaled with the canvas.
+        '''
+        key = (text, tuple(color), font)
+        image = self.texts.get(key)
+        if image is None:
+            if len(self.texts) >= 256:
+                self.texts.clear()
+            name, size = font
+            image = self.texts[key] = load_font(name, max(1, round(size * self.scale))).render(text, True, color)
+        self.surface.blit(image, pos if self.direct else self.point(pos))
+
+    def points(self, coord, color):
+        '''
+        Draws 2x2 pixel squares with one array write per corner.
+
+        Parameters:
+        - coord (ndarray): (n, 2) world positions.
+        - color (ndarray): (n, 3) colors.
+        '''
+        width, height = self.surface.get_size()
+        xy = ((coord - self.origin) * self.scale).astype(int)
+        visible = (xy[:, 0] >= 0) & (xy[:, 0] < width - 1) & (xy[:, 1] >= 0) & (xy[:, 1] < height - 1)
+        x, y = xy[visible, 0], xy[visible, 1]
+        color = color[visible]
+        pixels = pg.surfarray.pixels3d(self.surface)
+        for dx, dy in ((0, 0), (1, 0), (0, 1), (1, 1)):
+            pixels[x + dx, y + dy] = color
+        del pixels  # Unlocks the surface
+
+
+def plain(value):
+    '''
+    Converts a draw call argument (numpy values, Rects, lists) to Python numbers and tuples,
+    so recorded commands compare by value and serialize.
+    '''
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    if hasattr(value, 'tolist'):
+        value = value.tolist()  # numpy arrays and scalars
+    if isinstance(value, (list, tuple, pg.Rect)):
+        return tuple(plain(v) for v in value)
+    return value
+
+
+class DisplayList:
+    '''
+    Stand-in for a Canvas that records draw calls instead of drawing them: a command buffer of
+    tuples of plain values such as ('circle', color, center, radius), grouped into named spans.
+    A buffer can be compared with another, executed later by a backend, or serialized with
+    the spans that didn't change since the previous frame sent as references.
+    '''
+
+    def __init__(self):
+        self.commands = []
+        self.starts = []  # (span name, index of its first command)
+        self.images = {}  # Key of a 'blit' command -> the Surface
+
+    def span(self, name):
+        '''
+        Starts a named group of commands, ending the previous one.
+        '''
+        self.starts.append((name, len(self.commands)))
+
+    def span_list(self):
+        '''
+        Returns the spans with their commands. Commands before the first span form a span named ''.
+
+        Returns:
+        - list: (name, tuple of commands) pairs in drawing order.
+        '''
+        starts = list(self.starts)
+        if not starts or starts[0][1] > 0:
+            starts.insert(0, ('', 0))
+        ends = [start for name, start in starts[1:]] + [len(self.commands)]
+        return [(name, tuple(self.commands[start:end])) for (name, start), end in zip(starts, ends)]
+
+    def view(self, origin):
+        self.commands.append(('view', plain(origin)))
+
+    def fill(self, color, rect=None):
+        self.commands.append(('fill', plain(color), plain(rect)))
+
+    def circle(self, color, center, radius):
+        self.commands.append(('circle', plain(color), plain(center), plain(radius)))
+
+    def ellipse(self, color, rect):
+        self.commands.append(('ellipse', plain(color), plain(rect)))
+
+    def rect(self, color, rect):
+        self.commands.append(('rect', plain(color), plain(rect)))
+
+    def polygon(self, color, points):
+        self.commands.append(('polygon', plain(color), plain(points)))
+
+    def line(self, color, start, end, width=1):
+        self.commands.append(('line', plain(color), plain(start), plain(end), width))
+
+    def blit(self, image, dest, version=None):
+        key = (id(image), version)
+        self.images[key] = image  # Referenced, not copied: version tells the contents apart
+        self.commands.append(('blit', key, plain(dest)))
+
+    def text(self, text, color, pos, font):
+        self.commands.append(('text', text, plain(color), plain(pos), plain(font)))
+
+    def points(self, coord, color):
+        self.commands.append(('points', np.asarray(coord, dtype=float).tobytes(),
+                              np.asarray(color, dtype=np.uint8).tobytes()))
+
+    def __eq__(self, other):
+        return isinstance(other, DisplayList) and self.span_list() == other.span_list()
+
+    def diff(self, other):
+        '''
+        Finds the first difference to another buffer, e.g. in a render test.
+
+        Parameters:
+        - other (DisplayList): The buffer to compare with.
+
+        Returns:
+        - tuple or None: (span name, command index in the span, own command, other command), None if equal.
+        '''
+        mine, theirs = self.span_list(), other.span_list()
+        for i in range(max(len(mine), len(theirs))):
+            name, a = mine[i] if i < len(mine) else (None, ())
+            other_name, b = theirs[i] if i < len(theirs) else (None, ())
+            if name != other_name:
+                return (name, 0, None, other_name)
+            for j in range(max(len(a), len(b))):
+                if j >= len(a) or j >= len(b) or a[j] != b[j]:
+                    return (name, j, a[j] if j < len(a) else None, b[j] if j < len(b) else None)
+        return None
+
+    def changed(self, previous):
+        '''
+        Returns the names of the spans that differ from the previous frame's.
+
+        Parameters:
+        - previous (DisplayList or None): The previous frame.
+
+        Returns:
+        - list: Span names in drawing order.
+        '''
+        before = dict(previous.span_list()) if previous is not None else {}
+        return [name for name, commands in self.span_list() if before.get(name) != commands]
+
+    def encode(self, previous=None):
+        '''
+        Serializes the buffer. Spans and images that are unchanged since the previous frame
+        are written as references to it, so a steady frame costs a few bytes.
 
+        Parameters:
+        - previous (DisplayList or None): The previous frame, which decode() will get too. Default is None.
+
+        Returns:
+        - bytes: The compressed buffer.
+        '''
+        before = dict(previous.span_list()) if previous is not None else {}
+        spans = [(name, None if before.get(name) == commands else commands) for name, commands in self.span_list()]
+        known = previous.images if previous is not None else {}
+        images = {}
+        for command in self.commands:
+            if command[0] == 'blit' and command[1] not in known and command[1] not in images:
+                image = self.images[command[1]]
+                images[command[1]] = (image.get_size(), pg.image.tostring(image, 'RGB'), image.get_colorkey())
+        return zlib.compress(pickle.dumps({'spans': spans, 'images': images}))
+
+    @staticmethod
+    def decode(data, previous=None):
+        '''
+        Restores a buffer written by encode().
+
+        Parameters:
+        - data (bytes): The output of encode().
+        - previous (DisplayList or None): The previous frame, as passed to encode(). Default is None.
+
+        Returns:
+        - DisplayList: The buffer.
+        '''
+        record = pickle.loads(zlib.decompress(data))
+        before = dict(previous.span_list()) if previous is not None else {}
+        display_list = DisplayList()
+        for name, commands in record['spans']:
+            display_list.span(name)
+            display_list.commands.extend(before[name] if commands is None else commands)
+        for command in display_list.commands:
+            if command[0] == 'blit':
+                key = command[1]
+                if key in record['images']:
+                    size, pixels, colorkey = record['images'][key]
+                    image = pg.image.fromstring(pixels, size, 'RGB')
+                    if colorkey is not None:
+                        image.set_colorkey(colorkey)
+                    display_list.images[key] = image
+                else:
+                    display_list.images[key] = previous.images[key]
+        return display_list
+
+
+class PygameBackend:
+    '''
+    Executes display lists on a Canvas. The canvas contents after the leading spans that stayed
+    the same over the last frames are kept in a cached surface; while those spans don't change
+    they are restored with one blit instead of being drawn again.
+    '''
+
+    def __init__(self, canvas):
+        '''
+        Constructor method.
+
+        Parameters:
+        - canvas (Canvas): The canvas to draw on.
+        '''
+        self.canvas = canvas
+        self.previous = []  # span_list() of the last frame
+        self.cached_spans = []  # Leading spans drawn on the cached surface
+        self.cached = None
+        self.cached_origin = (0, 0)  # Canvas view origin after the cached spans
+        self.reused = 0  # Spans restored from the cache instead of drawn
+        self.drawn = 0
+
+    def execute(self, display_list):
+        '''
+        Draws a display list.
+
+        Parameters:
+        - display_list (DisplayList): The commands.
+
+        Returns:
+        None
+        '''
+        spans = display_list.span_list()
+        n = len(self.cached_spans)
+        if self.cached is not None and spans[:n] == self.cached_spans:
+            self.canvas.surface.blit(self.cached, (0, 0))
+            self.canvas.view(self.cached_origin)
+            start = n
+        else:
+            self.cached = None
+            self.cached_spans = []
+            start = n = 0
+        # Spans that also led the previous frame are likely to stay; cache the canvas after them
+        stable = 0
+        while stable < min(len(spans), len(self.previous)) and spans[stable] == self.previous[stable]:
+            stable += 1
+        for i in range(start, len(spans)):
+            self.run(spans[i][1], display_list.images)
+            if i + 1 == stable and stable > n:
+                self.cached = self.canvas.surface.copy()
+                self.cached_origin = self.canvas.origin
+                self.cached_spans = spans[:stable]
+        self.reused += start
+        self.drawn += len(spans) - start
+        self.previous = spans
+
+    def run(self, commands, images):
+        '''
+        Executes commands on the canvas.
+
+        Parameters:
+        - commands (tuple): Recorded commands.
+        - images (dict): Images of the 'blit' commands.
+        '''
+        canvas = self.canvas
+        for command in commands:
+            kind = command[0]
+            if kind == 'blit':
+                canvas.blit(images[command[1]], command[2], version=command[1][1])
+            elif kind == 'points':
+                canvas.points(np.frombuffer(command[1]).reshape(-1, 2),
+                              np.frombuffer(command[2], dtype=np.uint8).reshape(-1, 3))
+            else:
+                getattr(canvas, kind)(*command[1:])
+
+
+class NullBackend:
+    '''
+    Executes display lists without drawing anything, counting the commands per kind. For
+    measuring the cost of Manager.draw itself, and for headless runs.
+    '''
+
+    def __init__(self):
+        self.counts = collections.Counter()
+
+    def execute(self, display_list):
+        self.counts.update(command[0] for command in display_list.commands)
+
+
+class Viewport:
+    '''
+    The resizable game window. Frames are drawn at the internal render resolution onto an
+    offscreen canvas, and present() scales them to the largest area of the window with the
+    playfield's aspect ratio, leaving black bars around it.
+    '''
+
+    def __init__(self, scale=RENDER_SCALE, size=WINDOW_SIZE, smooth=True, display_list=DISPLAY_LIST):
+        '''
+        Constructor method. Opens the window.
+
+        Parameters:
+        - scale (float): Internal render resolution relative to SCREEN_SIZE. Default is RENDER_SCALE.
+        - size (tuple): Initial window size. Default is WINDOW_SIZE.
+        - smooth (bool): Scale frames with smoothscale instead of nearest neighbour. Default is True.
+        - display_list (bool): Record frames as display lists executed by a PygameBackend. Default is DISPLAY_LIST.
+        '''
+        pg.display.set_mode(size, pg.RESIZABLE)
+        resolution = (max(1, round(SCREEN_SIZE[0] * scale)), max(1, round(SCREEN_SIZE[1] * scale)))
+        self.canvas = Canvas(pg.Surface(resolution), scale)
+        self.smooth = smooth
+        self.backend = PygameBackend(self.canvas) if display_list else None
+        self.frame = None  # DisplayList of the frame being recorded
+        self.probe = None  # LatencyProbe that stamps the input events
+        self.window_size = None
+        self.area = None  # Part of the window showing the playfield
+        self.fit()
+
+    def fit(self):
+        '''
+        Recomputes the playfield area after the window was resized.
+        '''
+        self.window_size = pg.display.get_surface().get_size()
+        width, height = self.window_size
+        fit = min(width / SCREEN_SIZE[0], height / SCREEN_SIZE[1])
+        size = (max(1, round(SCREEN_SIZE[0] * fit)), max(1, round(SCREEN_SIZE[1] * fit)))
+        self.area = pg.Rect(((width - size[0]) // 2, (height - size[1]) // 2), size)
+
+    def begin(self):
+        '''
+        Starts a frame.
+
+        Returns:
+        - Canvas or DisplayList: What to draw the frame on, already cleared.
+        '''
+        if self.backend is None:
+            self.canvas.fill(BLACK)
+            return self.canvas
+        self.frame = DisplayList()
+        self.frame.fill(BLACK)
+        return self.frame
+
+    def present(self):
+        '''
+        Scales the frame drawn on the canvas into the window and flips the display.
+        '''
+        if self.frame is not None:
+            self.backend.execute(self.frame)
+            self.frame = None
+        window = pg.display.get_surface()
+        if window.get_size() != self.window_size:
+            self.fit()
+        frame = self.canvas.surface
+        if frame.get_size() != self.area.size:
+            frame = (pg.transform.smoothscale if self.smooth else pg.transform.scale)(frame, self.area.size)
+        if self.area.size != self.window_size:
+            window.fill(BLACK)
+        window.blit(frame, self.area)
+        pg.display.flip()
+        if self.probe is not None:
+            self.probe.flipped()
+
+    def events(self):
+        '''
+        Returns the input events since the last call, stamped by the latency probe if there is one.
+        '''
+        return pg.event.get() if self.probe is None else self.probe.take()
+
+    def wait(self, deadline):
+        '''
+        Sleeps until a perf_counter() time; the latency probe keeps stamping events meanwhile.
+        '''
+        if self.probe is not None:
+            self.probe.wait(deadline)
+        else:
+            time.sleep(max(0.0, deadline - time.perf_counter()))
+
+    def to_playfield(self, pos):
+        '''
+        Converts a window position, e.g. of the mouse, to view coordinates. Camera.to_world()
+        takes them on into the world.
+
+        Parameters:
+        - pos (tuple): Position in window pixels.
+
+        Returns:
+        - tuple or None: The playfield position, None if pos is on the bars around the playfield.
+        '''
+        if not self.area.collidepoint(pos):
+            return None
+        return ((pos[0] - self.area.x) * SCREEN_SIZE[0] // self.area.w,
+                (pos[1] - self.area.y) * SCREEN_SIZE[1] // self.area.h)
+
+
+class Camera:
+    '''
+    The part of the world shown in a frame: a SCREEN_SIZE view that centres on a followed point,
+    usually the active tank, without leaving the world. When the world fits the view it stays at (0, 0).
+    '''
+
+    def __init__(self, size=SCREEN_SIZE, world=WORLD_SIZE):
+        '''
+        Constructor method.
+
+        Parameters:
+        - size (tuple): Size of the view in world units. Default is SCREEN_SIZE.
+        - world (tuple): Size of the world. Default is WORLD_SIZE.
+        '''
+        self.size = size
+        self.world = world
+        self.origin = (0, 0)  # World position of the view's top left corner
+
+    def follow(self, point):
+        '''
+        Centres the view on a point, as far as the world's edges allow.
+
+        Parameters:
+        - point (list): World position, e.g. of a tank.
+
+        Returns:
+        - tuple: The new origin.
+        '''
+        self.origin = tuple(min(max(int(point[i]) - self.size[i] // 2, 0), max(0, self.world[i] - self.size[i]))
+                            for i in range(2))
+        return self.origin
+
+    def rect(self, margin=0):
+        '''
+        Returns the view as a box [left, top, right, bottom] in world coordinates, grown by a margin.
+        '''
+        x, y = self.origin
+        return [x - margin, y - margin, x + self.size[0] + margin, y + self.size[1] + margin]
+
+    def visible(self, coord, margin):
+        '''
+        Tests many objects against the view at once.
+
+        Parameters:
+        - coord (ndarray): (n, 2) world positions.
+        - margin (float or ndarray): How far each object reaches from its position.
+
+        Returns:
+        - ndarray: Boolean mask of the objects that can overlap the view.
+        '''
+        left, top, right, bottom = self.rect()
+        return ((coord[:, 0] + margin >= left) & (coord[:, 0] - margin <= right)
+                & (coord[:, 1] + margin >= top) & (coord[:, 1] - margin <= bottom))
+
+    def to_world(self, pos):
+        '''
+        Converts a position in the view, e.g. of the mouse, to world coordinates.
+        '''
+        return None if pos is None else (pos[0] + self.origin[0], pos[1] + self.origin[1])
+
+
+def draw_bombs(screen, bombs, quality=None):
+    '''
+    Draws the bombs of a target. Bombs far away from the tanks are drawn as points at reduced quality.
+
+    Parameters:
+    - screen: The surface to draw on.
+    - bombs (list): Bomb coordinates.
+    - quality (RenderQuality or None): Detail settings. Default is None (full detail).
 
-def rand_color():
-    return (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
+    Returns:
+    None
+    '''
+    far = None if quality is None else quality.bomb_point_dist
+    for circle in bombs:
+        if far is not None and all(math.dist(circle, tank) > far for tank in quality.focus):
+            screen.fill(GRAY, (circle[0] - 1, circle[1] - 1, 3, 3))
+        else:
+            screen.circle(GRAY, circle, 10)
 
 
 class GameObject:
     def move(self):
         pass
 
-    def draw(self, screen):
+    def draw(self, screen, quality=None):
         pass
 
 
@@ -53,6 +882,7 @@ class CircleShell(GameObject):
         self.color = color  # Ball's color
         self.rad = rad  # Ball's radius
         self.is_alive = True  # Flag indicating if the ball is alive
+        self.owner = None  # Tank that fired the ball, it can't hit itself
 
     def check_corners(self, refl_ort=0.8, refl_par=0.9):
         '''
@@ -70,8 +900,8 @@ class CircleShell(GameObject):
                 self.coord[i] = self.rad  # Prevent ball from going out of bounds
                 self.vel[i] = -int(self.vel[i] * refl_ort)  # Reflect velocity with a coefficient of restitution
                 self.vel[1-i] = int(self.vel[1-i] * refl_par)  # Reduce velocity perpendicular to the collision
-            elif self.coord[i] > SCREEN_SIZE[i] - self.rad:
-                self.coord[i] = SCREEN_SIZE[i] - self.rad  # Prevent ball from going out of bounds
+            elif self.coord[i] > WORLD_SIZE[i] - self.rad:
+                self.coord[i] = WORLD_SIZE[i] - self.rad  # Prevent ball from going out of bounds
                 self.vel[i] = -int(self.vel[i] * refl_ort)  # Reflect velocity with a coefficient of restitution
                 self.vel[1-i] = int(self.vel[1-i] * refl_par)  # Reduce velocity perpendicular to the collision
 
@@ -91,7 +921,7 @@ class CircleShell(GameObject):
         for i in range(2):
             self.coord[i] += time * self.vel[i]  # Update the ball's position based on velocity and time
         self.check_corners()  # Check for collisions with screen corners
-        if self.vel[0]**2 + self.vel[1]**2 < 2**2 and self.coord[1] > SCREEN_SIZE[1] - 2*self.rad:
+        if self.vel[0]**2 + self.vel[1]**2 < 2**2 and self.coord[1] > WORLD_SIZE[1] - 2*self.rad:
             self.is_alive = False  # Ball is considered dead if its velocity is low and it's close to the bottom of the screen
 
     def draw(self, screen):
@@ -104,7 +934,7 @@ class CircleShell(GameObject):
         Returns:
         None
         '''
-        pg.draw.circle(screen, self.color, self.coord, self.rad)
+        screen.circle(self.color, self.coord, self.rad)
 
 
 class EllipseShell(GameObject):
@@ -133,6 +963,7 @@ class EllipseShell(GameObject):
         self.color = color
         self.rad = rad
         self.is_alive = True
+        self.owner = None
         if size == None:
             size = [rad*2, rad*4]
         self.size = size
@@ -153,8 +984,8 @@ class EllipseShell(GameObject):
                 self.coord[i] = self.rad
                 self.vel[i] = -int(self.vel[i] * refl_ort)
                 self.vel[1 - i] = int(self.vel[1 - i] * refl_par)
-            elif self.coord[i] > SCREEN_SIZE[i] - self.rad:
-                self.coord[i] = SCREEN_SIZE[i] - self.rad
+            elif self.coord[i] > WORLD_SIZE[i] - self.rad:
+                self.coord[i] = WORLD_SIZE[i] - self.rad
                 self.vel[i] = -int(self.vel[i] * refl_ort)
                 self.vel[1 - i] = int(self.vel[1 - i] * refl_par)
 
@@ -174,7 +1005,7 @@ class EllipseShell(GameObject):
         for i in range(2):
             self.coord[i] += time * self.vel[i]
         self.check_corners()
-        if self.vel[0] ** 2 + self.vel[1] ** 2 < 2 ** 2 and self.coord[1] > SCREEN_SIZE[1] - 2 * self.rad:
+        if self.vel[0] ** 2 + self.vel[1] ** 2 < 2 ** 2 and self.coord[1] > WORLD_SIZE[1] - 2 * self.rad:
             self.is_alive = False
 
     def draw(self, screen):
@@ -189,7 +1020,7 @@ class EllipseShell(GameObject):
         '''
         rect = pg.Rect(self.coord[0]-self.size[0]/2, self.coord[1] -
                        self.size[1]/2, self.size[0], self.size[1])
-        pg.draw.ellipse(screen, self.color, rect)
+        screen.ellipse(self.color, rect)
 
 
 
@@ -198,16 +1029,17 @@ class Tank(GameObject):
     Tank class. Manages its rendering, movement, and striking.
     '''
 
-    def __init__(self, coord=[SCREEN_SIZE[0] // 2, SCREEN_SIZE[1] - 30], angle=0, max_pow=50, min_pow=10, color=RED):
+    def __init__(self, coord=[WORLD_SIZE[0] // 2, WORLD_SIZE[1] - 30], angle=0, max_pow=50, min_pow=10, color=RED, max_hp=100):
         '''
         Constructor method. Sets coordinate, direction, minimum and maximum power, and color of the tank.
         
         Parameters:
-        - coord (list): The initial coordinates of the tank. Default is [SCREEN_SIZE[0] // 2, SCREEN_SIZE[1] - 30].
+        - coord (list): The initial coordinates of the tank. Default is [WORLD_SIZE[0] // 2, WORLD_SIZE[1] - 30].
         - angle (float): The initial angle of the tank in radians. Default is 0.
         - max_pow (int): The maximum power value for the tank's charge. Default is 50.
         - min_pow (int): The minimum power value for the tank's charge. Default is 10.
         - color: The color of the tank. Default is RED.
+        - max_hp (int): The health of an undamaged tank. Default is 100.
 
         Returns:
         None
@@ -219,6 +1051,8 @@ class Tank(GameObject):
         self.color = color  # Color of the tank
         self.active = False  # Flag indicating if the tank is active
         self.pow = min_pow  # Current power of the tank's strike
+        self.max_hp = max_hp  # Health of an undamaged tank
+        self.hp = max_hp  # Current health of the tank
 
     def activate(self):
         '''
@@ -239,12 +1073,12 @@ class Tank(GameObject):
         if self.active and self.pow < self.max_pow:
             self.pow += inc
 
-    def strike(self):
+    def strike(self, split=0):
         '''
         Creates a shell with the tank's direction and current charge power.
 
         Parameters:
-        None
+        - split (int): Generations of submunitions the shell bursts into at the top of its flight. Default is 0 (none).
         
         Returns:
         - circle_shell: CircleShell object representing the created shell.
@@ -253,6 +1087,8 @@ class Tank(GameObject):
         angle = self.angle
         circle_shell = CircleShell(list(self.coord), [
             int(vel * np.cos(angle)), int(vel * np.sin(angle))])
+        circle_shell.owner = self
+        circle_shell.split = split
         self.pow = self.min_pow
         self.active = False
         return circle_shell
@@ -293,9 +1129,21 @@ class Tank(GameObject):
         Returns:
         None
         '''
-        if self.coord[0] < SCREEN_SIZE[0] - 30:
+        if self.coord[0] < WORLD_SIZE[0] - 30:
             self.coord[0] += inc
 
+    def hitbox(self):
+        '''
+        Returns the box covering the tank's body and wheels.
+
+        Parameters:
+        None
+
+        Returns:
+        - list: [left, top, right, bottom].
+        '''
+        return [self.coord[0] - 20, self.coord[1] - 10, self.coord[0] + 20, self.coord[1] + 18]
+
     def handle_events(self):
         '''
         Handles Pygame events to control the tank's movement.
@@ -312,12 +1160,13 @@ class Tank(GameObject):
         elif keys[pg.K_RIGHT]:
             self.move_right(10)
 
-    def draw(self, screen):
+    def draw(self, screen, quality=None):
         '''
         Draws the tank on the screen.
 
         Parameters:
         - screen: Pygame screen object to draw on.
+        - quality (RenderQuality or None): Detail settings. Default is None (full detail).
         
         Returns:
         None
@@ -330,11 +1179,11 @@ class Tank(GameObject):
         barrel_len = 25
         tank_pos = np.array(self.coord)
         # draw wheels
-        for i in range(4):
+        for i in range(4 if quality is None or quality.tank_wheels else 0):
             wheel_pos = np.array([tank_pos[0] - tank_width // 2 + (i + 1)
                                  * tank_width // 5, tank_pos[1] + tank_height // 2])
-            pg.draw.rect(screen, self.color, [
-                         wheel_pos[0] - wheel_width // 2, wheel_pos[1] - wheel_height // 2, wheel_width, wheel_height])
+            screen.rect(self.color, [
+                        wheel_pos[0] - wheel_width // 2, wheel_pos[1] - wheel_height // 2, wheel_width, wheel_height])
         # draw tank body
         tank_shape.append(
             (tank_pos[0] - tank_width // 2, tank_pos[1] + tank_height // 2))
@@ -344,12 +1193,16 @@ class Tank(GameObject):
             (tank_pos[0] + tank_width // 2, tank_pos[1] - tank_height // 2))
         tank_shape.append(
             (tank_pos[0] + tank_width // 2, tank_pos[1] + tank_height // 2))
-        pg.draw.polygon(screen, self.color, tank_shape)
+        screen.polygon(self.color, tank_shape)
         # draw barrel
         barrel_end_pos = (tank_pos + np.array([barrel_len * np.cos(
             self.angle), barrel_len * np.sin(self.angle)])).astype(int)
-        pg.draw.line(screen, self.color,
-                     tank_pos.astype(int), barrel_end_pos, 5)
+        screen.line(self.color,
+                    tank_pos.astype(int), barrel_end_pos, 5)
+        # draw health bar
+        screen.rect(GRAY, [tank_pos[0] - tank_width // 2, tank_pos[1] - 35, tank_width, 4])
+        screen.rect(self.color, [tank_pos[0] - tank_width // 2, tank_pos[1] - 35,
+                                 tank_width * max(0, self.hp) // self.max_hp, 4])
 
 
 class Tank2(GameObject):
@@ -357,16 +1210,17 @@ class Tank2(GameObject):
     Tank class. Manages its rendering, movement, and striking.
     '''
 
-    def __init__(self, coord=[SCREEN_SIZE[0] // 2, SCREEN_SIZE[1] - 30], angle=0, max_pow=50, min_pow=10, color=RED):
+    def __init__(self, coord=[WORLD_SIZE[0] // 2, WORLD_SIZE[1] - 30], angle=0, max_pow=50, min_pow=10, color=RED, max_hp=100):
         '''
         Constructor method. Sets coordinate, direction, minimum and maximum power and color of the tank.
 
         Parameters:
-        - coord (list): The initial coordinates of the tank. Default is [SCREEN_SIZE[0] // 2, SCREEN_SIZE[1] - 30].
+        - coord (list): The initial coordinates of the tank. Default is [WORLD_SIZE[0] // 2, WORLD_SIZE[1] - 30].
         - angle (float): The initial angle of the tank in radians. Default is 0.
         - max_pow (int): The maximum power value for the tank's charge. Default is 50.
         - min_pow (int): The minimum power value for the tank's charge. Default is 10.
         - color: The color of the tank. Default is RED.
+        - max_hp (int): The health of an undamaged tank. Default is 100.
 
         Returns:
         None
@@ -378,6 +1232,8 @@ class Tank2(GameObject):
         self.color = color
         self.active = False
         self.pow = min_pow
+        self.max_hp = max_hp
+        self.hp = max_hp
 
     def activate(self):
         '''
@@ -398,12 +1254,12 @@ class Tank2(GameObject):
         if self.active and self.pow < self.max_pow:
             self.pow += inc
 
-    def strike(self):
+    def strike(self, split=0):
         '''
         Creates a shell, according to tank's direction and current charge power.
 
         Parameters:
-        None
+        - split (int): Generations of submunitions the shell bursts into at the top of its flight. Default is 0 (none).
 
         Returns:
         - ellipse_shell (EllipseShell): The shell object created based on the tank's properties.
@@ -412,6 +1268,8 @@ class Tank2(GameObject):
         angle = self.angle
         ellipse_shell = EllipseShell(list(self.coord), [
             int(vel * np.cos(angle)), int(vel * np.sin(angle))])
+        ellipse_shell.owner = self
+        ellipse_shell.split = split
         self.pow = self.min_pow
         self.active = False
         return ellipse_shell
@@ -452,9 +1310,21 @@ class Tank2(GameObject):
         Returns:
         None
         '''
-        if self.coord[0] < SCREEN_SIZE[0] - 30:
+        if self.coord[0] < WORLD_SIZE[0] - 30:
             self.coord[0] += inc
 
+    def hitbox(self):
+        '''
+        Returns the box covering the tank's body and wheels.
+
+        Parameters:
+        None
+
+        Returns:
+        - list: [left, top, right, bottom].
+        '''
+        return [self.coord[0] - 20, self.coord[1] - 10, self.coord[0] + 20, self.coord[1] + 18]
+
     def handle_events(self):
         '''
         Handles Pygame events to control tank's movement.
@@ -471,12 +1341,13 @@ class Tank2(GameObject):
         elif keys[pg.K_RIGHT]:
             self.move_right(10)
 
-    def draw(self, screen):
+    def draw(self, screen, quality=None):
         '''
         Draws the tank on the screen.
 
         Parameters:
         - screen: Pygame screen object to draw on.
+        - quality (RenderQuality or None): Detail settings. Default is None (full detail).
         
         Returns:
         None
@@ -489,11 +1360,11 @@ class Tank2(GameObject):
         barrel_len = 25
         tank_pos = np.array(self.coord)
         # draw wheels
-        for i in range(4):
+        for i in range(4 if quality is None or quality.tank_wheels else 0):
             wheel_pos = np.array([tank_pos[0] - tank_width // 2 + (i + 1)
                                  * tank_width // 5, tank_pos[1] + tank_height // 2])
-            pg.draw.rect(screen, self.color, [
-                         wheel_pos[0] - wheel_width // 2, wheel_pos[1] - wheel_height // 2, wheel_width, wheel_height])
+            screen.rect(self.color, [
+                        wheel_pos[0] - wheel_width // 2, wheel_pos[1] - wheel_height // 2, wheel_width, wheel_height])
         # draw tank body
         tank_shape.append(
             (tank_pos[0] - tank_width // 2, tank_pos[1] + tank_height // 2))
@@ -503,20 +1374,25 @@ class Tank2(GameObject):
             (tank_pos[0] + tank_width // 2, tank_pos[1] - tank_height // 2))
         tank_shape.append(
             (tank_pos[0] + tank_width // 2, tank_pos[1] + tank_height // 2))
-        pg.draw.polygon(screen, self.color, tank_shape)
+        screen.polygon(self.color, tank_shape)
         # draw barrel
         barrel_end_pos = (tank_pos + np.array([barrel_len * np.cos(
             self.angle), barrel_len * np.sin(self.angle)])).astype(int)
-        pg.draw.line(screen, self.color,
-                     tank_pos.astype(int), barrel_end_pos, 5)
+        screen.line(self.color,
+                    tank_pos.astype(int), barrel_end_pos, 5)
+        # draw health bar
+        screen.rect(GRAY, [tank_pos[0] - tank_width // 2, tank_pos[1] - 35, tank_width, 4])
+        screen.rect(self.color, [tank_pos[0] - tank_width // 2, tank_pos[1] - 35,
+                                 tank_width * max(0, self.hp) // self.max_hp, 4])
 
 
 class CircleTarget(GameObject):
     '''
     Target class. Creates target, manages its rendering and collision with a ball event.
     '''
+    MOVING = False  # Whether move() moves the target itself; static targets sleep once their bombs are in the BombPool
 
-    def __init__(self, coord=None, color=None, rad=30):
+    def __init__(self, coord=None, color=None, rad=30, rng=random):
         '''
         Constructor method. Sets the coordinate, color, and radius of the target.
 
@@ -524,18 +1400,19 @@ class CircleTarget(GameObject):
         - coord (list): The coordinate of the target. If None, it will be randomly generated within the screen boundaries.
         - color (tuple): The color of the target. If None, a random color will be assigned.
         - rad (int): The radius of the target.
+        - rng: Source of the random choices, the random module or a random.Random. Default is random.
 
         Returns:
         None
         '''
         if coord is None:
-            coord = [random.randint(rad, SCREEN_SIZE[0] - rad),
-                     random.randint(rad, SCREEN_SIZE[1] - rad)]
+            coord = [rng.randint(rad, WORLD_SIZE[0] - rad),
+                     rng.randint(rad, WORLD_SIZE[1] - rad)]
         self.coord = coord
         self.rad = rad
 
         if color is None:
-            color = rand_color()
+            color = rand_color(rng)
         self.color = color
 
         self.bombs = []
@@ -555,35 +1432,71 @@ class CircleTarget(GameObject):
         min_dist = self.rad + ball.rad
         return dist <= min_dist
 
-    def drop_bomb(self, bombAmount):
+    def aabb(self):
         '''
-        
-        Drops bombs from the target.
+        Returns the bounding box of the target.
 
-        Parameters:
-        - bombAmount (int): The number of bombs to drop.
-        
+        Returns:
+        - list: [left, top, right, bottom].
         '''
-        for i in range(bombAmount):
-            bomb = [self.coord[0], self.coord[1] + self.rad]
-            self.bombs.append(bomb)
+        return [self.coord[0] - self.rad, self.coord[1] - self.rad, self.coord[0] + self.rad, self.coord[1] + self.rad]
 
-            speed = (1, 2, 3)
+    def distance(self, point):
+        '''
+        Returns the distance from a point to the target, 0 if the point is inside.
+        A ball collides with the target when this is at most its radius.
+
+        Parameters:
+        - point (list): The point as [x, y].
+
+        Returns:
+        - float: The distance.
+        '''
+        return max(0.0, math.dist(self.coord, point) - self.rad)
+
+    def ray_distance(self, origin, direction):
+        '''
+        Returns how far along a ray the target is hit.
+
+        Parameters:
+        - origin (list): Start of the ray.
+        - direction (list): Unit direction of the ray.
+
+        Returns:
+        - float or None: Distance to the hit, or None if the ray misses.
+        '''
+        return ray_circle(origin, direction, self.coord, self.rad)
+
+    def drop_bomb(self, bombAmount, first=0):
+        '''
+        
+        Drops bombs from the target.
+
+        Parameters:
+        - bombAmount (int): The number of bombs to drop.
+        - first (int): Index of the first bomb, which sets its speed. Default is 0.
+        
+        '''
+        for i in range(first, first + bombAmount):
+            bomb = [self.coord[0], self.coord[1] + self.rad]
+            self.bombs.append(bomb)
+
+            speed = (1, 2, 3)
             self.speeds.append(speed[i])
 
-    def draw(self, screen):
+    def draw(self, screen, quality=None):
         '''
         Draws the target on the screen.
 
         Parameters:
         - screen (Surface): The screen surface to draw on.
+        - quality (RenderQuality or None): Detail settings. Default is None (full detail).
 
         Returns:
         None
         '''
-        pg.draw.circle(screen, self.color, self.coord, self.rad)
-        for circle in self.bombs:
-            pg.draw.circle(screen, GRAY, circle, 10)
+        screen.circle(self.color, self.coord, self.rad)
+        draw_bombs(screen, self.bombs, quality)
 
     def move(self):
         '''
@@ -599,7 +1512,9 @@ class CircleTarget(GameObject):
 
 
 class MovingCircleTarget(CircleTarget):
-    def __init__(self, coord=None, color=None, rad=30):
+    MOVING = True
+
+    def __init__(self, coord=None, color=None, rad=30, rng=random):
         '''
         Constructor method. Sets the coordinate, color, and radius of the moving circle target.
 
@@ -607,13 +1522,14 @@ class MovingCircleTarget(CircleTarget):
         - coord (list): The coordinate of the target. If None, it will be randomly generated within the screen boundaries.
         - color (tuple): The color of the target. If None, a random color will be assigned.
         - rad (int): The radius of the target.
+        - rng: Source of the random choices, the random module or a random.Random. Default is random.
 
         Returns:
         None
         '''
-        super().__init__(coord, color, rad)
-        self.vx = random.randint(-2, +2)
-        self.vy = random.randint(-2, +2)
+        super().__init__(coord, color, rad, rng=rng)
+        self.vx = rng.randint(-2, +2)
+        self.vy = rng.randint(-2, +2)
 
     def move(self):
         '''
@@ -633,8 +1549,9 @@ class EllipseTarget(GameObject):
     '''
     Target class. Creates target, manages its rendering and collision with a ball event.
     '''
+    MOVING = False
 
-    def __init__(self, coord=None, color=None, rad=30, size=None):
+    def __init__(self, coord=None, color=None, rad=30, size=None, rng=random):
         '''
         Constructor method. Initializes the target with specified parameters.
         
@@ -643,10 +1560,11 @@ class EllipseTarget(GameObject):
         - color (tuple): The color of the target. If not provided, a random color is chosen.
         - rad (int): The radius of the target. Default is 30.
         - size (list): The size of the target as [width, height]. If not provided, it is calculated based on the radius.
+        - rng: Source of the random choices, the random module or a random.Random. Default is random.
         '''
         if coord == None:
-            coord = [random.randint(rad, SCREEN_SIZE[0] - rad),
-                     random.randint(rad, SCREEN_SIZE[1] - rad)]
+            coord = [rng.randint(rad, WORLD_SIZE[0] - rad),
+                     rng.randint(rad, WORLD_SIZE[1] - rad)]
         self.coord = coord
         self.rad = rad
 
@@ -655,7 +1573,7 @@ class EllipseTarget(GameObject):
         self.size = size
 
         if color == None:
-            color = rand_color()
+            color = rand_color(rng)
         self.color = color
 
         self.bombs = []
@@ -663,7 +1581,8 @@ class EllipseTarget(GameObject):
 
     def check_collision(self, ball):
         '''
-        Checks whether the ball collides with the target.
+        Checks whether the ball collides with the target: with its bounding circle,
+        or with the ellipse itself if PIXEL_COLLISION is set.
 
         Parameters:
         - ball (Ball): The ball object to check collision with.
@@ -671,39 +1590,93 @@ class EllipseTarget(GameObject):
         Returns:
         - bool: True if the ball collides with the target, False otherwise.
         '''
+        if PIXEL_COLLISION:
+            half = (self.size[0] / 2, self.size[1] / 2)
+            box = [self.coord[0] - half[0], self.coord[1] - half[1], self.coord[0] + half[0], self.coord[1] + half[1]]
+            return collision_masks.collide(('ellipse', tuple(self.size), 0, 0), self.coord, box, ball)
         dist = sum([(self.coord[i] - ball.coord[i])**2 for i in range(2)])**0.5
         min_dist = max(self.size)/2 + ball.rad
         return dist <= min_dist
 
-    def drop_bomb(self, bombAmount):
+    def aabb(self):
+        '''
+        Returns the bounding box of the target's bounding circle, which check_collision uses
+        (or which contains the ellipse, with PIXEL_COLLISION).
+
+        Returns:
+        - list: [left, top, right, bottom].
+        '''
+        rad = max(self.size) / 2
+        return [self.coord[0] - rad, self.coord[1] - rad, self.coord[0] + rad, self.coord[1] + rad]
+
+    def distance(self, point):
+        '''
+        Returns the distance from a point to the target's bounding circle, 0 if the point is inside.
+        A ball collides with the target when this is at most its radius.
+
+        Parameters:
+        - point (list): The point as [x, y].
+
+        Returns:
+        - float: The distance.
+        '''
+        return max(0.0, math.dist(self.coord, point) - max(self.size) / 2)
+
+    def ray_distance(self, origin, direction):
+        '''
+        Returns how far along a ray the ellipse is hit.
+
+        Parameters:
+        - origin (list): Start of the ray.
+        - direction (list): Unit direction of the ray.
+
+        Returns:
+        - float or None: Distance to the hit, or None if the ray misses.
+        '''
+        # Scale space so the ellipse becomes the unit circle; distances along the ray are unchanged
+        a, b = self.size[0] / 2, self.size[1] / 2
+        ox, oy = (origin[0] - self.coord[0]) / a, (origin[1] - self.coord[1]) / b
+        dx, dy = direction[0] / a, direction[1] / b
+        qa = dx * dx + dy * dy
+        qb = ox * dx + oy * dy
+        qc = ox * ox + oy * oy - 1
+        if qc <= 0:
+            return 0.0
+        disc = qb * qb - qa * qc
+        if qb > 0 or disc < 0:
+            return None
+        return (-qb - math.sqrt(disc)) / qa
+
+    def drop_bomb(self, bombAmount, first=0):
         '''
         Drops bombs from the target.
 
         Parameters:
         - bombAmount (int): The number of bombs to drop.
+        - first (int): Index of the first bomb, which sets its speed. Default is 0.
         '''
-        for i in range(bombAmount):
+        for i in range(first, first + bombAmount):
             bomb = [self.coord[0], self.coord[1] + self.rad]
             self.bombs.append(bomb)
 
             speed = (1, 2, 3)
             self.speeds.append(speed[i])
 
-    def draw(self, screen):
+    def draw(self, screen, quality=None):
         '''
         Draws the target on the screen.
 
         Parameters:
         - screen: The screen to draw the target on.
+        - quality (RenderQuality or None): Detail settings. Default is None (full detail).
 
         Returns:
         - None
         '''
         rect = pg.Rect(self.coord[0]-self.size[0]/2, self.coord[1] -
                        self.size[1]/2, self.size[0], self.size[1])
-        pg.draw.ellipse(screen, self.color, rect)
-        for circle in self.bombs:
-            pg.draw.circle(screen, GRAY, circle, 10)
+        screen.ellipse(self.color, rect)
+        draw_bombs(screen, self.bombs, quality)
 
     def move(self):
         """
@@ -721,8 +1694,9 @@ class MovingEllipseTarget(EllipseTarget):
     '''
     Moving target class. Creates a moving target that oscillates vertically and horizontally.
     '''
+    MOVING = True
 
-    def __init__(self, coord=None, color=None, rad=30, size=None, speed=5):
+    def __init__(self, coord=None, color=None, rad=30, size=None, speed=5, rng=random):
         """
         Initializes a MovingEllipseTarget object.
 
@@ -732,8 +1706,9 @@ class MovingEllipseTarget(EllipseTarget):
         - rad (int): The radius of the target's ellipse. Defaults to 30.
         - size (tuple or None): The size of the target's bounding box. If None, defaults to the parent class's default size.
         - speed (int): The speed at which the target moves. Defaults to 5.
+        - rng: Source of the random choices, the random module or a random.Random. Default is random.
         """
-        super().__init__(coord, color, rad, size)
+        super().__init__(coord, color, rad, size, rng=rng)
         self.speed = speed
         self.start_coord = self.coord.copy()
         self.direction = 1
@@ -775,8 +1750,9 @@ class RectangleTarget(GameObject):
     '''
     RectangleTarget class. Creates rectangle target, manages its rendering and collision with a ball event.
     '''
+    MOVING = False
 
-    def __init__(self, coord=None, color=None, width=60, height=30):
+    def __init__(self, coord=None, color=None, width=60, height=30, rng=random):
         '''
         Constructor method. Sets coordinate, color, and dimensions of the target.
         
@@ -785,16 +1761,17 @@ class RectangleTarget(GameObject):
         - color (tuple or None): The color of the target as an RGB tuple (r, g, b). If None, a random color is generated.
         - width (int): The width of the target rectangle. Default is 60.
         - height (int): The height of the target rectangle. Default is 30.
+        - rng: Source of the random choices, the random module or a random.Random. Default is random.
         '''
         if coord == None:
-            coord = [random.randint(width, SCREEN_SIZE[0] - width),
-                     random.randint(height, SCREEN_SIZE[1] - height)]
+            coord = [rng.randint(width, WORLD_SIZE[0] - width),
+                     rng.randint(height, WORLD_SIZE[1] - height)]
         self.coord = coord
         self.width = width
         self.height = height
 
         if color == None:
-            color = rand_color()  # Assuming there's a function rand_color() that generates a random color.
+            color = rand_color(rng)  # Assuming there's a function rand_color() that generates a random color.
         self.color = color
 
         self.bombs = []
@@ -827,35 +1804,74 @@ class RectangleTarget(GameObject):
 
         return (corner_dist_sq <= ball.rad**2)
 
-    def drop_bomb(self, bombAmount):
+    def aabb(self):
+        '''
+        Returns the bounding box of the target.
+
+        Returns:
+        - list: [left, top, right, bottom].
+        '''
+        return [self.coord[0] - self.width / 2, self.coord[1] - self.height / 2,
+                self.coord[0] + self.width / 2, self.coord[1] + self.height / 2]
+
+    def distance(self, point):
+        '''
+        Returns the distance from a point to the rectangle, 0 if the point is inside.
+        A ball collides with the target when this is at most its radius.
+
+        Parameters:
+        - point (list): The point as [x, y].
+
+        Returns:
+        - float: The distance.
+        '''
+        dx = max(0.0, abs(point[0] - self.coord[0]) - self.width / 2)
+        dy = max(0.0, abs(point[1] - self.coord[1]) - self.height / 2)
+        return math.hypot(dx, dy)
+
+    def ray_distance(self, origin, direction):
+        '''
+        Returns how far along a ray the rectangle is hit (slab test).
+
+        Parameters:
+        - origin (list): Start of the ray.
+        - direction (list): Unit direction of the ray.
+
+        Returns:
+        - float or None: Distance to the hit, or None if the ray misses.
+        '''
+        return ray_box(origin, direction, self.aabb())
+
+    def drop_bomb(self, bombAmount, first=0):
         '''
         Drops bombs from the target.
 
         Parameters:
         - bombAmount (int): The number of bombs to drop.
+        - first (int): Index of the first bomb, which sets its speed. Default is 0.
         '''
-        for i in range(bombAmount):
+        for i in range(first, first + bombAmount):
             bomb = [self.coord[0], self.coord[1] + self.height/2]
             self.bombs.append(bomb)
 
             speed = (1, 2, 3)
             self.speeds.append(speed[i])
 
-    def draw(self, screen):
+    def draw(self, screen, quality=None):
         '''
         Draws the target on the screen.
         
         Parameters:
         - screen: The screen object or surface to draw the target on.
+        - quality (RenderQuality or None): Detail settings. Default is None (full detail).
         
         Returns:
         - None
         '''
         rect = pg.Rect(self.coord[0] - self.width/2,
                        self.coord[1] - self.height/2, self.width, self.height)
-        pg.draw.rect(screen, self.color, rect)
-        for circle in self.bombs:
-            pg.draw.circle(screen, GRAY, circle, 10)
+        screen.rect(self.color, rect)
+        draw_bombs(screen, self.bombs, quality)
 
     def move(self):
         """
@@ -874,21 +1890,23 @@ class MovingRectangleTarget(RectangleTarget):
     '''
     MovingRectangleTarget class. Creates moving rectangle target, manages its rendering and collision with a ball event.
     '''
+    MOVING = True
 
-    def __init__(self, speed=2, **kwargs):
+    def __init__(self, speed=2, rng=random, **kwargs):
         '''
         Constructor method. Sets the speed and calls the parent constructor.
         
         Parameters:
         - speed (int): The speed at which the target moves. Default is 2.
+        - rng: Source of the random choices, the random module or a random.Random. Default is random.
         - **kwargs: Additional keyword arguments passed to the parent constructor (RectangleTarget).
 
         Returns:
         None
         '''
-        super().__init__(**kwargs)
+        super().__init__(rng=rng, **kwargs)
         self.speed = speed
-        self.direction = random.choice(['left', 'right', 'up', 'down'])
+        self.direction = rng.choice(['left', 'right', 'up', 'down'])
 
     def move(self):
         '''
@@ -904,8 +1922,8 @@ class MovingRectangleTarget(RectangleTarget):
                 self.direction = 'right'
         elif self.direction == 'right':
             self.coord[0] += self.speed
-            if self.coord[0] > SCREEN_SIZE[0] - self.width/2:
-                self.coord[0] = SCREEN_SIZE[0] - self.width/2
+            if self.coord[0] > WORLD_SIZE[0] - self.width/2:
+                self.coord[0] = WORLD_SIZE[0] - self.width/2
                 self.direction = 'left'
         elif self.direction == 'up':
             self.coord[1] -= self.speed
@@ -914,8 +1932,8 @@ class MovingRectangleTarget(RectangleTarget):
                 self.direction = 'down'
         elif self.direction == 'down':
             self.coord[1] += self.speed
-            if self.coord[1] > SCREEN_SIZE[1] - self.height/2:
-                self.coord[1] = SCREEN_SIZE[1] - self.height/2
+            if self.coord[1] > WORLD_SIZE[1] - self.height/2:
+                self.coord[1] = WORLD_SIZE[1] - self.height/2
                 self.direction = 'up'
         for i, circle in enumerate(self.bombs):
             speed = self.speeds[i]
@@ -926,8 +1944,9 @@ class PolygonTarget(GameObject):
     '''
     PolygonTarget class. Creates polygon target, manages its rendering and collision with a ball event.
     '''
+    MOVING = False
 
-    def __init__(self, coord=None, color=None, sides=5, size=30):
+    def __init__(self, coord=None, color=None, sides=5, size=30, rng=random):
         '''
         Constructor method. Sets coordinate, color, and dimensions of the target.
         
@@ -936,16 +1955,17 @@ class PolygonTarget(GameObject):
         - color (tuple or None): The color of the target as an RGB tuple (r, g, b). If None, a random color is generated.
         - sides (int): The number of sides of the polygon target. Default is 5.
         - size (int): The size of the polygon target. Default is 30.
+        - rng: Source of the random choices, the random module or a random.Random. Default is random.
         '''
         if coord == None:
-            coord = [random.randint(size, SCREEN_SIZE[0] - size),
-                     random.randint(size, SCREEN_SIZE[1] - size)]
+            coord = [rng.randint(size, WORLD_SIZE[0] - size),
+                     rng.randint(size, WORLD_SIZE[1] - size)]
         self.coord = coord
         self.sides = sides
         self.size = size
 
         if color == None:
-            color = rand_color()  # Assuming there's a function rand_color() that generates a random color.
+            color = rand_color(rng)  # Assuming there's a function rand_color() that generates a random color.
         self.color = color
 
         self.bombs = []
@@ -953,7 +1973,8 @@ class PolygonTarget(GameObject):
 
     def check_collision(self, ball):
         '''
-        Checks whether the ball bumps into the target.
+        Checks whether the ball bumps into the target: into its circumcircle,
+        or into the polygon itself if PIXEL_COLLISION is set.
         
         Parameters:
         - ball (Ball): An instance of the Ball class representing the ball object.
@@ -961,45 +1982,86 @@ class PolygonTarget(GameObject):
         Returns:
         - collision (bool): True if the ball collides with the target, False otherwise.
         '''
+        if PIXEL_COLLISION:
+            return collision_masks.collide(('polygon', self.size, self.sides, 0), self.coord, self.aabb(), ball)
         dist = sum([(self.coord[i] - ball.coord[i])**2 for i in range(2)])**0.5
         min_dist = self.size + ball.rad
         return dist <= min_dist
 
-    def drop_bomb(self, bombAmount):
+    def aabb(self):
+        '''
+        Returns the bounding box of the target.
+
+        Returns:
+        - list: [left, top, right, bottom].
+        '''
+        return [self.coord[0] - self.size, self.coord[1] - self.size, self.coord[0] + self.size, self.coord[1] + self.size]
+
+    def distance(self, point):
+        '''
+        Returns the distance from a point to the polygon's circumcircle, 0 if the point is inside.
+        A ball collides with the target when this is at most its radius.
+
+        Parameters:
+        - point (list): The point as [x, y].
+
+        Returns:
+        - float: The distance.
+        '''
+        return max(0.0, math.dist(self.coord, point) - self.size)
+
+    def ray_distance(self, origin, direction):
+        '''
+        Returns how far along a ray the polygon's circumcircle is hit.
+
+        Parameters:
+        - origin (list): Start of the ray.
+        - direction (list): Unit direction of the ray.
+
+        Returns:
+        - float or None: Distance to the hit, or None if the ray misses.
+        '''
+        return ray_circle(origin, direction, self.coord, self.size)
+
+    def drop_bomb(self, bombAmount, first=0):
         '''
         Drops bombs from the target.
 
         Parameters:
         - bombAmount (int): The number of bombs to drop.
+        - first (int): Index of the first bomb, which sets its speed. Default is 0.
         '''
-        for i in range(bombAmount):
+        for i in range(first, first + bombAmount):
             bomb = [self.coord[0], self.coord[1] + self.size]
             self.bombs.append(bomb)
 
             speed = (1, 2, 3)
             self.speeds.append(speed[i])
 
-    def draw(self, screen):
+    def draw(self, screen, quality=None):
         '''
         Draws the target on the screen.
         Also draws bombs.
         
         Parameters:
         - screen: The screen object or surface to draw the target on.
+        - quality (RenderQuality or None): Detail settings. Default is None (full detail).
         
         Returns:
         - None
         '''
         points = []
-        for i in range(self.sides):
-            angle = math.pi * 2 * i / self.sides
+        sides = self.sides
+        if quality is not None and quality.polygon_sides is not None:
+            sides = min(sides, quality.polygon_sides)
+        for i in range(sides):
+            angle = math.pi * 2 * i / sides
             x = self.coord[0] + self.size * math.cos(angle)
             y = self.coord[1] + self.size * math.sin(angle)
             points.append((x, y))
 
-        pg.draw.polygon(screen, self.color, points)
-        for circle in self.bombs:
-            pg.draw.circle(screen, GRAY, circle, 10)
+        screen.polygon(self.color, points)
+        draw_bombs(screen, self.bombs, quality)
 
     def move(self):
         '''
@@ -1018,8 +2080,9 @@ class MovingPolygonTarget(PolygonTarget):
     '''
     MovingPolygonTarget class. Creates a polygon target that moves, manages its rendering and collision with a ball event.
     '''
+    MOVING = True
 
-    def __init__(self, coord=None, color=None, sides=5, size=30, vel=1):
+    def __init__(self, coord=None, color=None, sides=5, size=30, vel=1, rng=random):
         '''
         Constructor method. Sets coordinate, color, dimensions, and velocity of the target.
         
@@ -1029,10 +2092,11 @@ class MovingPolygonTarget(PolygonTarget):
         - sides (int): The number of sides of the polygon target. Default is 5.
         - size (int): The size of the polygon target. Default is 30.
         - vel (int or float): The velocity of the target in pixels per frame. Default is 1.
+        - rng: Source of the random choices, the random module or a random.Random. Default is random.
         '''
-        super().__init__(coord=coord, color=color, sides=sides, size=size)
+        super().__init__(coord=coord, color=color, sides=sides, size=size, rng=rng)
         self.vel = vel  # velocity in pixels per frame
-        self.direction = random.uniform(0, 2 * math.pi)  # initial movement direction
+        self.direction = rng.uniform(0, 2 * math.pi)  # initial movement direction
 
     def move(self):
         '''
@@ -1048,9 +2112,9 @@ class MovingPolygonTarget(PolygonTarget):
         self.coord[1] += dy
 
         # Check if target hits screen edges, reverse direction if necessary
-        if self.coord[0] < self.size or self.coord[0] > SCREEN_SIZE[0] - self.size:
+        if self.coord[0] < self.size or self.coord[0] > WORLD_SIZE[0] - self.size:
             self.direction = math.pi - self.direction
-        elif self.coord[1] < self.size or self.coord[1] > SCREEN_SIZE[1] - self.size:
+        elif self.coord[1] < self.size or self.coord[1] > WORLD_SIZE[1] - self.size:
             self.direction = -self.direction
         for i, circle in enumerate(self.bombs):
             speed = self.speeds[i]
@@ -1072,7 +2136,10 @@ class ScoreTable:
         '''
         self.t_destr = t_destr
         self.b_used = b_used
-        self.font = pg.font.SysFont("dejavusansmono", 25)
+        self.tank_hits = [0, 0]  # Hits landed by each tank's shells on the other tank
+        self.tank_destr = [0, 0]  # Times each tank was destroyed
+        self.bomb_hits = 0  # Bombs that fell onto a tank
+        self.font = ("dejavusansmono", 25)  # System font name and size
 
     def score(self):
         '''
@@ -1093,261 +2160,4068 @@ class ScoreTable:
         Returns:
         - None
         '''
-        score_surf = []
-        score_surf.append(self.font.render("Destroyed: {}".format(self.t_destr), True, WHITE))
-        score_surf.append(self.font.render("Balls used: {}".format(self.b_used), True, WHITE))
-        score_surf.append(self.font.render("Total: {}".format(self.score()), True, RED))
-        for i in range(3):
-            screen.blit(score_surf[i], [10, 10 + 30*i])
+        score_lines = []
+        score_lines.append(("Destroyed: {}".format(self.t_destr), WHITE))
+        score_lines.append(("Balls used: {}".format(self.b_used), WHITE))
+        score_lines.append(("Total: {}".format(self.score()), RED))
+        score_lines.append(("Tank hits: {} / {}".format(*self.tank_hits), WHITE))
+        score_lines.append(("Tanks destroyed: {} / {}".format(*self.tank_destr), WHITE))
+        score_lines.append(("Bomb hits: {}".format(self.bomb_hits), WHITE))
+        for i in range(len(score_lines)):
+            screen.text(score_lines[i][0], score_lines[i][1], [10, 10 + 30*i], self.font)
+
+
+class Terrain:
+    '''
+    Destructible terrain. The ground is a bitmask of solid pixels split into square tiles;
+    craters only rebuild the tiles, image pixels and heightmap columns they touch.
+    '''
+    TILE = 32  # Tile size in pixels
 
+    def __init__(self, size=WORLD_SIZE, color=(110, 85, 50)):
+        '''
+        Constructor method. Generates rolling hills along the bottom of the playfield.
 
-class Manager:
-    '''
-    Class that manages events' handling, ball's motion and collision, target creation, etc.
+        Parameters:
+        - size (tuple): Size of the playfield in pixels. Default is WORLD_SIZE.
+        - color (tuple): The color of the ground. Default is brown.
+        '''
+        self.size = size
+        self.color = color
+        x = np.arange(size[0])
+        ground = (size[1] - 55 + 20 * np.sin(x / 90 + random.uniform(0, 2 * math.pi))
+                  + 8 * np.sin(x / 37 + random.uniform(0, 2 * math.pi)))
+        self.solid = np.arange(size[1])[np.newaxis, :] >= ground[:, np.newaxis]  # Indexed [x, y] like surfarray
+        self.height = np.zeros(size[0], dtype=int)  # Topmost solid y of every column (size[1] if none)
+        self.tiles = np.zeros((math.ceil(size[0] / self.TILE), math.ceil(size[1] / self.TILE)), dtype=bool)  # Tiles containing ground
+        self.image = pg.Surface(size)
+        self.image.set_colorkey(BLACK)
+        self.version = 0  # Incremented whenever the image changes
+        self.dirty = {(i, j) for i in range(self.tiles.shape[0]) for j in range(self.tiles.shape[1])}
+        self.saved = None  # Read-only copy of solid handed out by snapshot(), dropped by the next carve
+        self.update_height(0, size[0])
+        self.update_tiles(self.dirty)
+        self.rebuild()
+
+    def update_height(self, x0, x1):
+        '''
+        Recomputes the heightmap for columns x0 to x1 (exclusive).
+        '''
+        columns = self.solid[x0:x1]
+        self.height[x0:x1] = np.where(columns.any(axis=1), columns.argmax(axis=1), self.size[1])
 
-    Constructor method. Initializes the Manager with the specified number of targets and other objects.
+    def update_tiles(self, tiles):
+        '''
+        Recomputes the occupancy flags of some tiles. Collisions rely on them, so they are kept
+        current by the simulation instead of waiting for the next draw.
 
         Parameters:
-        - n_targets (int): The number of targets to create. Default is 1.
-    '''
-    def __init__(self, n_targets=1):
-        self.balls = []
-        self.gun = [Tank(coord=[SCREEN_SIZE[0] - 100, SCREEN_SIZE[1] - 30], color=RED),
-                    Tank2(coord=[100, SCREEN_SIZE[1] - 30], color=BLUE)]
-        self.targets = []
-        self.targetBombs = []
-        self.score_t = ScoreTable()
-        self.n_targets = n_targets
-        self.new_mission()
+        - tiles (iterable): (i, j) tile indices.
 
-    def new_mission(self):
+        Returns:
+        None
         '''
-        Adds new targets.
-        '''
-        for i in range(self.n_targets):
-            MovingCircle = MovingCircleTarget(rad=random.randint(max(1, 30 - 2*max(0, self.score_t.score())),
-                                                                      30 - max(0, self.score_t.score())))
-            MovingCircle.drop_bomb(3)
-            self.targets.append(MovingCircle)
-
-            MovingEllipse = MovingEllipseTarget(rad=random.randint(max(1, 30 - 2*max(0, self.score_t.score())),
-                                                                       30 - max(0, self.score_t.score())))
-            MovingEllipse.drop_bomb(3)
-            self.targets.append(MovingEllipse)
-
-            CircleTargetReal = CircleTarget(rad=random.randint(max(1, 30 - 2*max(0, self.score_t.score())),
-                                                                       30 - max(0, self.score_t.score())))
-            CircleTargetReal.drop_bomb(3)
-            self.targets.append(CircleTargetReal)
-
-            EllipseTargetReal = EllipseTarget(rad=random.randint(max(1, 30 - 2*max(0, self.score_t.score())),
-                                                                 30 - max(0, self.score_t.score())))
-            EllipseTargetReal.drop_bomb(3)
-            self.targets.append(EllipseTargetReal)
-
-            RectangleTargetReal = RectangleTarget(coord=[random.randint(200, SCREEN_SIZE[0] - 200), random.randint(200, SCREEN_SIZE[1] - 200)],
-                                                color=rand_color(),
-                                                width=random.randint(max(1, 30 - 2 * max(0, self.score_t.score())),
-                                                                     30 - max(0, self.score_t.score())),
-                                                height=random.randint(max(1, 30 - 2 * max(0, self.score_t.score())),
-                                                                      30 - max(0, self.score_t.score())))
-            RectangleTargetReal.drop_bomb(3)
-            self.targets.append(RectangleTargetReal)
-
-            MovingRectangle = MovingRectangleTarget(coord=[random.randint(200, SCREEN_SIZE[0] - 200), random.randint(200, SCREEN_SIZE[1] - 200)],
-                                                      color=rand_color(),
-                                                      width=random.randint(max(1, 30 - 2 * max(0, self.score_t.score())),
-                                                                           30 - max(0, self.score_t.score())),
-                                                      height=random.randint(max(1, 30 - 2 * max(0, self.score_t.score())),
-                                                                            30 - max(0, self.score_t.score())))
-            MovingRectangle.drop_bomb(3)
-            self.targets.append(MovingRectangle)
-
-            PolygonTargetReal = PolygonTarget(coord=[random.randint(100, SCREEN_SIZE[0] - 100), random.randint(100, SCREEN_SIZE[1] - 100)],
-                                              color=rand_color(),
-                                              sides=5,
-                                              size=25)
-            PolygonTargetReal.drop_bomb(3)
-            self.targets.append(PolygonTargetReal)
-
-            MovingPolygon = MovingPolygonTarget(coord=[random.randint(100, SCREEN_SIZE[0] - 100), random.randint(100, SCREEN_SIZE[1] - 100)],
-                                                    color=rand_color(),
-                                                    sides=5,
-                                                    size=25)
-            MovingPolygon.drop_bomb(3)
-            self.targets.append(MovingPolygon)
+        for i, j in tiles:
+            self.tiles[i, j] = self.solid[i * self.TILE:(i + 1) * self.TILE, j * self.TILE:(j + 1) * self.TILE].any()
 
-    def process(self, events, screen):
+    def rebuild(self):
         '''
-        Runs all necessary methods for each iteration. Adds new targets if previous ones are destroyed.
-        
+        Redraws the image of the dirty tiles only.
+        '''
+        if not self.dirty:
+            return
+        pixels = pg.surfarray.pixels3d(self.image)
+        for i, j in self.dirty:
+            tile = (slice(i * self.TILE, (i + 1) * self.TILE), slice(j * self.TILE, (j + 1) * self.TILE))
+            pixels[tile] = np.where(self.solid[tile][:, :, np.newaxis], self.color, BLACK)
+        del pixels  # Unlocks the surface
+        self.dirty.clear()
+        self.version += 1
+
+    def circle_region(self, coord, rad):
+        '''
+        Returns the clipped bounding box of a circle and the circle's mask within it.
+
         Parameters:
-        - events (list): List of pygame events.
-        - screen: The pygame screen object.
+        - coord (list): Center of the circle.
+        - rad (float): Radius of the circle.
 
         Returns:
-        - bool: Indicates whether the game is done or not.
+        - tuple: (x0, x1, y0, y1, mask), or None if the circle is outside the playfield.
         '''
-        done = self.handle_events(events)
+        x0, x1 = max(0, int(coord[0] - rad)), min(self.size[0], int(coord[0] + rad) + 1)
+        y0, y1 = max(0, int(coord[1] - rad)), min(self.size[1], int(coord[1] + rad) + 1)
+        if x0 >= x1 or y0 >= y1:
+            return None
+        dx = np.arange(x0, x1)[:, np.newaxis] - coord[0]
+        dy = np.arange(y0, y1)[np.newaxis, :] - coord[1]
+        return x0, x1, y0, y1, dx * dx + dy * dy <= rad * rad
+
+    def collide(self, coord, rad):
+        '''
+        Checks whether a circle overlaps the ground. Circles over empty tiles are rejected without touching the mask.
 
-        if pg.mouse.get_focused():
-            mouse_pos = pg.mouse.get_pos()
-            self.gun[0].set_angle(mouse_pos)
-            self.gun[1].set_angle(mouse_pos)
+        Parameters:
+        - coord (list): Center of the circle.
+        - rad (float): Radius of the circle.
 
-        self.move()
-        self.collide()
-        self.draw(screen)
+        Returns:
+        - bool: True if the circle touches solid ground.
+        '''
+        region = self.circle_region(coord, rad)
+        if region is None:
+            return False
+        x0, x1, y0, y1, circle = region
+        if not self.tiles[x0 // self.TILE:(x1 - 1) // self.TILE + 1, y0 // self.TILE:(y1 - 1) // self.TILE + 1].any():
+            return False
+        return bool((self.solid[x0:x1, y0:y1] & circle).any())
 
-        if len(self.targets) == 0 and len(self.balls) == 0:
-            self.new_mission()
+    def near_ground(self, coord, rad):
+        '''
+        Tests many circles at once against the topmost ground of the tile columns under them.
+        Circles above it can't touch the ground, so only the others need collide(). A circle
+        narrower than a tile spans at most two tile columns; wider ones are always passed on.
 
-        return done
+        Parameters:
+        - coord (ndarray): Circle centers, shape (n, 2).
+        - rad (ndarray): Circle radii, shape (n,).
 
-    def handle_events(self, events):
+        Returns:
+        - ndarray: Boolean array, True for the circles that may touch the ground.
         '''
-        Handles events from the keyboard, mouse, etc.
+        top = np.minimum.reduceat(self.height, np.arange(0, self.size[0], self.TILE))  # Per tile column
+        first = np.clip((coord[:, 0] - rad) // self.TILE, 0, len(top) - 1).astype(int)
+        last = np.clip((coord[:, 0] + rad) // self.TILE, 0, len(top) - 1).astype(int)
+        return (coord[:, 1] + rad >= np.minimum(top[first], top[last])) | (2 * rad > self.TILE)
+
+    def carve(self, coord, rad):
+        '''
+        Carves a circular crater and marks the affected tiles for rebuilding.
 
         Parameters:
-        - events (list): List of pygame events.
+        - coord (list): Center of the crater.
+        - rad (float): Radius of the crater.
 
         Returns:
-        - bool: Indicates whether the game is done or not.
+        None
         '''
-        done = False
-        keys = pg.key.get_pressed()
-        if keys[pg.K_LEFT]:
-            self.gun[0].move_left(10)
-            # self.gun[1].move_left(10)
-        elif keys[pg.K_RIGHT]:
-            self.gun[0].move_right(10)
-            # self.gun[1].move_right(10)
-        for event in events:
-            if event.type == pg.QUIT:
-                done = True
-            elif event.type == pg.KEYDOWN:
-                if event.key == pg.K_LEFT:
-                    self.gun[0].move_left(10)
-                    # self.gun[1].move_left(10)
-                elif event.key == pg.K_RIGHT:
-                    self.gun[0].move_right(10)
-                    # self.gun[1].move_right(10)
-            elif event.type == pg.MOUSEBUTTONDOWN:
-                if event.button == 1:
-                    self.gun[0].activate()
-                    # self.gun[1].activate()
-            elif event.type == pg.MOUSEBUTTONUP:
-                if event.button == 1:
-                    self.balls.append(self.gun[0].strike())
-                    # self.balls.append(self.gun[1].strike())
-                    self.score_t.b_used += 1
+        region = self.circle_region(coord, rad)
+        if region is None:
+            return
+        x0, x1, y0, y1, circle = region
+        self.solid[x0:x1, y0:y1] &= ~circle
+        self.saved = None
+        self.update_height(x0, x1)
+        touched = [(i, j) for i in range(x0 // self.TILE, (x1 - 1) // self.TILE + 1)
+                   for j in range(y0 // self.TILE, (y1 - 1) // self.TILE + 1)]
+        self.update_tiles(touched)
+        self.dirty.update(touched)
+
+    def snapshot(self):
+        '''
+        Returns a read-only copy of the ground. Copy-on-write: every snapshot until the next
+        crater shares the same copy, so saving an unchanged terrain costs nothing.
 
-        if keys[pg.K_a]:
-            # self.gun[0].move_left(10)
-            self.gun[1].move_left(10)
-        elif keys[pg.K_d]:
-            # self.gun[0].move_right(10)
-            self.gun[1].move_right(10)
-        for event in events:
-            if event.type == pg.QUIT:
-                done = True
-            elif event.type == pg.KEYDOWN:
-                if event.key == pg.K_a:
-                    # self.gun[0].move_left(10)
-                    self.gun[1].move_left(10)
-                elif event.key == pg.K_d:
-                    # self.gun[0].move_right(1)
-                    self.gun[1].move_right(10)
-            elif event.type == pg.MOUSEBUTTONDOWN:
-                if event.button == 1:
-                    # self.gun[0].activate()
-                    self.gun[1].activate()
-            elif event.type == pg.MOUSEBUTTONUP:
-                if event.button == 1:
-                    # self.balls.append(self.gun[0].strike())
-                    self.balls.append(self.gun[1].strike())
-                    self.score_t.b_used += 1
-        return done
+        Returns:
+        - ndarray: The bitmask.
+        '''
+        if self.saved is None:
+            self.saved = self.solid.copy()
+            self.saved.flags.writeable = False
+        return self.saved
+
+    def restore(self, solid):
+        '''
+        Replaces the ground with a saved bitmask and rebuilds everything derived from it.
+        Does nothing if the ground hasn't changed since that snapshot was taken.
+
+        Parameters:
+        - solid (ndarray): Bitmask returned by snapshot() or saved from the solid attribute.
+
+        Returns:
+        None
+        '''
+        if solid is self.saved:
+            return
+        self.solid[:] = solid
+        self.saved = solid if not solid.flags.writeable else None
+        self.update_height(0, self.size[0])
+        self.dirty = {(i, j) for i in range(self.tiles.shape[0]) for j in range(self.tiles.shape[1])}
+        self.update_tiles(self.dirty)
+
+    def surface_y(self, x0, x1):
+        '''
+        Returns the highest ground level between two x coordinates.
+
+        Parameters:
+        - x0 (float): Left end of the span.
+        - x1 (float): Right end of the span.
 
+        Returns:
+        - int: The smallest ground y in the span.
+        '''
+        x0 = min(max(0, int(x0)), self.size[0] - 1)
+        x1 = min(max(x0 + 1, int(x1)), self.size[0])
+        return int(self.height[x0:x1].min())
 
     def draw(self, screen):
         '''
-        Runs the drawing method for balls, guns, targets, and the score table.
+        Draws the ground.
 
         Parameters:
-        - screen: The pygame screen object.
+        - screen: The surface to draw on.
 
         Returns:
-        - None
+        None
         '''
-        for ball in self.balls:
-            ball.draw(screen)
-        for target in self.targets:
-            target.draw(screen)
-        self.gun[0].draw(screen)
-        self.gun[1].draw(screen)
-        self.score_t.draw(screen)
+        self.rebuild()
+        screen.blit(self.image, (0, 0), version=self.version)
 
-    def move(self):
+
+class PhysicsModel:
+    '''
+    Shell physics integrated in one batch over all live shells. Supports quadratic air drag,
+    a per-mission wind field and Euler, semi-implicit Euler or velocity Verlet integration with
+    adaptive substepping for fast shells. The defaults reproduce CircleShell.move exactly.
+    '''
+    INTEGRATORS = ('euler', 'semi_implicit', 'verlet')
+
+    def __init__(self, integrator='semi_implicit', drag=0.0, wind_max=0.0, max_step=None,
+                 truncate=True, refl_ort=0.8, refl_par=0.9):
         '''
-        Runs the movement method for balls and guns, and removes dead balls.
+        Constructor method.
 
         Parameters:
-        - None
+        - integrator (str): One of INTEGRATORS. Default is 'semi_implicit', the scheme of CircleShell.move.
+        - drag (float): Quadratic drag coefficient per pixel. Default is 0 (no drag).
+        - wind_max (float): Maximum wind speed drawn for each mission, in pixels per tick. Default is 0.
+        - max_step (float or None): Maximum distance a shell may travel in one substep. Default is None (one step per tick).
+        - truncate (bool): Truncate velocities to int on bounces like check_corners. Default is True.
+        - refl_ort (float): Restitution perpendicular to the wall. Default is 0.8.
+        - refl_par (float): Restitution parallel to the wall. Default is 0.9.
+        '''
+        if integrator not in self.INTEGRATORS:
+            raise ValueError('Unknown integrator: {}'.format(integrator))
+        self.integrator = integrator
+        self.drag = drag
+        self.wind_max = wind_max
+        self.max_step = max_step
+        self.truncate = truncate
+        self.refl_ort = refl_ort
+        self.refl_par = refl_par
+        self.wind = 0.0  # Wind speed at the top of the screen; it fades to calm at the ground
+
+    def matches_move(self):
+        '''
+        Returns whether the model moves shells exactly like CircleShell.move, as the defaults do.
+        '''
+        return (self.integrator == 'semi_implicit' and not self.drag and not self.max_step and self.truncate
+                and self.refl_ort == 0.8 and self.refl_par == 0.9)
+
+    def new_wind(self):
+        '''
+        Draws the wind for a new mission.
+        '''
+        self.wind = random.uniform(-self.wind_max, self.wind_max)
+
+    def accel(self, coord, vel, grav):
+        '''
+        Computes the acceleration of every shell: gravity plus drag relative to the wind.
+
+        Parameters:
+        - coord (ndarray): Shell coordinates, shape (n, 2).
+        - vel (ndarray): Shell velocities, shape (n, 2).
+        - grav (float): The gravitational acceleration.
 
         Returns:
-        - None
+        - ndarray: Accelerations, shape (n, 2).
         '''
-        dead_balls = []
-        for i, ball in enumerate(self.balls):
-            ball.move(grav=2)
-            if not ball.is_alive:
-                dead_balls.append(i)
-        for i in reversed(dead_balls):
-            self.balls.pop(i)
-        for i, target in enumerate(self.targets):
-            target.move()
-        self.gun[0].gain()
-        self.gun[1].gain()
+        acc = np.zeros_like(vel)
+        acc[:, 1] = grav
+        if self.drag:
+            air = vel.copy()
+            air[:, 0] -= self.wind * np.clip(1 - coord[:, 1] / WORLD_SIZE[1], 0, 1)
+            acc -= self.drag * np.hypot(air[:, 0], air[:, 1])[:, np.newaxis] * air
+        return acc
+
+    def bounce(self, coord, vel, rad):
+        '''
+        Vectorized check_corners: reflects shells off the screen edges with inelastic rebound.
 
-    def collide(self):
+        Parameters:
+        - coord (ndarray): Shell coordinates, shape (n, 2). Modified in place.
+        - vel (ndarray): Shell velocities, shape (n, 2). Modified in place.
+        - rad (ndarray): Shell radii, shape (n,).
+
+        Returns:
+        None
+        '''
+        cut = np.trunc if self.truncate else (lambda v: v)
+        for i in range(2):
+            low = coord[:, i] < rad
+            high = coord[:, i] > WORLD_SIZE[i] - rad
+            hit = low | high
+            if not hit.any():
+                continue
+            coord[low, i] = rad[low]
+            coord[high, i] = WORLD_SIZE[i] - rad[high]
+            vel[hit, i] = -cut(vel[hit, i] * self.refl_ort)
+            vel[hit, 1 - i] = cut(vel[hit, 1 - i] * self.refl_par)
+
+    def integrate(self, coord, vel, rad, grav=GRAV):
         '''
-        Checks whether balls bump into targets and sets balls' alive trigger.
+        Advances shell arrays by one tick.
 
         Parameters:
-        - None
+        - coord (ndarray): Shell coordinates, shape (n, 2). Modified in place.
+        - vel (ndarray): Shell velocities, shape (n, 2). Modified in place.
+        - rad (ndarray): Shell radii, shape (n,).
+        - grav (float): The gravitational acceleration. Default is GRAV.
 
         Returns:
-        - None
+        - ndarray: Boolean array, True for shells that are still alive.
+        '''
+        if self.max_step:
+            steps = np.maximum(1, np.ceil(np.hypot(vel[:, 0], vel[:, 1]) / self.max_step)).astype(int)
+        else:
+            steps = np.ones(len(vel), dtype=int)
+        h = (1 / steps)[:, np.newaxis]
+        for k in range(steps.max(initial=0)):
+            rows = steps > k  # Shells that still have substeps left
+            self.substep(coord, vel, rad, grav, h, slice(None) if rows.all() else rows)
+        return ~((vel[:, 0] ** 2 + vel[:, 1] ** 2 < 2 ** 2) & (coord[:, 1] > WORLD_SIZE[1] - 2 * rad))
+
+    def substep(self, coord, vel, rad, grav, h, rows):
+        '''
+        Advances the selected shells by their own substep length h.
+        '''
+        c, v, r, h = coord[rows], vel[rows], rad[rows], h[rows]
+        a = self.accel(c, v, grav)
+        if self.integrator == 'euler':
+            c += v * h
+            v += a * h
+        elif self.integrator == 'semi_implicit':
+            v += a * h
+            c += v * h
+        else:
+            c += v * h + 0.5 * a * h * h
+            v += 0.5 * (a + self.accel(c, v + a * h, grav)) * h
+        self.bounce(c, v, r)
+        coord[rows] = c
+        vel[rows] = v
+
+    def step(self, balls, grav=GRAV):
+        '''
+        Moves a list of shells by one tick and updates their is_alive flags. Shells already
+        marked dead, e.g. by a tank hit, are left alone, so they can't hit again next tick.
+
+        Parameters:
+        - balls (list): CircleShell or EllipseShell objects.
+        - grav (float): The gravitational acceleration. Default is GRAV.
+
+        Returns:
+        None
         '''
-        collisions = []
-        targets_c = []
-        for i, ball in enumerate(self.balls):
-            for j, target in enumerate(self.targets):
-                if target.check_collision(ball):
-                    collisions.append([i, j])
-                    targets_c.append(j)
-        targets_c.sort()
-        for j in reversed(targets_c):
-            self.score_t.t_destr += 1
-            self.targets.pop(j)
+        balls = [ball for ball in balls if ball.is_alive]
+        if not balls:
+            return
+        coord = np.array([ball.coord for ball in balls], dtype=float)
+        vel = np.array([ball.vel for ball in balls], dtype=float)
+        rad = np.array([ball.rad for ball in balls], dtype=float)
+        alive = self.integrate(coord, vel, rad, grav)
+        for ball, c, v, a in zip(balls, coord.tolist(), vel.tolist(), alive.tolist()):
+            ball.coord[:] = c
+            ball.vel[:] = v
+            ball.is_alive = a
+
+
+def cluster_fan():
+    '''
+    Returns the velocities of a cluster shell's submunitions relative to the shell: CLUSTER_COUNT
+    directions spread evenly around the circle, in whole pixels per tick like the velocities of strike().
+
+    Returns:
+    - ndarray: Shape (CLUSTER_COUNT, 2).
+    '''
+    angles = 2 * np.pi * np.arange(CLUSTER_COUNT) / CLUSTER_COUNT
+    return np.rint(CLUSTER_SPEED * np.column_stack([np.cos(angles), np.sin(angles)]))
+
 
+def circles_hit_boxes(coord, rad, boxes):
+    '''
+    Tests many circles against many axis-aligned boxes at once.
 
-screen = pg.display.set_mode(SCREEN_SIZE)
-pg.display.set_caption("The gun of Khiryanov")
+    Parameters:
+    - coord (ndarray): Circle centers, shape (n, 2).
+    - rad (ndarray): Circle radii, shape (n,).
+    - boxes (ndarray): Boxes as [left, top, right, bottom], shape (m, 4).
 
-done = False
-clock = pg.time.Clock()
+    Returns:
+    - ndarray: Boolean array of shape (n, m), True where circle i overlaps box j.
+    '''
+    x = coord[:, 0, np.newaxis]
+    y = coord[:, 1, np.newaxis]
+    dx = x - np.clip(x, boxes[:, 0], boxes[:, 2])
+    dy = y - np.clip(y, boxes[:, 1], boxes[:, 3])
+    return dx * dx + dy * dy <= (rad * rad)[:, np.newaxis]
 
-mgr = Manager(n_targets=1)
 
-while not done:
-    clock.tick(15)
-    screen.fill(BLACK)
+class BombPool:
+    '''
+    Bombs dropped by the targets. Coordinates and fall speeds are kept in arrays owned by the
+    Manager, so bombs can be moved and hit-tested all at once however many there are.
+    '''
+    RAD = 10  # Radius of a bomb
 
-    done = mgr.process(pg.event.get(), screen)
+    def __init__(self, capacity=64):
+        '''
+        Constructor method.
 
-    pg.display.flip()
+        Parameters:
+        - capacity (int): Initial number of rows. The arrays double when full. Default is 64.
+        '''
+        self.coord = np.zeros((capacity, 2))
+        self.speed = np.zeros(capacity)
+        self.ids = np.zeros(capacity, dtype=int)  # Unique id of every bomb, stable while it falls
+        self.count = 0  # Live bombs occupy the first count rows
+        self.next_id = 0
 
+    def add(self, coord, speed):
+        '''
+        Adds a falling bomb.
 
-pg.quit()
\ No newline at end of file
+        Parameters:
+        - coord (list): Initial coordinates of the bomb.
+        - speed (float): Fall speed in pixels per tick.
+
+        Returns:
+        None
+        '''
+        if self.count == len(self.speed):
+            self.coord = np.concatenate([self.coord, np.zeros_like(self.coord)])
+            self.speed = np.concatenate([self.speed, np.zeros_like(self.speed)])
+            self.ids = np.concatenate([self.ids, np.zeros_like(self.ids)])
+        self.coord[self.count] = coord
+        self.speed[self.count] = speed
+        self.ids[self.count] = self.next_id
+        self.next_id += 1
+        self.count += 1
+
+    def adopt(self, target):
+        '''
+        Takes over the bombs a target dropped with drop_bomb.
+
+        Parameters:
+        - target: A target whose bombs and speeds lists are emptied into the pool.
+
+        Returns:
+        None
+        '''
+        for bomb, speed in zip(target.bombs, target.speeds):
+            self.add(bomb, speed)
+        target.bombs.clear()
+        target.speeds.clear()
+
+    def remove(self, dead):
+        '''
+        Removes bombs, keeping the survivors packed at the front of the arrays.
+
+        Parameters:
+        - dead (ndarray): Boolean array over the live bombs, True for bombs to remove.
+
+        Returns:
+        None
+        '''
+        keep = ~dead
+        k = int(keep.sum())
+        for array in (self.coord, self.speed, self.ids):
+            array[:k] = array[:self.count][keep]
+        self.count = k
+
+    def snapshot(self):
+        '''
+        Copies the live bombs.
+
+        Returns:
+        - dict: The state.
+        '''
+        n = self.count
+        return {'coord': self.coord[:n].copy(), 'speed': self.speed[:n].copy(), 'ids': self.ids[:n].copy(),
+                'next_id': self.next_id}
+
+    def restore(self, state):
+        '''
+        Restores the bombs saved by snapshot().
+
+        Parameters:
+        - state (dict): The state.
+
+        Returns:
+        None
+        '''
+        n = len(state['speed'])
+        if n > len(self.speed):
+            self.coord, self.speed, self.ids = np.zeros((n, 2)), np.zeros(n), np.zeros(n, dtype=int)
+        self.coord[:n] = state['coord']
+        self.speed[:n] = state['speed']
+        self.ids[:n] = state['ids']
+        self.count = n
+        self.next_id = state['next_id']
+
+    def move(self):
+        '''
+        Lets all bombs fall and drops the ones that left the screen.
+        '''
+        n = self.count
+        self.coord[:n, 1] += self.speed[:n]
+        gone = self.coord[:n, 1] > WORLD_SIZE[1] + self.RAD
+        if gone.any():
+            self.remove(gone)
+
+    def draw(self, screen, camera=None, quality=None):
+        '''
+        Draws all bombs, or the ones in view of a camera.
+
+        Parameters:
+        - screen: The surface to draw on.
+        - camera (Camera or None): Culls bombs outside its view. Default is None.
+        - quality (RenderQuality or None): Detail settings. Default is None (full detail).
+
+        Returns:
+        None
+        '''
+        coord = self.coord[:self.count]
+        if camera is not None:
+            coord = coord[camera.visible(coord, self.RAD)]
+        draw_bombs(screen, coord.tolist(), quality)
+
+
+Body = collections.namedtuple('Body', 'coord rad')  # A circle with the attributes check_collision reads
+
+
+def clone(obj):
+    '''
+    Copies a game object without calling its constructor. List attributes (coordinates, bombs)
+    are copied two levels deep, everything else is shared, which is enough for targets and tanks
+    and much cheaper than copy.deepcopy.
+
+    Parameters:
+    - obj: The object.
+
+    Returns:
+    - The copy.
+    '''
+    twin = object.__new__(type(obj))
+    state = obj.__dict__.copy()
+    for name, value in state.items():
+        if type(value) is list:
+            state[name] = [item[:] if type(item) is list else item for item in value]
+    twin.__dict__ = state
+    return twin
+
+
+class EntityStore:
+    '''
+    Entities kept as dense component arrays: live entities occupy the first count rows of every
+    component, so systems run over contiguous slices. Removal swaps survivors from the end into
+    the holes. Entities are named by generational handles that stay valid while rows move and
+    go stale once the entity is removed.
+    '''
+    SLOT_BITS = 32  # A handle is generation << SLOT_BITS | slot
+
+    def __init__(self, components, capacity=64):
+        '''
+        Constructor method.
+
+        Parameters:
+        - components (dict): Component name -> (shape of one value, dtype), e.g. {'coord': ((2,), float)}.
+        - capacity (int): Initial number of rows. The arrays double when full. Default is 64.
+        '''
+        self.columns = {name: np.zeros((capacity,) + tuple(shape), dtype=dtype)
+                        for name, (shape, dtype) in components.items()}
+        self.slot = np.zeros(capacity, dtype=np.int64)  # Slot of the entity in every row
+        self.row = np.full(capacity, -1, dtype=np.int64)  # Row of the entity in every slot, -1 if free
+        self.generation = np.zeros(capacity, dtype=np.int64)  # Bumped whenever a slot is freed
+        self.free = list(range(capacity - 1, -1, -1))  # Free slots, lowest last
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, name):
+        '''
+        Returns a component of all live entities as a view, e.g. store['coord'].
+        '''
+        return self.columns[name][:self.count]
+
+    def grow(self):
+        '''
+        Doubles the capacity of all arrays.
+        '''
+        n = len(self.slot)
+        for name, column in self.columns.items():
+            self.columns[name] = np.concatenate([column, np.zeros_like(column)])
+        self.slot = np.concatenate([self.slot, np.zeros_like(self.slot)])
+        self.row = np.concatenate([self.row, np.full(n, -1, dtype=np.int64)])
+        self.generation = np.concatenate([self.generation, np.zeros_like(self.generation)])
+        self.free = list(range(2 * n - 1, n - 1, -1)) + self.free
+
+    def spawn(self, **values):
+        '''
+        Adds an entity.
+
+        Parameters:
+        - values: One value per component.
+
+        Returns:
+        - int: Handle of the new entity.
+        '''
+        if self.count == len(self.slot):
+            self.grow()
+        slot = self.free.pop()
+        row = self.count
+        for name, column in self.columns.items():
+            column[row] = values[name]
+        self.slot[row] = slot
+        self.row[slot] = row
+        self.count += 1
+        return int(self.generation[slot]) << self.SLOT_BITS | slot
+
+    def spawn_many(self, n, **values):
+        '''
+        Adds n entities at once, with the same rows and handles as n calls of spawn().
+
+        Parameters:
+        - n (int): Number of entities.
+        - values: One array of n values, or one value shared by all, per component.
+
+        Returns:
+        - ndarray: Handles of the new entities.
+        '''
+        while self.count + n > len(self.slot):
+            self.grow()
+        slots = np.array(self.free[len(self.free) - n:][::-1], dtype=np.int64)
+        del self.free[len(self.free) - n:]
+        rows = np.arange(self.count, self.count + n)
+        for name, column in self.columns.items():
+            column[rows] = values[name]
+        self.slot[rows] = slots
+        self.row[slots] = rows
+        self.count += n
+        return self.generation[slots] << self.SLOT_BITS | slots
+
+    def index(self, handle):
+        '''
+        Looks up the current row of an entity.
+
+        Parameters:
+        - handle (int): Handle returned by spawn().
+
+        Returns:
+        - int or None: The row, or None if the entity was removed.
+        '''
+        slot = handle & ((1 << self.SLOT_BITS) - 1)
+        if slot >= len(self.row) or self.row[slot] < 0 or self.generation[slot] != handle >> self.SLOT_BITS:
+            return None
+        return int(self.row[slot])
+
+    def handles(self):
+        '''
+        Returns the handles of all live entities, in row order.
+        '''
+        slots = self.slot[:self.count]
+        return self.generation[slots] << self.SLOT_BITS | slots
+
+    def kill(self, handle):
+        '''
+        Removes an entity by handle.
+
+        Parameters:
+        - handle (int): Handle returned by spawn().
+
+        Returns:
+        None
+        '''
+        row = self.index(handle)
+        if row is None:
+            raise KeyError('Stale entity handle: {}'.format(handle))
+        self.remove([row])
+
+    def snapshot(self):
+        '''
+        Copies the live rows and the handle bookkeeping. Object components are cloned.
+
+        Returns:
+        - dict: The state.
+        '''
+        n = self.count
+        columns = {}
+        for name, column in self.columns.items():
+            columns[name] = column[:n].copy()
+            if column.dtype == object:
+                for i in range(n):
+                    columns[name][i] = clone(columns[name][i])
+        return {'columns': columns, 'slot': self.slot[:n].copy(), 'row': self.row.copy(),
+                'generation': self.generation.copy(), 'free': list(self.free)}
+
+    def restore(self, state):
+        '''
+        Restores the entities saved by snapshot(). Handles taken before the snapshot are valid again.
+        Components the state lacks, e.g. because it was saved before they existed, are zeroed.
+
+        Parameters:
+        - state (dict): The state.
+
+        Returns:
+        None
+        '''
+        capacity, n = len(state['row']), len(state['slot'])
+        if capacity != len(self.row):
+            self.columns = {name: np.zeros((capacity,) + column.shape[1:], dtype=column.dtype)
+                            for name, column in self.columns.items()}
+            self.slot = np.zeros(capacity, dtype=np.int64)
+        for name, column in self.columns.items():
+            column[:n] = state['columns'].get(name, 0)
+            if column.dtype == object:
+                for i in range(n):
+                    column[i] = clone(column[i])
+        self.slot[:n] = state['slot']
+        self.row = state['row'].copy()
+        self.generation = state['generation'].copy()
+        self.free = list(state['free'])
+        self.count = n
+
+    def remove(self, rows):
+        '''
+        Removes entities by row in O(len(rows)): survivors from the end of the arrays are moved
+        into the holes, everything else stays in place.
+
+        Parameters:
+        - rows (list or ndarray): Rows of the entities to remove.
+
+        Returns:
+        None
+        '''
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        if len(rows) == 0:
+            return
+        k = self.count - len(rows)
+        tail = np.ones(self.count - k, dtype=bool)
+        tail[rows[rows >= k] - k] = False
+        holes = rows[rows < k]
+        fillers = np.flatnonzero(tail) + k  # Survivors behind the new end, as many as there are holes
+        freed = self.slot[rows]
+        for column in self.columns.values():
+            column[holes] = column[fillers]
+        self.slot[holes] = self.slot[fillers]
+        self.row[self.slot[holes]] = holes
+        self.row[freed] = -1
+        self.generation[freed] += 1
+        self.free.extend(freed.tolist())
+        self.count = k
+
+
+class TimingWheel:
+    '''
+    Hierarchical timing wheel for game events due a whole number of ticks ahead. Level k has
+    SLOTS slots covering SLOTS**k ticks each; an event waits in the coarsest level its delay needs
+    and is moved one level down when the level below wraps around. Scheduling and firing are O(1),
+    and a tick without due events costs one look at an empty slot however many events are pending.
+    Events are plain tuples, so the wheel can be copied into snapshots.
+    '''
+    BITS = 6  # SLOTS = 2**BITS
+    SLOTS = 1 << BITS
+    LEVELS = 4  # Delays up to SLOTS**LEVELS ticks (about 13 days at 15 ticks per second) fit in the wheel
+
+    def __init__(self):
+        '''
+        Constructor method. Creates an empty wheel at tick 0.
+        '''
+        self.now = 0  # The tick the next advance() fires
+        self.seq = 0  # Events scheduled so far; orders events due on the same tick
+        self.count = 0  # Pending events
+        self.slots = [[[] for _ in range(self.SLOTS)] for _ in range(self.LEVELS)]  # Lists of (due, seq, event)
+        self.overflow = []  # Events beyond the top level, placed again whenever it wraps around
+
+    def __len__(self):
+        return self.count
+
+    def schedule(self, delay, event):
+        '''
+        Schedules an event.
+
+        Parameters:
+        - delay (int): Ticks to wait; 0 fires it on the next advance().
+        - event (tuple): The event, e.g. ('bomb', handle, 0). Returned by advance() when due.
+
+        Returns:
+        None
+        '''
+        self.seq += 1
+        self.count += 1
+        self.place((self.now + max(0, int(delay)), self.seq, event))
+
+    def place(self, timer):
+        '''
+        Puts a (due, seq, event) timer into the finest level whose span covers its delay.
+        '''
+        due = timer[0]
+        delay = due - self.now
+        for level in range(self.LEVELS):
+            if delay < 1 << (self.BITS * (level + 1)):
+                self.slots[level][(due >> (self.BITS * level)) & (self.SLOTS - 1)].append(timer)
+                return
+        self.overflow.append(timer)
+
+    def advance(self):
+        '''
+        Moves to the next tick.
+
+        Returns:
+        - list: The events due on the tick that ended, in the order they were scheduled.
+        '''
+        now = self.now
+        # Where the lower levels wrap around, the next slot of the levels above is spread over them
+        top = 0
+        while top < self.LEVELS and now & ((1 << (self.BITS * (top + 1))) - 1) == 0:
+            top += 1
+        if top == self.LEVELS and self.overflow:
+            timers, self.overflow = self.overflow, []
+            for timer in timers:
+                self.place(timer)
+        for level in range(min(top, self.LEVELS - 1), 0, -1):
+            slot = self.slots[level][(now >> (self.BITS * level)) & (self.SLOTS - 1)]
+            if slot:
+                timers = list(slot)
+                slot.clear()
+                for timer in timers:
+                    self.place(timer)
+        self.now = now + 1
+        slot = self.slots[0][now & (self.SLOTS - 1)]
+        if not slot:
+            return []
+        timers = sorted(slot, key=lambda timer: timer[1])
+        slot.clear()
+        self.count -= len(timers)
+        return [timer[2] for timer in timers]
+
+    def snapshot(self):
+        '''
+        Copies the pending events.
+
+        Returns:
+        - tuple: (now, seq, {(level, slot): tuple of timers}, overflow).
+        '''
+        slots = {(level, i): tuple(slot) for level, row in enumerate(self.slots) for i, slot in enumerate(row) if slot}
+        return (self.now, self.seq, slots, tuple(self.overflow))
+
+    def restore(self, state):
+        '''
+        Restores the events copied by snapshot().
+
+        Parameters:
+        - state (tuple): The result of snapshot().
+
+        Returns:
+        None
+        '''
+        self.now, self.seq, slots, overflow = state
+        for row in self.slots:
+            for slot in row:
+                slot.clear()
+        for (level, i), timers in slots.items():
+            self.slots[level][i].extend(timers)
+        self.overflow = list(overflow)
+        self.count = sum(len(timers) for timers in slots.values()) + len(self.overflow)
+
+
+class TargetBVH:
+    '''
+    Bounding-volume hierarchy over the targets. Built when targets are added, refitted every tick
+    for moving targets and when targets are removed; answers radius, box and ray queries without
+    scanning every target.
+    '''
+    LEAF_SIZE = 4  # Maximum number of targets per leaf
+    EMPTY = [math.inf, math.inf, -math.inf, -math.inf]  # Box of a removed target's entry, overlaps nothing
+
+    def __init__(self, targets=()):
+        '''
+        Constructor method.
+
+        Parameters:
+        - targets (list): The targets to index. Default is none.
+        '''
+        self.build(targets)
+
+    def build(self, targets):
+        '''
+        Rebuilds the hierarchy by splitting the targets at the median of the longest axis.
+
+        Parameters:
+        - targets (list): The targets to index.
+
+        Returns:
+        None
+        '''
+        self.targets = list(targets)
+        boxes = self.gather()
+        centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+        self.items = np.arange(len(self.targets))  # Targets ordered so every node covers a contiguous range
+        left, right, start, count, depth = [], [], [], [], []
+
+        def split(lo, hi, level):
+            node = len(left)
+            left.append(-1)
+            right.append(-1)
+            start.append(lo)
+            count.append(hi - lo)
+            depth.append(level)
+            if hi - lo > self.LEAF_SIZE:
+                idx = self.items[lo:hi]
+                spread = centers[idx].max(axis=0) - centers[idx].min(axis=0)
+                self.items[lo:hi] = idx[np.argsort(centers[idx, np.argmax(spread)], kind='stable')]
+                mid = (lo + hi) // 2
+                left[node] = split(lo, mid, level + 1)
+                right[node] = split(mid, hi, level + 1)
+            return node
+
+        if self.targets:
+            split(0, len(self.targets), 0)
+        self.left = np.array(left, dtype=int)
+        self.right = np.array(right, dtype=int)
+        self.start = np.array(start, dtype=int)
+        self.count = np.array(count, dtype=int)
+        self.leaves = np.flatnonzero(self.left < 0)  # Created in order, so their ranges are sorted
+        depth = np.array(depth, dtype=int)
+        internal = self.left >= 0
+        self.levels = [np.flatnonzero(internal & (depth == d)) for d in range(depth.max(initial=0), -1, -1)]
+        self.box = np.zeros((len(left), 4))
+        self.left_list, self.right_list = left, right
+        self.start_list, self.count_list = start, count
+        self.item_targets = [self.targets[i] for i in self.items]
+        self.dead = 0  # Entries of removed targets still in the leaves, marked by -1 in self.items
+        self.refit(boxes)
+
+    def remove(self, rows):
+        '''
+        Removes targets by index the way EntityStore.remove does, moving the last targets into the
+        holes, so the indices keep matching the store's rows. The tree is kept: the removed entries
+        are emptied and the leaves refitted. It is only rebuilt once the removed entries outnumber
+        the targets left.
+
+        Parameters:
+        - rows (list or ndarray): Indices of the targets to remove.
+
+        Returns:
+        None
+        '''
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        if len(rows) == 0:
+            return
+        n = len(self.targets)
+        k = n - len(rows)
+        tail = np.ones(n - k, dtype=bool)
+        tail[rows[rows >= k] - k] = False
+        holes = rows[rows < k]
+        fillers = np.flatnonzero(tail) + k
+        for hole, filler in zip(holes.tolist(), fillers.tolist()):
+            self.targets[hole] = self.targets[filler]
+        del self.targets[k:]
+        self.dead += len(rows)
+        if self.dead > k:
+            self.build(self.targets)
+            return
+        index = np.arange(n)
+        index[rows] = -1
+        index[fillers] = holes
+        self.items = np.where(self.items >= 0, index[self.items], -1)
+        self.item_targets = [self.targets[i] if i >= 0 else None for i in self.items.tolist()]
+        boxes = self.boxes.copy()
+        boxes[holes] = boxes[fillers]
+        self.refit(boxes[:k])
+
+    def gather(self):
+        '''
+        Returns the current bounding boxes of the indexed targets as an (n, 4) array.
+        '''
+        return np.array([target.aabb() for target in self.targets], dtype=float).reshape(-1, 4)
+
+    def refit(self, boxes=None, moved=None):
+        '''
+        Updates the node bounds to the targets' current positions without changing the tree.
+        Leaves are refitted with one reduceat call and internal nodes one level at a time.
+
+        Parameters:
+        - boxes (ndarray or None): Current target boxes. Default is None (gathered from the targets).
+        - moved (ndarray or None): Indices of the only targets that can have moved since the last refit;
+          only their boxes are gathered. Default is None (all targets).
+
+        Returns:
+        None
+        '''
+        if not self.targets:
+            self.box_list = []
+            self.item_boxes = []
+            return
+        if boxes is None and moved is not None:
+            if len(moved) == 0:
+                return  # Nothing moved, the bounds are still right
+            boxes = self.boxes
+            boxes[moved] = np.array([self.targets[i].aabb() for i in moved.tolist()], dtype=float).reshape(-1, 4)
+        if boxes is None:
+            boxes = self.gather()
+        self.boxes = boxes
+        ordered = boxes[self.items]
+        if self.dead:
+            ordered[self.items < 0] = self.EMPTY
+        starts = self.start[self.leaves]
+        self.box[self.leaves, :2] = np.minimum.reduceat(ordered[:, :2], starts)
+        self.box[self.leaves, 2:] = np.maximum.reduceat(ordered[:, 2:], starts)
+        for nodes in self.levels:
+            lo, hi = self.left[nodes], self.right[nodes]
+            self.box[nodes, :2] = np.minimum(self.box[lo, :2], self.box[hi, :2])
+            self.box[nodes, 2:] = np.maximum(self.box[lo, 2:], self.box[hi, 2:])
+        self.box_list = self.box.tolist()
+        self.item_boxes = ordered.tolist()
+
+    def query_aabb(self, box):
+        '''
+        Returns the targets whose bounding boxes overlap a box.
+
+        Parameters:
+        - box (list): [left, top, right, bottom].
+
+        Returns:
+        - list: The overlapping targets.
+        '''
+        return [self.item_targets[k] for k in self.overlapping(box)]
+
+    def query_rows(self, box):
+        '''
+        Returns the positions of the targets overlapping a box in the list the hierarchy was built
+        from, in ascending order, e.g. to draw the targets in view in their usual order.
+
+        Parameters:
+        - box (list): [left, top, right, bottom].
+
+        Returns:
+        - list: Indices into the targets.
+        '''
+        items = self.items
+        return sorted(int(items[k]) for k in self.overlapping(box))
+
+    def query_pairs(self, boxes):
+        '''
+        Box query for many boxes at once, e.g. all shells of a salvo. The hierarchy is descended
+        one level per step for all boxes together, with array operations instead of Python per node.
+
+        Parameters:
+        - boxes (ndarray): Query boxes as [left, top, right, bottom], shape (n, 4).
+
+        Returns:
+        - tuple: (query, row) arrays of the overlapping pairs, row being the index into the targets.
+        '''
+        empty = np.zeros(0, dtype=int)
+        if not self.targets or len(boxes) == 0:
+            return empty, empty
+
+        def overlap(a, b):
+            return (a[:, 0] <= b[:, 2]) & (a[:, 2] >= b[:, 0]) & (a[:, 1] <= b[:, 3]) & (a[:, 3] >= b[:, 1])
+
+        query, node = np.arange(len(boxes)), np.zeros(len(boxes), dtype=int)
+        leaf_query, leaf_node = [empty], [empty]
+        while len(query):
+            hit = overlap(self.box[node], boxes[query])
+            query, node = query[hit], node[hit]
+            inner = self.left[node] >= 0
+            leaf_query.append(query[~inner])
+            leaf_node.append(node[~inner])
+            query = np.repeat(query[inner], 2)
+            node = np.column_stack([self.left[node[inner]], self.right[node[inner]]]).ravel()
+        query, node = np.concatenate(leaf_query), np.concatenate(leaf_node)
+        # Every leaf pair becomes one pair per target in the leaf
+        count = self.count[node]
+        query = np.repeat(query, count)
+        k = np.repeat(self.start[node] - np.cumsum(count) + count, count) + np.arange(count.sum())
+        rows = self.items[k]
+        live = rows >= 0
+        query, rows = query[live], rows[live]
+        hit = overlap(self.boxes[rows], boxes[query])
+        return query[hit], rows[hit]
+
+    def overlapping(self, box):
+        '''
+        Returns the item positions (indices into self.items) of the targets whose boxes overlap a box.
+        '''
+        result = []
+        stack = [0] if self.targets else []
+        while stack:
+            node = stack.pop()
+            b = self.box_list[node]
+            if b[0] > box[2] or b[2] < box[0] or b[1] > box[3] or b[3] < box[1]:
+                continue
+            if self.left_list[node] >= 0:
+                stack.append(self.left_list[node])
+                stack.append(self.right_list[node])
+                continue
+            for k in range(self.start_list[node], self.start_list[node] + self.count_list[node]):
+                b = self.item_boxes[k]
+                if not (b[0] > box[2] or b[2] < box[0] or b[1] > box[3] or b[3] < box[1]):
+                    result.append(k)
+        return result
+
+    def query_radius(self, point, radius):
+        '''
+        Returns the targets within a distance of a point, nearest first.
+
+        Parameters:
+        - point (list): The point as [x, y].
+        - radius (float): The search radius.
+
+        Returns:
+        - list: Pairs (target, distance) with the target's distance() to the point.
+        '''
+        result = []
+        box = [point[0] - radius, point[1] - radius, point[0] + radius, point[1] + radius]
+        for target in self.query_aabb(box):
+            dist = target.distance(point)
+            if dist <= radius:
+                result.append((target, dist))
+        result.sort(key=lambda hit: hit[1])
+        return result
+
+    def raycast(self, origin, direction, max_dist=math.inf):
+        '''
+        Returns the first target hit by a ray. Nodes are visited nearest first and skipped when
+        they start beyond the closest hit found so far.
+
+        Parameters:
+        - origin (list): Start of the ray.
+        - direction (list): Direction of the ray, need not be normalized.
+        - max_dist (float): Length of the ray. Default is infinite.
+
+        Returns:
+        - tuple or None: (target, distance) of the first hit, or None if nothing is hit.
+        '''
+        length = math.hypot(direction[0], direction[1])
+        if not self.targets or length == 0:
+            return None
+        direction = (direction[0] / length, direction[1] / length)
+        best, hit = max_dist, None
+        start = ray_box(origin, direction, self.box_list[0], best)
+        stack = [(start, 0)] if start is not None else []
+        while stack:
+            near, node = stack.pop()
+            if near > best:
+                continue
+            if self.left_list[node] < 0:
+                for k in range(self.start_list[node], self.start_list[node] + self.count_list[node]):
+                    target = self.item_targets[k]
+                    if target is None:
+                        continue  # Removed
+                    dist = target.ray_distance(origin, direction)
+                    if dist is not None and dist < best:
+                        best, hit = dist, target
+                continue
+            children = []
+            for child in (self.left_list[node], self.right_list[node]):
+                dist = ray_box(origin, direction, self.box_list[child], best)
+                if dist is not None:
+                    children.append((dist, child))
+            children.sort(reverse=True)  # The nearer child is popped first
+            stack.extend(children)
+        return None if hit is None else (hit, best)
+
+
+class SweepAndPrune:
+    '''
+    Broad phase for moving bodies. Bodies are sorted by the left edge of their bounding box and
+    swept along x; the order is kept between frames, so re-sorting the nearly sorted list with
+    insertion sort is close to linear.
+    '''
+
+    def __init__(self):
+        '''
+        Constructor method.
+        '''
+        self.order = []  # Body keys sorted by left edge in the previous frame
+
+    def pairs(self, keys, left, right, top, bottom):
+        '''
+        Returns the pairs of bodies whose bounding boxes overlap.
+
+        Parameters:
+        - keys (list): Hashable key of every body, stable across frames.
+        - left, right, top, bottom (list): Bounding box edges of every body.
+
+        Returns:
+        - list: Pairs (i, j) of indices into keys with i < j, sorted.
+        '''
+        index = {key: i for i, key in enumerate(keys)}
+        order = [index[key] for key in self.order if key in index]
+        known = set(self.order)
+        order.extend(i for i, key in enumerate(keys) if key not in known)
+        # Insertion sort, cheap because bodies move little between frames
+        for a in range(1, len(order)):
+            item = order[a]
+            edge = left[item]
+            b = a - 1
+            while b >= 0 and left[order[b]] > edge:
+                order[b + 1] = order[b]
+                b -= 1
+            order[b + 1] = item
+        self.order = [keys[i] for i in order]
+
+        result = []
+        active = []
+        for i in order:
+            active = [j for j in active if right[j] >= left[i]]
+            for j in active:
+                if top[i] <= bottom[j] and top[j] <= bottom[i]:
+                    result.append((min(i, j), max(i, j)))
+            active.append(i)
+        result.sort()  # Contacts are resolved in the same order whatever the previous frames were
+        return result
+
+
+class ParticleSystem:
+    '''
+    Explosion and debris particles. Positions, velocities, lifetimes and colors live in
+    preallocated NumPy arrays, so integration and drawing are done for all particles at once.
+    '''
+
+    def __init__(self, max_particles=3000, lifetime=(8, 20), seed=None):
+        '''
+        Constructor method.
+
+        Parameters:
+        - max_particles (int): Hard particle budget. Spawns beyond it are dropped. Default is 3000.
+        - lifetime (tuple): Range of particle lifetimes in ticks. Default is (8, 20).
+        - seed (int or None): Seed of the random generator. Default is None (drawn from the random module,
+          so a seeded game replays the same explosions).
+        '''
+        self.max_particles = max_particles
+        self.lifetime = lifetime
+        self.pos = np.zeros((max_particles, 2))
+        self.vel = np.zeros((max_particles, 2))
+        self.life = np.zeros(max_particles, dtype=int)
+        self.color = np.zeros((max_particles, 3), dtype=np.uint8)
+        self.count = 0  # Live particles occupy the first count rows
+        self.rng = np.random.default_rng(random.getrandbits(64) if seed is None else seed)
+
+    def snapshot(self):
+        '''
+        Copies the live particles and the random generator state.
+
+        Returns:
+        - dict: The state.
+        '''
+        n = self.count
+        return {'pos': self.pos[:n].copy(), 'vel': self.vel[:n].copy(), 'life': self.life[:n].copy(),
+                'color': self.color[:n].copy(), 'rng': self.rng.bit_generator.state}
+
+    def restore(self, state):
+        '''
+        Restores the particles saved by snapshot().
+
+        Parameters:
+        - state (dict): The state.
+
+        Returns:
+        None
+        '''
+        n = len(state['life'])
+        for name in ('pos', 'vel', 'life', 'color'):
+            getattr(self, name)[:n] = state[name]
+        self.count = n
+        self.rng.bit_generator.state = state['rng']
+
+    def spawn(self, coord, color, amount=80, speed=10):
+        '''
+        Spawns a burst of particles: debris in the color of the destroyed object mixed with fire.
+
+        Parameters:
+        - coord (list): Center of the burst.
+        - color (tuple): Color of the destroyed object.
+        - amount (int): Number of particles to spawn. Default is 80.
+        - speed (float): Maximum initial speed of the particles. Default is 10.
+
+        Returns:
+        None
+        '''
+        amount = min(amount, self.max_particles - self.count)
+        if amount <= 0:
+            return
+        rows = slice(self.count, self.count + amount)
+        angle = self.rng.uniform(0, 2 * math.pi, amount)
+        speeds = self.rng.uniform(0, speed, amount)
+        self.pos[rows] = coord
+        self.vel[rows, 0] = speeds * np.cos(angle)
+        self.vel[rows, 1] = speeds * np.sin(angle) - speed  # Kick upwards so debris arcs under gravity
+        self.life[rows] = self.rng.integers(self.lifetime[0], self.lifetime[1], amount)
+        fire = self.rng.random(amount) < 0.5
+        self.color[rows] = color
+        self.color[rows][fire] = (255, 160, 0)
+        self.count += amount
+
+    def move(self, grav=GRAV):
+        '''
+        Integrates all particles with the same gravity as the shells and drops the expired ones.
+
+        Parameters:
+        - grav (float): The gravitational acceleration. Default is GRAV.
+
+        Returns:
+        None
+        '''
+        n = self.count
+        if n == 0:
+            return
+        self.vel[:n, 1] += grav
+        self.pos[:n] += self.vel[:n]
+        self.life[:n] -= 1
+        alive = ((self.life[:n] > 0) & (self.pos[:n, 0] >= 0) & (self.pos[:n, 0] < WORLD_SIZE[0])
+                 & (self.pos[:n, 1] < WORLD_SIZE[1]))
+        k = int(alive.sum())
+        if k < n:
+            # Compact the survivors to the front of the arrays
+            for array in (self.pos, self.vel, self.life, self.color):
+                array[:k] = array[:n][alive]
+            self.count = k
+
+    def draw(self, screen, camera=None):
+        '''
+        Draws all particles as 2x2 pixel squares with one array write per corner.
+
+        Parameters:
+        - screen: The surface to draw on.
+        - camera (Camera or None): Culls particles outside its view. Default is None.
+
+        Returns:
+        None
+        '''
+        pos, color = self.pos[:self.count], self.color[:self.count]
+        if camera is not None and self.count:
+            visible = camera.visible(pos, 2)
+            pos, color = pos[visible], color[visible]
+        if len(pos):
+            screen.points(pos, color)
+
+
+class QualityGovernor:
+    '''
+    Lowers the render quality step by step while frames exceed the clock.tick budget and
+    restores it when there is headroom again. Separate thresholds and dwell times for
+    degrading and restoring keep it from oscillating between two levels.
+    '''
+    # Settings applied at each level, cumulative from level 1 up
+    LEVELS = [{},
+              {'bomb_point_dist': 250},
+              {'polygon_sides': 3},
+              {'tank_wheels': False},
+              {'particles': False}]
+
+    def __init__(self, quality, budget_ms=1000 / FPS, degrade_at=0.9, restore_at=0.6,
+                 degrade_after=5, restore_after=45, smoothing=0.2):
+        '''
+        Constructor method.
+
+        Parameters:
+        - quality (RenderQuality): The settings to control.
+        - budget_ms (float): Frame-time budget in milliseconds. Default is 1000 / FPS.
+        - degrade_at (float): Fraction of the budget above which quality is lowered. Default is 0.9.
+        - restore_at (float): Fraction of the budget below which quality is raised. Default is 0.6.
+        - degrade_after (int): Consecutive slow frames needed to lower quality. Default is 5.
+        - restore_after (int): Consecutive fast frames needed to raise quality. Default is 45.
+        - smoothing (float): Weight of the newest frame in the moving average. Default is 0.2.
+        '''
+        self.quality = quality
+        self.budget_ms = budget_ms
+        self.degrade_at = degrade_at
+        self.restore_at = restore_at
+        self.degrade_after = degrade_after
+        self.restore_after = restore_after
+        self.smoothing = smoothing
+        self.level = 0
+        self.average = None  # Exponential moving average of the frame time
+        self.slow = 0  # Consecutive frames above the degrade threshold
+        self.fast = 0  # Consecutive frames below the restore threshold
+
+    def update(self, frame_ms):
+        '''
+        Feeds the time the last frame took (without the clock.tick wait) and adjusts the quality.
+
+        Parameters:
+        - frame_ms (float): Busy time of the last frame in milliseconds.
+
+        Returns:
+        None
+        '''
+        if self.average is None:
+            self.average = frame_ms
+        self.average += self.smoothing * (frame_ms - self.average)
+        if self.average > self.budget_ms * self.degrade_at:
+            self.slow += 1
+            self.fast = 0
+        elif self.average < self.budget_ms * self.restore_at:
+            self.fast += 1
+            self.slow = 0
+        else:
+            self.slow = self.fast = 0
+        if self.slow >= self.degrade_after and self.level < len(self.LEVELS) - 1:
+            self.set_level(self.level + 1)
+        elif self.fast >= self.restore_after and self.level > 0:
+            self.set_level(self.level - 1)
+
+    def set_level(self, level):
+        '''
+        Applies a quality level.
+
+        Parameters:
+        - level (int): 0 for full quality, up to len(LEVELS) - 1.
+
+        Returns:
+        None
+        '''
+        self.level = level
+        self.slow = self.fast = 0
+        self.quality.reset()
+        for settings in self.LEVELS[1:level + 1]:
+            for name, value in settings.items():
+                setattr(self.quality, name, value)
+
+
+class FramePacer:
+    '''
+    Keeps simulation ticks on a fixed wall-clock schedule of fps ticks per second. When a frame
+    runs late, several ticks are simulated before the next draw, skipping up to max_skip frames,
+    so game speed stays correct on slow machines.
+    '''
+
+    def __init__(self, fps=FPS, max_skip=MAX_FRAME_SKIP):
+        '''
+        Constructor method.
+
+        Parameters:
+        - fps (int): Simulation ticks per second. Default is FPS.
+        - max_skip (int): Maximum number of consecutive frames not drawn. Default is MAX_FRAME_SKIP.
+        '''
+        self.dt = 1 / fps
+        self.max_skip = max_skip
+        self.next_tick = None  # perf_counter() time the next tick is due
+        self.ticks = 0  # Ticks simulated
+        self.frames = 0  # Frames drawn
+        self.dropped = 0  # Frames skipped to catch up
+        self.slipped = 0  # Ticks the schedule gave up on because max_skip was reached
+
+    def run_frame(self, mgr, viewport):
+        '''
+        Waits for the next due tick, simulates every tick that is due (at most max_skip + 1)
+        and draws and presents once.
+
+        Parameters:
+        - mgr (Manager): The game manager.
+        - viewport (Viewport): The game window.
+
+        Returns:
+        - bool: Indicates whether the game is done or not.
+        '''
+        now = time.perf_counter()
+        if self.next_tick is None:
+            self.next_tick = now
+        elif now < self.next_tick:
+            viewport.wait(self.next_tick)
+        busy_start = time.perf_counter()
+
+        events = viewport.events()
+        done = False
+        ticks = 0
+        while ticks <= self.max_skip and (ticks == 0 or time.perf_counter() >= self.next_tick):
+            done = mgr.tick(events) or done
+            events = []  # Events are handled by the first tick only, held keys by every tick
+            self.next_tick += self.dt
+            ticks += 1
+        self.ticks += ticks
+        self.dropped += ticks - 1
+
+        behind = time.perf_counter() - self.next_tick
+        if behind > self.dt:
+            # Too slow even with skipping: let game time slow down instead of spiralling
+            self.slipped += int(behind / self.dt)
+            self.next_tick = time.perf_counter()
+
+        mgr.render(viewport.begin())
+        viewport.present()
+        self.frames += 1
+        mgr.governor.update((time.perf_counter() - busy_start) * 1000)
+        return done
+
+    def report(self):
+        '''
+        Summarizes how many ticks were simulated and frames drawn or dropped.
+
+        Returns:
+        - str: The summary.
+        '''
+        return 'Ticks simulated: {}, frames drawn: {}, frames dropped: {}, ticks slipped: {}'.format(
+            self.ticks, self.frames, self.dropped, self.slipped)
+
+
+class LatencyProbe:
+    '''
+    Measures input-to-photon latency: aiming (mouse motion), firing (MOUSEBUTTONUP) and moving
+    (arrow or A/D key presses) events are timestamped when they arrive, and their latency is
+    recorded when the first frame drawn after the tick that handled them is flipped. pygame events
+    carry no arrival time, so the probe drains the event queue every millisecond while the game
+    loop waits; events arriving while a frame is being simulated and drawn are stamped when it ends.
+    '''
+    KINDS = ('aim', 'strike', 'move')
+    MOVE_KEYS = (pg.K_LEFT, pg.K_RIGHT, pg.K_a, pg.K_d)
+    PERCENTILES = (50, 90, 99)
+
+    def __init__(self, telemetry=None, poll_interval=0.001):
+        '''
+        Constructor method.
+
+        Parameters:
+        - telemetry (Telemetry or None): Also records every latency in its 'latency' histogram. Default is None.
+        - poll_interval (float): Seconds between polls of the event queue while waiting. Default is 1 ms.
+        '''
+        self.telemetry = telemetry
+        self.poll_interval = poll_interval
+        self.histograms = {kind: Histogram() for kind in self.KINDS}  # Latencies in microseconds
+        self.events = []  # Polled events not handed out yet
+        self.arrived = []  # (kind, arrival time) of the stamped events among them
+        self.handled = []  # (kind, arrival time) of events handed out, waiting for the next flip
+        self.frame_end = None  # perf_counter() value at the end of the last tick()
+
+    def kind(self, event):
+        '''
+        Returns the latency kind of an event, None for events that aren't measured.
+        '''
+        if event.type == pg.MOUSEMOTION:
+            return 'aim'
+        if event.type == pg.MOUSEBUTTONUP and event.button in (1, 3):
+            return 'strike'
+        if event.type == pg.KEYDOWN and event.key in self.MOVE_KEYS:
+            return 'move'
+        return None
+
+    def poll(self):
+        '''
+        Moves the events waiting in pygame's queue into the probe, stamping them.
+        '''
+        events = pg.event.get()
+        if not events:
+            return
+        now = time.perf_counter()
+        for event in events:
+            kind = self.kind(event)
+            if kind is not None:
+                self.arrived.append((kind, now))
+        self.events.extend(events)
+
+    def wait(self, deadline):
+        '''
+        Sleeps until a perf_counter() time, polling the event queue meanwhile.
+        '''
+        while True:
+            self.poll()
+            left = deadline - time.perf_counter()
+            if left <= 0:
+                return
+            time.sleep(min(left, self.poll_interval))
+
+    def tick(self, fps):
+        '''
+        Replaces clock.tick(fps) in the game loop: waits for the next frame while polling.
+
+        Parameters:
+        - fps (int): Frames per second.
+
+        Returns:
+        - float: Milliseconds spent since the previous call before waiting, like clock.get_rawtime().
+        '''
+        now = time.perf_counter()
+        if self.frame_end is None:
+            self.frame_end = now
+        busy = now - self.frame_end
+        self.wait(self.frame_end + 1 / fps)
+        self.frame_end = max(time.perf_counter(), self.frame_end + 1 / fps)
+        return busy * 1000
+
+    def take(self):
+        '''
+        Hands out the polled events to be handled by a tick. Their latency runs until the next flip.
+
+        Returns:
+        - list: The events, like pg.event.get().
+        '''
+        self.poll()
+        events, self.events = self.events, []
+        self.handled.extend(self.arrived)
+        self.arrived = []
+        return events
+
+    def flipped(self):
+        '''
+        Records the latency of the handled events. Called right after pg.display.flip().
+        '''
+        if not self.handled:
+            return
+        now = time.perf_counter()
+        for kind, arrival in self.handled:
+            self.histograms[kind].record((now - arrival) * 1e6)
+            if self.telemetry is not None:
+                self.telemetry.record('latency', now - arrival)
+        self.handled = []
+
+    def report(self):
+        '''
+        Summarizes the latency percentiles per kind of input.
+
+        Returns:
+        - str: The summary, in milliseconds.
+        '''
+        lines = ['Input-to-display latency (ms):']
+        for kind in self.KINDS:
+            h = self.histograms[kind]
+            if h.total:
+                lines.append('  {:<7} {:>6} events  '.format(kind, h.total) + '  '.join(
+                    'p{} {:.1f}'.format(p, h.percentile(p) / 1000) for p in self.PERCENTILES)
+                    + '  max {:.1f}'.format(h.max / 1000))
+        if len(lines) == 1:
+            lines.append('  no inputs')
+        return '\n'.join(lines)
+
+
+class Histogram:
+    '''
+    HDR-style histogram. Records non-negative integer values (e.g. microseconds) into
+    log-linear buckets, so every bucket has a relative width below 1/64 whatever the magnitude.
+    '''
+    SUB_BITS = 7  # Values below 2**SUB_BITS are recorded exactly
+
+    def __init__(self):
+        '''
+        Constructor method. Creates an empty histogram.
+        '''
+        self.counts = {}  # Bucket index -> number of recorded values
+        self.total = 0
+        self.max = 0
+
+    def record(self, value):
+        '''
+        Records a value.
+
+        Parameters:
+        - value (int or float): The value to record. Negative values are clamped to 0.
+
+        Returns:
+        None
+        '''
+        value = max(0, int(value))
+        shift = value.bit_length() - self.SUB_BITS
+        if shift <= 0:
+            index = value
+        else:
+            index = (shift << (self.SUB_BITS - 1)) + (value >> shift)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.total += 1
+        if value > self.max:
+            self.max = value
+
+    def bucket_value(self, index):
+        '''
+        Returns the lowest value that falls into a bucket.
+
+        Parameters:
+        - index (int): The bucket index.
+
+        Returns:
+        - int: The lowest value of the bucket.
+        '''
+        if index < 1 << self.SUB_BITS:
+            return index
+        shift = (index >> (self.SUB_BITS - 1)) - 1
+        return (index - (shift << (self.SUB_BITS - 1))) << shift
+
+    def percentile(self, p):
+        '''
+        Returns the value below which p percent of the recorded values fall.
+
+        Parameters:
+        - p (float): The percentile, between 0 and 100.
+
+        Returns:
+        - int: The percentile value (0 if nothing was recorded).
+        '''
+        if self.total == 0:
+            return 0
+        rank = max(1, math.ceil(self.total * p / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return self.bucket_value(index)
+        return self.max
+
+    def to_dict(self):
+        '''
+        Serializes the histogram. Buckets are keyed by their lowest value, so readers
+        don't need to know the bucketing scheme.
+
+        Returns:
+        - dict: The serialized histogram.
+        '''
+        return {'counts': {str(self.bucket_value(i)): c for i, c in sorted(self.counts.items())},
+                'total': self.total, 'max': self.max}
+
+
+class Telemetry:
+    '''
+    Collects frame-time and per-phase histograms (in microseconds) and entity-count gauges
+    for Manager.process. Safe to flush from a background thread.
+    '''
+    # mission runs within timers and prefetch off the main thread;
+    # latency is input-to-display time, recorded by a LatencyProbe
+    PHASES = ('events', 'timers', 'move', 'collide', 'draw', 'mission', 'prefetch', 'latency')
+
+    def __init__(self, build=TELEMETRY_BUILD):
+        '''
+        Constructor method.
+
+        Parameters:
+        - build (str): Label stored with every flushed record. Default is TELEMETRY_BUILD.
+        '''
+        self.build = build
+        self.lock = threading.Lock()
+        self.last_frame = None  # perf_counter() value of the previous frame
+        self.reset()
+
+    def reset(self):
+        '''
+        Starts a new interval with empty histograms and gauges.
+        '''
+        self.histograms = {'frame': Histogram()}
+        for phase in self.PHASES:
+            self.histograms[phase] = Histogram()
+        self.gauges = {}
+        self.started = time.time()
+
+    def frame(self):
+        '''
+        Marks the start of a frame and records the time elapsed since the previous one.
+        '''
+        now = time.perf_counter()
+        if self.last_frame is not None:
+            self.record('frame', now - self.last_frame)
+        self.last_frame = now
+
+    def record(self, name, seconds):
+        '''
+        Records a duration.
+
+        Parameters:
+        - name (str): Name of the histogram ('frame' or one of PHASES).
+        - seconds (float): The duration in seconds.
+        '''
+        with self.lock:
+            self.histograms[name].record(seconds * 1e6)
+
+    def gauge(self, name, value):
+        '''
+        Updates an entity-count gauge. The last and the maximum value of the interval are kept.
+
+        Parameters:
+        - name (str): Name of the gauge.
+        - value (int): Current value.
+        '''
+        with self.lock:
+            last, peak = self.gauges.get(name, (value, value))
+            self.gauges[name] = (value, max(peak, value))
+
+    def flush(self):
+        '''
+        Returns the data of the current interval and starts a new one.
+
+        Returns:
+        - dict: Record with build label, interval bounds, histograms and gauges.
+        '''
+        with self.lock:
+            record = {'build': self.build, 'start': self.started, 'end': time.time(),
+                      'histograms': {name: h.to_dict() for name, h in self.histograms.items()},
+                      'gauges': {name: {'last': last, 'max': peak} for name, (last, peak) in self.gauges.items()}}
+            self.reset()
+        return record
+
+
+class TelemetryWriter(threading.Thread):
+    '''
+    Background thread that periodically flushes a Telemetry object to disk, either as
+    a rotating JSON-lines file or as a Prometheus text file.
+    '''
+
+    def __init__(self, telemetry, path, fmt='jsonl', interval=10.0, max_bytes=5 * 2**20, backups=5):
+        '''
+        Constructor method.
+
+        Parameters:
+        - telemetry (Telemetry): The telemetry to flush.
+        - path (str): Output file.
+        - fmt (str): 'jsonl' or 'prom'. Default is 'jsonl'.
+        - interval (float): Seconds between flushes. Default is 10.
+        - max_bytes (int): Size after which a JSON-lines file is rotated. Default is 5 MiB.
+        - backups (int): Number of rotated files to keep (path.1 ... path.N). Default is 5.
+        '''
+        super().__init__(daemon=True)
+        self.telemetry = telemetry
+        self.path = path
+        self.fmt = fmt
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.stopped = threading.Event()
+        self.totals = {}  # Cumulative histograms for the Prometheus format
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write(self.telemetry.flush())
+
+    def stop(self):
+        '''
+        Stops the thread and writes the last, partial interval.
+        '''
+        self.stopped.set()
+        self.join()
+        self.write(self.telemetry.flush())
+
+    def write(self, record):
+        '''
+        Writes one flushed record in the configured format.
+
+        Parameters:
+        - record (dict): Record returned by Telemetry.flush().
+        '''
+        if self.fmt == 'prom':
+            self.write_prometheus(record)
+            return
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+            self.rotate()
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+    def rotate(self):
+        '''
+        Renames path.N-1 to path.N, ..., path to path.1, dropping the oldest file.
+        '''
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists('{}.{}'.format(self.path, i)):
+                os.replace('{}.{}'.format(self.path, i), '{}.{}'.format(self.path, i + 1))
+        os.replace(self.path, self.path + '.1')
+
+    def write_prometheus(self, record):
+        '''
+        Merges the record into cumulative histograms and rewrites the Prometheus text file atomically.
+
+        Parameters:
+        - record (dict): Record returned by Telemetry.flush().
+        '''
+        for name, hist in record['histograms'].items():
+            total = self.totals.setdefault(name, {})
+            for value, count in hist['counts'].items():
+                total[int(value)] = total.get(int(value), 0) + count
+        lines = ['# TYPE cannon_time_us summary']
+        for name, counts in sorted(self.totals.items()):
+            n = sum(counts.values())
+            for q in (0.5, 0.9, 0.99, 0.999):
+                seen = 0
+                for value in sorted(counts):
+                    seen += counts[value]
+                    if seen >= n * q:
+                        break
+                else:
+                    value = 0
+                lines.append('cannon_time_us{{build="{}",phase="{}",quantile="{}"}} {}'.format(
+                    record['build'], name, q, value))
+            lines.append('cannon_time_us_count{{build="{}",phase="{}"}} {}'.format(record['build'], name, n))
+        lines.append('# TYPE cannon_entities gauge')
+        for name, gauge in sorted(record['gauges'].items()):
+            lines.append('cannon_entities{{build="{}",kind="{}"}} {}'.format(record['build'], name, gauge['last']))
+        with open(self.path + '.tmp', 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(self.path + '.tmp', self.path)
+
+
+class AllocationProfiler:
+    '''
+    Opt-in allocation profiling with tracemalloc. Records the memory every Manager phase retains
+    (net) and its temporaries' high-water mark (peak) per tick, and every few ticks snapshots the
+    heap to attribute retained memory to the class whose code allocated it and to find allocation
+    sites that keep growing.
+    '''
+
+    def __init__(self, every=100, frames=16, top=10):
+        '''
+        Constructor method.
+
+        Parameters:
+        - every (int): Ticks between heap snapshots. Default is 100.
+        - frames (int): Stack frames stored per allocation. Default is 16.
+        - top (int): Number of leak suspects and owners in the report. Default is 10.
+        '''
+        self.every = every
+        self.frames = frames
+        self.top = top
+        self.ticks = 0
+        self.phases = {}  # Phase -> [calls, net bytes, peak bytes, largest peak]
+        self.current = 0  # Traced memory at the last mark()
+        self.sites = []  # Per snapshot: {(filename, lineno): (bytes, blocks)}
+        self.owners = {}  # Class or function -> [bytes, blocks] in the last snapshot
+        self.first_owners = None
+        self.spans = self.code_spans()
+
+    @staticmethod
+    def code_spans():
+        '''
+        Returns the line ranges of the module's top-level classes and functions.
+
+        Returns:
+        - list: Sorted (first line, last line, name) tuples.
+        '''
+        with open(__file__) as f:
+            tree = ast.parse(f.read())
+        return sorted((node.lineno, node.end_lineno, node.name) for node in tree.body
+                      if isinstance(node, (ast.ClassDef, ast.FunctionDef)))
+
+    def owner(self, traceback):
+        '''
+        Returns the class or function of this module that made an allocation, looking from the
+        innermost frame outwards, or '<other>' if no frame is in this module.
+        '''
+        for frame in reversed(traceback):
+            if frame.filename == __file__:
+                i = bisect.bisect_right(self.spans, (frame.lineno, float('inf'))) - 1
+                if i >= 0 and self.spans[i][0] <= frame.lineno <= self.spans[i][1]:
+                    return self.spans[i][2]
+                return '<module>'
+        return '<other>'
+
+    def start(self):
+        '''
+        Starts tracing allocations.
+        '''
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        self.snapshot()
+        self.mark()
+
+    def stop(self):
+        '''
+        Takes a last heap snapshot and stops tracing.
+        '''
+        self.snapshot()
+        tracemalloc.stop()
+
+    def mark(self):
+        '''
+        Marks the start of a phase.
+        '''
+        tracemalloc.reset_peak()
+        self.current = tracemalloc.get_traced_memory()[0]
+
+    def lap(self, phase):
+        '''
+        Records the memory retained and the peak of temporaries since the last mark and marks the next phase.
+
+        Parameters:
+        - phase (str): Name of the phase that ended.
+        '''
+        current, peak = tracemalloc.get_traced_memory()
+        stats = self.phases.setdefault(phase, [0, 0, 0, 0])
+        stats[0] += 1
+        stats[1] += current - self.current
+        stats[2] += peak - self.current
+        stats[3] = max(stats[3], peak - self.current)
+        self.mark()
+
+    def tick(self):
+        '''
+        Counts a simulated tick and snapshots the heap every few ticks.
+        '''
+        self.ticks += 1
+        if self.ticks % self.every == 0:
+            self.snapshot()
+            self.mark()
+
+    def snapshot(self):
+        '''
+        Snapshots the heap and sums it up per allocation site and per owning class.
+        '''
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, '<frozen *>')])
+        sites = {}
+        owners = {}
+        for stat in snapshot.statistics('traceback'):
+            owner = self.owner(stat.traceback)
+            if owner == type(self).__name__:
+                continue  # The profiler's own bookkeeping
+            frame = stat.traceback[-1]
+            size, count = sites.get((frame.filename, frame.lineno), (0, 0))
+            sites[(frame.filename, frame.lineno)] = (size + stat.size, count + stat.count)
+            total = owners.setdefault(owner, [0, 0])
+            total[0] += stat.size
+            total[1] += stat.count
+        self.sites.append(sites)
+        self.owners = owners
+        if self.first_owners is None:
+            self.first_owners = owners
+
+    def suspects(self):
+        '''
+        Finds the allocation sites whose retained memory grew the most over the run, among those
+        that grew in at least half of the snapshot intervals (one-off growth like lazy imports
+        and caches filling up isn't a leak).
+
+        Returns:
+        - list: (site, bytes grown, blocks grown, intervals with growth) tuples, largest growth first.
+        '''
+        if len(self.sites) < 2:
+            return []
+        first, last = self.sites[0], self.sites[-1]
+        suspects = []
+        for site, (size, count) in last.items():
+            size0, count0 = first.get(site, (0, 0))
+            if size <= size0:
+                continue
+            grew = sum(b.get(site, (0, 0))[0] > a.get(site, (0, 0))[0] for a, b in zip(self.sites, self.sites[1:]))
+            if 2 * grew >= len(self.sites) - 1:
+                suspects.append((site, size - size0, count - count0, grew))
+        suspects.sort(key=lambda suspect: -suspect[1])
+        return suspects[:self.top]
+
+    def report(self):
+        '''
+        Formats the per-phase allocation rates, the retained memory per owner and the leak suspects.
+
+        Returns:
+        - str: The report.
+        '''
+        lines = ['Allocations over {} ticks in KiB (net: retained, peak: temporaries high-water)'.format(self.ticks),
+                 '{:<10}{:>8}{:>12}{:>12}{:>12}'.format('phase', 'calls', 'net/tick', 'peak/tick', 'max peak')]
+        for phase, (calls, net, peak, worst) in self.phases.items():
+            ticks = max(1, self.ticks)
+            lines.append('{:<10}{:>8}{:>12.2f}{:>12.2f}{:>12.1f}'.format(
+                phase, calls, net / ticks / 1024, peak / ticks / 1024, worst / 1024))
+        lines.append('')
+        lines.append('Retained memory by owner in KiB')
+        lines.append('{:<24}{:>12}{:>12}{:>10}'.format('owner', 'size', 'growth', 'blocks'))
+        first = self.first_owners or {}
+        for name, (size, count) in sorted(self.owners.items(), key=lambda item: -item[1][0])[:self.top]:
+            lines.append('{:<24}{:>12.1f}{:>+12.1f}{:>10}'.format(
+                name, size / 1024, (size - first.get(name, [0])[0]) / 1024, count))
+        lines.append('')
+        lines.append('Top leak suspects over {} snapshots'.format(len(self.sites)))
+        for (filename, lineno), size, count, grew in self.suspects():
+            lines.append('{}:{} {:+.1f} KiB {:+d} blocks, grew in {}/{} intervals: {}'.format(
+                os.path.basename(filename), lineno, size / 1024, count, grew, len(self.sites) - 1,
+                linecache.getline(filename, lineno).strip()))
+        return '\n'.join(lines)
+
+
+def build_wave(n_targets, score, seed):
+    '''
+    Builds the targets of a mission and the hierarchy over them. It only reads its arguments,
+    so it can run on a background thread. The Manager schedules the targets' bomb drops.
+
+    Parameters:
+    - n_targets (int): Number of targets of each type.
+    - score (int): The current score. Higher scores make smaller targets.
+    - seed (int): Seed of the random.Random the targets are drawn from.
+
+    Returns:
+    - tuple: (list of targets, TargetBVH over them).
+    '''
+    rng = random.Random(seed)
+    low = max(1, 30 - 2 * max(0, score))
+    high = max(low, 30 - max(0, score))  # From a score of 30 on, targets stay at the smallest size
+    targets = []
+    for i in range(n_targets):
+        targets.append(MovingCircleTarget(rad=rng.randint(low, high), rng=rng))
+        targets.append(MovingEllipseTarget(rad=rng.randint(low, high), rng=rng))
+        targets.append(CircleTarget(rad=rng.randint(low, high), rng=rng))
+        targets.append(EllipseTarget(rad=rng.randint(low, high), rng=rng))
+        targets.append(RectangleTarget(coord=[rng.randint(200, WORLD_SIZE[0] - 200), rng.randint(200, WORLD_SIZE[1] - 200)],
+                                       color=rand_color(rng), width=rng.randint(low, high), height=rng.randint(low, high),
+                                       rng=rng))
+        targets.append(MovingRectangleTarget(coord=[rng.randint(200, WORLD_SIZE[0] - 200), rng.randint(200, WORLD_SIZE[1] - 200)],
+                                             color=rand_color(rng), width=rng.randint(low, high),
+                                             height=rng.randint(low, high), rng=rng))
+        targets.append(PolygonTarget(coord=[rng.randint(100, WORLD_SIZE[0] - 100), rng.randint(100, WORLD_SIZE[1] - 100)],
+                                     color=rand_color(rng), sides=5, size=25, rng=rng))
+        targets.append(MovingPolygonTarget(coord=[rng.randint(100, WORLD_SIZE[0] - 100), rng.randint(100, WORLD_SIZE[1] - 100)],
+                                           color=rand_color(rng), sides=5, size=25, rng=rng))
+    return targets, TargetBVH(targets)
+
+
+class MissionBuilder(threading.Thread):
+    '''
+    Background thread that builds the next mission with build_wave() while the current one ends,
+    so Manager.new_mission only swaps the finished targets in. A mission is identified by its
+    build_wave() arguments; if they changed since it was requested (e.g. a shot changed the
+    score), the Manager builds it on the main thread instead. Either way the result is the same.
+    '''
+
+    def __init__(self):
+        '''
+        Constructor method. Starts the thread.
+        '''
+        super().__init__(daemon=True)
+        self.cond = threading.Condition()
+        self.wanted = None  # build_wave() arguments of the requested mission
+        self.key = None  # build_wave() arguments of the finished mission
+        self.wave = None
+        self.seconds = 0.0  # Build time of the finished mission
+        self.built = 0
+        self.used = 0
+        self.missed = 0
+        self.build_seconds = 0.0  # Total time spent building off the main thread
+        self.wait_seconds = 0.0  # Total time the main thread waited for unfinished missions
+        self.start()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.wanted is None or self.wanted == self.key:
+                    self.cond.wait()
+                key = self.wanted
+            start = time.perf_counter()
+            wave = build_wave(*key)
+            seconds = time.perf_counter() - start
+            with self.cond:
+                self.key, self.wave, self.seconds = key, wave, seconds
+                self.built += 1
+                self.build_seconds += seconds
+                self.cond.notify_all()
+
+    def prepare(self, key):
+        '''
+        Requests a mission, replacing any earlier request. Returns at once.
+
+        Parameters:
+        - key (tuple): The build_wave() arguments.
+        '''
+        with self.cond:
+            if key != self.wanted:
+                self.wanted = key
+                self.cond.notify_all()
+
+    def take(self, key):
+        '''
+        Hands over the requested mission, waiting for the thread if it isn't finished yet.
+
+        Parameters:
+        - key (tuple): The build_wave() arguments the mission must have been built with.
+
+        Returns:
+        - tuple or None: The result of build_wave(), None if a different mission was requested.
+        '''
+        with self.cond:
+            if key != self.wanted:
+                self.missed += 1
+                return None
+            start = time.perf_counter()
+            while self.key != key:
+                self.cond.wait()
+            self.wait_seconds += time.perf_counter() - start
+            wave = self.wave
+            self.wanted = self.key = self.wave = None
+            self.used += 1
+            return wave
+
+    def report(self):
+        '''
+        Returns a summary of the prefetched missions.
+
+        Returns:
+        - str: The summary.
+        '''
+        return ('Missions built in the background: {}, used: {}, rebuilt on the main thread: {}, '
+                'background time: {:.1f} ms, main thread waited: {:.1f} ms').format(
+                    self.built, self.used, self.missed, self.build_seconds * 1000, self.wait_seconds * 1000)
+
+
+class Manager:
+    '''
+    Class that manages events' handling, ball's motion and collision, target creation, etc.
+
+    Constructor method. Initializes the Manager with the specified number of targets and other objects.
+
+        Parameters:
+        - n_targets (int): The number of targets to create. Default is 1.
+        - telemetry (Telemetry or None): Collects frame-time histograms if given. Default is None.
+        - physics (PhysicsModel or None): Shell physics. Default is None (a PhysicsModel matching CircleShell.move).
+        - rollback (int): Number of past tick states kept for resimulate(). Default is 0 (none).
+    '''
+    # Components of the shell store. Circle shells have size (0, 0); owner is the index of the firing tank;
+    # serial is the number of shells fired or split off before, which orders shells independently of their rows;
+    # split is the number of generations of submunitions a cluster shell still bursts into;
+    # submunitions pass through each other and through bombs, so a burst doesn't start hundreds of contacts
+    SHELL_COMPONENTS = {'coord': ((2,), float), 'vel': ((2,), float), 'rad': ((), float),
+                        'size': ((2,), float), 'color': ((3,), int), 'owner': ((), int), 'serial': ((), int),
+                        'split': ((), int), 'submunition': ((), bool)}
+
+    def __init__(self, n_targets=1, telemetry=None, physics=None, rollback=0):
+        self.telemetry = telemetry
+        if physics is None:
+            physics = PhysicsModel()
+        self.physics = physics
+        self.balls = EntityStore(self.SHELL_COMPONENTS)
+        self.gun = [Tank(coord=[WORLD_SIZE[0] - 100, WORLD_SIZE[1] - 30], color=RED),
+                    Tank2(coord=[100, WORLD_SIZE[1] - 30], color=BLUE)]
+        # Targets keep their per-type behavior; static targets sleep (awake is False) and aren't moved
+        self.targets = EntityStore({'object': ((), object), 'awake': ((), bool)})
+        self.targetBombs = BombPool()
+        self.score_t = ScoreTable()
+        self.particles = ParticleSystem()
+        self.terrain = Terrain()
+        self.broad_phase = SweepAndPrune()
+        self.target_index = TargetBVH()
+        self.quality = RenderQuality()  # Detail of this game's frames, lowered by the governor
+        self.governor = QualityGovernor(self.quality)
+        self.recorder = None  # SessionRecorder that captures the input of every tick
+        self.tracer = None  # TraceRecorder that captures the state after every tick
+        self.viewport = None  # Viewport that maps the mouse from window to view coordinates
+        self.camera = Camera()  # Part of the world drawn, following the active tank
+        self.active = 0  # Index of the tank that last moved, the one the camera follows
+        self.ticks = 0  # Simulation ticks run so far
+        self.next_serial = 0  # Serial of the next shell fired or split off
+        self.history = collections.deque(maxlen=rollback)  # snapshot() taken before each of the last ticks
+        self.n_targets = n_targets
+        self.missions = None  # MissionBuilder that builds the next mission in the background
+        self.profiler = None  # AllocationProfiler that attributes allocations to the phases
+        self.mission_seed = None  # Seed of the next mission, drawn once the last target is destroyed
+        self.timers = TimingWheel()  # Bomb drops, charge ticks and the next wave, fired by run_timers()
+        self.charging = [False, False]  # Whether a charge tick of each tank is scheduled
+        self.wave_pending = False  # Whether the next wave is scheduled
+        self.new_mission()
+
+    def snapshot(self):
+        '''
+        Captures the complete simulation state, including the random generators, so that
+        restore() followed by the same inputs reproduces the same ticks. Arrays are copied by
+        slice, objects are cloned and the terrain is shared until it changes, so a snapshot
+        costs about a tenth of a millisecond.
+
+        Returns:
+        - dict: The state. It shares no mutable objects with the Manager.
+        '''
+        return {'balls': self.balls.snapshot(), 'targets': self.targets.snapshot(),
+                'gun': [clone(gun) for gun in self.gun], 'bombs': self.targetBombs.snapshot(),
+                'particles': self.particles.snapshot(), 'physics': copy.copy(self.physics),
+                'score': {name: copy.copy(value) for name, value in vars(self.score_t).items() if name != 'font'},
+                'terrain': self.terrain.snapshot(), 'random': random.getstate(),
+                'ticks': self.ticks, 'n_targets': self.n_targets, 'mission_seed': self.mission_seed,
+                'active': self.active, 'timers': self.timers.snapshot(), 'charging': list(self.charging),
+                'wave_pending': self.wave_pending, 'next_serial': self.next_serial}
+
+    def restore(self, state):
+        '''
+        Restores a state captured by snapshot(). The state can be restored again later.
+
+        Parameters:
+        - state (dict): The state.
+
+        Returns:
+        - None
+        '''
+        self.balls.restore(state['balls'])
+        self.targets.restore(state['targets'])
+        self.gun = [clone(gun) for gun in state['gun']]
+        self.targetBombs.restore(state['bombs'])
+        self.particles.restore(state['particles'])
+        self.physics = copy.copy(state['physics'])
+        for name, value in state['score'].items():
+            setattr(self.score_t, name, copy.copy(value))
+        self.terrain.restore(state['terrain'])
+        random.setstate(state['random'])
+        self.ticks = state['ticks']
+        self.n_targets = state['n_targets']
+        self.mission_seed = state.get('mission_seed')
+        self.active = state.get('active', 0)
+        self.next_serial = state.get('next_serial', self.score_t.b_used)  # Only shots had serials before cluster shells
+        if 'timers' in state:
+            self.timers.restore(state['timers'])
+            self.charging = list(state['charging'])
+            self.wave_pending = state['wave_pending']
+        else:
+            self.timers = TimingWheel()
+            self.charging = [False, False]
+            self.wave_pending = False
+        self.target_index.build(self.targets['object'])
+
+    def resimulate(self, from_tick, inputs):
+        '''
+        Rolls back to the state before tick from_tick and replays the given inputs at full speed
+        without drawing, e.g. when a late remote input turns out to differ from the predicted one.
+
+        Parameters:
+        - from_tick (int): Tick to roll back to. It must still be in the rollback buffer.
+        - inputs (list): One input per tick from from_tick on, in the format of SessionRecorder.encode().
+
+        Returns:
+        - bool: Indicates whether the game is done or not.
+        '''
+        if not self.history or not self.history[0]['ticks'] <= from_tick <= self.history[-1]['ticks']:
+            raise ValueError('Tick {} is not in the rollback buffer'.format(from_tick))
+        while self.history[-1]['ticks'] > from_tick:
+            self.history.pop()
+        self.restore(self.history.pop())  # tick() saves it again
+        if self.recorder is not None:
+            self.recorder.truncate(from_tick)
+        if self.tracer is not None:
+            self.tracer.truncate(from_tick)
+        done = False
+        for encoded in inputs:
+            done = self.tick(*SessionRecorder.decode(encoded)) or done
+        return done
+
+    def entity_state(self):
+        '''
+        Describes the simulation state entity by entity, for comparing two engines.
+        Shells are keyed by firing order and targets by row, so the keys don't depend on storage.
+
+        Returns:
+        - dict: Entity key, e.g. ('shell', 3), -> tuple of numbers.
+        '''
+        state = {('tank', i): (gun.coord[0], gun.coord[1], gun.angle, gun.pow, gun.hp) for i, gun in enumerate(self.gun)}
+        state.update(self.shell_state())
+        for i, target in enumerate(self.targets['object']):
+            state[('target', i)] = tuple(target.coord)
+        bombs = self.targetBombs
+        for i, coord, speed in zip(bombs.ids[:bombs.count].tolist(), bombs.coord[:bombs.count].tolist(),
+                                   bombs.speed[:bombs.count].tolist()):
+            state[('bomb', i)] = (coord[0], coord[1], speed)
+        score = self.score_t
+        state[('score', 0)] = (score.t_destr, score.b_used, score.bomb_hits, *score.tank_hits, *score.tank_destr)
+        state[('world', 0)] = (self.ticks, self.physics.wind, zlib.crc32(self.terrain.solid.tobytes()), len(self.timers))
+        particles = self.particles
+        state[('particles', 0)] = (particles.count, float(particles.pos[:particles.count].sum()))
+        return state
+
+    def shell_state(self):
+        '''
+        Returns the part of entity_state() that describes the shells.
+        '''
+        balls = self.balls
+        return {('shell', serial): tuple(coord + vel) for serial, coord, vel in
+                zip(balls['serial'].tolist(), balls['coord'].tolist(), balls['vel'].tolist())}
+
+    def add_ball(self, ball):
+        '''
+        Adds a shell fired by a tank and counts it in the score table. The shot is lost if
+        MAX_SHELLS shells are alive.
+
+        Parameters:
+        - ball (CircleShell or EllipseShell): The shell, as returned by strike().
+
+        Returns:
+        - int or None: Handle of the shell, None if it was lost.
+        '''
+        if len(self.balls) >= MAX_SHELLS:
+            return None
+        handle = self.balls.spawn(coord=ball.coord, vel=ball.vel, rad=ball.rad, size=getattr(ball, 'size', (0, 0)),
+                                  color=ball.color, owner=self.gun.index(ball.owner) if ball.owner in self.gun else -1,
+                                  serial=self.next_serial, split=getattr(ball, 'split', 0), submunition=False)
+        self.next_serial += 1
+        self.score_t.b_used += 1
+        return handle
+
+    def split_shells(self, coord, vel, color, owner, split):
+        '''
+        Spawns the submunitions of bursting cluster shells in one batch: each shell throws
+        cluster_fan() around its position, with one generation of splitting less. Submunitions
+        beyond MAX_SHELLS are dropped.
+
+        Parameters:
+        - coord, vel, color, owner, split (ndarray): Components of the bursting shells, in firing order.
+
+        Returns:
+        - ndarray: Handles of the submunitions.
+        '''
+        fan = cluster_fan()
+        k = len(fan)
+        n = min(len(coord) * k, MAX_SHELLS - len(self.balls))
+        if n <= 0:
+            return np.zeros(0, dtype=np.int64)
+        handles = self.balls.spawn_many(n, coord=np.repeat(coord, k, axis=0)[:n],
+                                        vel=(vel[:, np.newaxis] + fan).reshape(-1, 2)[:n], rad=CLUSTER_RAD, size=0,
+                                        color=np.repeat(color, k, axis=0)[:n], owner=np.repeat(owner, k)[:n],
+                                        serial=self.next_serial + np.arange(n), split=np.repeat(split - 1, k)[:n],
+                                        submunition=True)
+        self.next_serial += n
+        return handles
+
+    def add_target(self, target):
+        '''
+        Adds a target.
+
+        Parameters:
+        - target: The target object.
+
+        Returns:
+        - int: Handle of the target.
+        '''
+        return self.targets.spawn(object=target, awake=target.MOVING or bool(target.bombs))
+
+    def new_mission(self):
+        '''
+        Adds new targets, schedules their bomb drops and draws a new wind. The targets are taken
+        from the MissionBuilder if it has them ready.
+        '''
+        self.physics.new_wind()
+        key = self.mission_key()
+        self.mission_seed = None
+        wave = self.missions.take(key) if self.missions is not None else None
+        if wave is None:
+            wave = build_wave(*key)
+        elif self.telemetry is not None:
+            self.telemetry.record('prefetch', self.missions.seconds)
+        targets, self.target_index = wave
+        for target in targets:
+            self.targetBombs.adopt(target)  # Before add_target, so static targets start asleep
+            handle = self.add_target(target)
+            delay = 0
+            for i in range(3):
+                delay += random.randint(*BOMB_INTERVAL)
+                self.timers.schedule(delay, ('bomb', handle, i))
+
+    def mission_key(self):
+        '''
+        Returns the build_wave() arguments of the next mission, drawing its seed if needed.
+
+        Returns:
+        - tuple: (n_targets, score, seed).
+        '''
+        if self.mission_seed is None:
+            self.mission_seed = random.getrandbits(32)
+        return (self.n_targets, self.score_t.score(), self.mission_seed)
+
+    def process(self, events, screen):
+        '''
+        Runs all necessary methods for each iteration. Adds new targets if previous ones are destroyed.
+        
+        Parameters:
+        - events (list): List of pygame events.
+        - screen: The pygame screen object.
+
+        Returns:
+        - bool: Indicates whether the game is done or not.
+        '''
+        done = self.tick(events)
+        self.render(screen)
+        return done
+
+    def tick(self, events, keys=None, mouse_pos=None):
+        '''
+        Advances the simulation by one tick without drawing: handles events, moves and collides
+        all objects and adds new targets if previous ones are destroyed.
+
+        Parameters:
+        - events (list): List of pygame events.
+        - keys: Pressed keys, indexable by key constant. Default is None (keys and mouse are read from pygame).
+        - mouse_pos (tuple or None): Position the tanks aim at, None if the mouse is outside the window. Default is None.
+
+        Returns:
+        - bool: Indicates whether the game is done or not.
+        '''
+        start = self.begin()
+        if keys is None:
+            keys = pg.key.get_pressed()
+            mouse_pos = pg.mouse.get_pos() if pg.mouse.get_focused() else None
+            if mouse_pos is not None and self.viewport is not None:
+                mouse_pos = self.viewport.to_playfield(mouse_pos)
+            mouse_pos = self.camera.to_world(mouse_pos)  # Where the last frame drew the view
+        if self.history.maxlen:
+            self.history.append(self.snapshot())
+        if self.recorder is not None:
+            self.recorder.record(self, events, keys, mouse_pos)
+        done = self.handle_events(events, keys)
+
+        if mouse_pos is not None:
+            self.gun[0].set_angle(mouse_pos)
+            self.gun[1].set_angle(mouse_pos)
+        self.lap('events', start)
+        self.simulate()
+        return done
+
+    def simulate(self):
+        '''
+        Moves and collides all objects and adds new targets if previous ones are destroyed.
+        Doesn't touch pygame's event, keyboard or mouse state, so it also runs headless.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        '''
+        start = self.begin()
+        self.ticks += 1
+        self.run_timers()
+        start = self.lap('timers', start)
+        self.move()
+        start = self.lap('move', start)
+        self.collide()
+        start = self.lap('collide', start)
+
+        if len(self.targets) == 0 and not self.wave_pending:
+            # The seed is drawn on the tick the last target falls, with or without a MissionBuilder
+            key = self.mission_key()
+            if self.missions is not None:
+                # Build the next mission while the last shells settle; shots change the score and re-request it
+                self.missions.prepare(key)
+            if len(self.balls) == 0:
+                self.timers.schedule(WAVE_DELAY, ('wave',))
+                self.wave_pending = True
+
+        if self.telemetry is not None:
+            self.telemetry.gauge('balls', len(self.balls))
+            self.telemetry.gauge('targets', len(self.targets))
+            self.telemetry.gauge('bombs', self.targetBombs.count)
+            self.telemetry.gauge('particles', self.particles.count)
+        if self.profiler is not None:
+            self.profiler.tick()
+        if self.tracer is not None:
+            self.tracer.record(self)
+
+    def render(self, screen):
+        '''
+        Draws the current state, recording the frame and draw times if telemetry is enabled.
+
+        Parameters:
+        - screen: The pygame screen object.
+
+        Returns:
+        - None
+        '''
+        if self.telemetry is not None:
+            self.telemetry.frame()
+        start = self.begin()
+        self.draw(screen)
+        self.lap('draw', start)
+
+    def begin(self):
+        '''
+        Marks the start of the first phase of tick(), simulate() or render().
+
+        Returns:
+        - float: perf_counter() value to pass to lap().
+        '''
+        if self.profiler is not None:
+            self.profiler.mark()
+        return time.perf_counter()
+
+    def lap(self, phase, start):
+        '''
+        Records the time spent in a phase of tick() or render() if telemetry is enabled,
+        and its allocations if the allocation profiler is.
+
+        Parameters:
+        - phase (str): Name of the phase.
+        - start (float): perf_counter() value at the start of the phase.
+
+        Returns:
+        - float: perf_counter() value at the end of the phase.
+        '''
+        end = time.perf_counter()
+        if self.telemetry is not None:
+            self.telemetry.record(phase, end - start)
+        if self.profiler is not None:
+            self.profiler.lap(phase)
+        return end
+
+    def handle_events(self, events, keys=None):
+        '''
+        Handles events from the keyboard, mouse, etc.
+
+        Parameters:
+        - events (list): List of pygame events.
+        - keys: Pressed keys, indexable by key constant. Default is None (read from pygame).
+
+        Returns:
+        - bool: Indicates whether the game is done or not.
+        '''
+        done = False
+        if keys is None:
+            keys = pg.key.get_pressed()
+        if keys[pg.K_LEFT]:
+            self.gun[0].move_left(10)
+            # self.gun[1].move_left(10)
+            self.active = 0
+        elif keys[pg.K_RIGHT]:
+            self.gun[0].move_right(10)
+            # self.gun[1].move_right(10)
+            self.active = 0
+        for event in events:
+            if event.type == pg.QUIT:
+                done = True
+            elif event.type == pg.KEYDOWN:
+                if event.key == pg.K_LEFT:
+                    self.gun[0].move_left(10)
+                    # self.gun[1].move_left(10)
+                elif event.key == pg.K_RIGHT:
+                    self.gun[0].move_right(10)
+                    # self.gun[1].move_right(10)
+            elif event.type == pg.MOUSEBUTTONDOWN:
+                if event.button in (1, 3):
+                    self.charge(0)
+                    # self.charge(1)
+            elif event.type == pg.MOUSEBUTTONUP:
+                if event.button == 1:
+                    self.add_ball(self.gun[0].strike())
+                    # self.add_ball(self.gun[1].strike())
+                elif event.button == 3:
+                    self.add_ball(self.gun[0].strike(split=CLUSTER_DEPTH))
+
+        if keys[pg.K_a]:
+            # self.gun[0].move_left(10)
+            self.gun[1].move_left(10)
+            self.active = 1
+        elif keys[pg.K_d]:
+            # self.gun[0].move_right(10)
+            self.gun[1].move_right(10)
+            self.active = 1
+        for event in events:
+            if event.type == pg.QUIT:
+                done = True
+            elif event.type == pg.KEYDOWN:
+                if event.key == pg.K_a:
+                    # self.gun[0].move_left(10)
+                    self.gun[1].move_left(10)
+                elif event.key == pg.K_d:
+                    # self.gun[0].move_right(1)
+                    self.gun[1].move_right(10)
+            elif event.type == pg.MOUSEBUTTONDOWN:
+                if event.button in (1, 3):
+                    # self.charge(0)
+                    self.charge(1)
+            elif event.type == pg.MOUSEBUTTONUP:
+                if event.button == 1:
+                    # self.add_ball(self.gun[0].strike())
+                    self.add_ball(self.gun[1].strike())
+                elif event.button == 3:
+                    self.add_ball(self.gun[1].strike(split=CLUSTER_DEPTH))
+        return done
+
+
+    def draw(self, screen):
+        '''
+        Runs the drawing method for balls, guns, targets, and the score table. The camera follows
+        the active tank and only objects in its view are drawn: targets are found through the BVH,
+        shells, bombs and particles with one array test each. The score table stays in place.
+
+        Parameters:
+        - screen: The Canvas or DisplayList to draw on, or a surface, which is drawn on at scale 1.
+
+        Returns:
+        - None
+        '''
+        if isinstance(screen, pg.Surface):
+            screen = Canvas(screen)
+        quality = self.quality
+        quality.focus = [gun.coord for gun in self.gun]
+        camera = self.camera
+        camera.follow(self.gun[self.active].coord)
+        screen.span('terrain')
+        screen.view(camera.origin)
+        self.terrain.draw(screen)
+        screen.span('shells')
+        balls = self.balls
+        reach = np.maximum(balls['rad'], balls['size'].max(axis=1) / 2)
+        rows = np.flatnonzero(camera.visible(balls['coord'], reach))
+        for coord, rad, size, color in zip(balls['coord'][rows].tolist(), balls['rad'][rows].tolist(),
+                                           balls['size'][rows].tolist(), balls['color'][rows].tolist()):
+            if size[0]:
+                screen.ellipse(color, pg.Rect(coord[0] - size[0] / 2, coord[1] - size[1] / 2, size[0], size[1]))
+            else:
+                screen.circle(color, coord, rad)
+        screen.span('targets')
+        objects = self.targets['object']
+        for i in self.target_index.query_rows(camera.rect(margin=2)):
+            objects[i].draw(screen, quality)
+        screen.span('bombs')
+        self.targetBombs.draw(screen, camera, quality)
+        screen.span('particles')
+        if quality.particles:
+            self.particles.draw(screen, camera)
+        screen.span('tanks')
+        self.gun[0].draw(screen, quality)
+        self.gun[1].draw(screen, quality)
+        screen.span('score')
+        screen.view((0, 0))
+        self.score_t.draw(screen)
+
+    def move(self):
+        '''
+        Runs the movement method for balls and guns, removes dead balls and lets balls and bombs
+        blast craters into the terrain. Tanks follow the terrain surface.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        '''
+        self.move_balls()
+        self.move_targets()
+        self.move_bombs()
+        self.particles.move(GRAV)
+        for gun in self.gun:
+            # Tanks rest on the highest ground under their body
+            gun.coord[1] = self.terrain.surface_y(gun.coord[0] - 20, gun.coord[0] + 20) - 18
+
+    def charge(self, i):
+        '''
+        Starts charging a tank's shot. Its power grows by one charge tick per tick until it fires.
+
+        Parameters:
+        - i (int): Index of the tank.
+
+        Returns:
+        - None
+        '''
+        self.gun[i].activate()
+        if not self.charging[i]:
+            self.timers.schedule(0, ('charge', i))
+            self.charging[i] = True
+
+    def run_timers(self):
+        '''
+        Advances the timing wheel by a tick and handles the events that are due, each with the
+        Manager method named after it, e.g. fire_bomb() for ('bomb', handle, i).
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        '''
+        for event in self.timers.advance():
+            getattr(self, 'fire_' + event[0])(*event[1:])
+
+    def fire_bomb(self, handle, i):
+        '''
+        Drops the i-th bomb of a target from where the target is now, unless it was destroyed.
+        '''
+        row = self.targets.index(handle)
+        if row is not None:
+            target = self.targets['object'][row]
+            target.drop_bomb(1, first=i)
+            self.targetBombs.adopt(target)
+
+    def fire_charge(self, i):
+        '''
+        Adds a charge tick to a tank's power, and schedules the next one while the tank charges.
+        '''
+        gun = self.gun[i]
+        gun.gain()
+        if gun.active:
+            self.timers.schedule(0, ('charge', i))
+        else:
+            self.charging[i] = False
+
+    def fire_wave(self):
+        '''
+        Starts the next mission.
+        '''
+        start = time.perf_counter()
+        self.wave_pending = False
+        self.new_mission()
+        if self.telemetry is not None:
+            self.telemetry.record('mission', time.perf_counter() - start)
+
+    def move_balls(self):
+        '''
+        Moves all shells, blasts craters where they hit the terrain, removes dead shells and
+        bursts cluster shells that reached the top of their flight. Impacts and bursts are handled
+        in firing order, so the result doesn't depend on the store's row order.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        '''
+        balls = self.balls
+        rising = balls['vel'][:, 1] < 0
+        alive = self.physics.integrate(balls['coord'], balls['vel'], balls['rad'], GRAV)
+        coord, rad = balls['coord'].tolist(), balls['rad'].tolist()
+        near = self.terrain.near_ground(balls['coord'], balls['rad'] / 2)
+        for i in np.argsort(balls['serial'], kind='stable').tolist():
+            if near[i] and self.terrain.collide(coord[i], rad[i] / 2):
+                # Shells explode when their core hits the ground
+                self.terrain.carve(coord[i], 2 * rad[i])
+                alive[i] = False
+        burst = np.flatnonzero(alive & rising & (balls['vel'][:, 1] >= 0) & (balls['split'] > 0))
+        burst = burst[np.argsort(balls['serial'][burst], kind='stable')]
+        parents = {name: balls[name][burst] for name in ('coord', 'vel', 'color', 'owner', 'split')}
+        alive[burst] = False
+        balls.remove(np.flatnonzero(~alive))
+        if len(burst):
+            self.split_shells(**parents)
+
+    def move_targets(self):
+        '''
+        Moves the awake targets and refits the BVH to them. Static targets sleep: their move() only
+        carries bombs, and the BombPool has taken those over, so they are skipped altogether.
+        They never need waking: fire_bomb() hands every new bomb to the BombPool at once, and
+        any contact with a shell destroys the target instead of moving it.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        '''
+        objects = self.targets['object']
+        awake = np.flatnonzero(self.targets['awake'])
+        for i in awake.tolist():
+            objects[i].move()
+        self.target_index.refit(moved=awake)
+
+    def move_bombs(self):
+        '''
+        Lets the bombs fall and blasts craters where they hit the terrain. Only bombs that reach
+        the heightmap under them are tested against the terrain mask.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        '''
+        bombs = self.targetBombs
+        bombs.move()
+        n = bombs.count
+        if n == 0:
+            return
+        coord = bombs.coord[:n]
+        width = WORLD_SIZE[0]
+        ground = self.terrain.height[np.clip(coord[:, 0].astype(int)[:, np.newaxis] + [-BombPool.RAD, 0, BombPool.RAD],
+                                             0, width - 1)].min(axis=1)
+        landed = np.zeros(n, dtype=bool)
+        for i in np.flatnonzero(coord[:, 1] + BombPool.RAD >= ground):
+            if self.terrain.collide(coord[i], BombPool.RAD):
+                self.terrain.carve(coord[i], 2 * BombPool.RAD)
+                landed[i] = True
+        if landed.any():
+            bombs.remove(landed)
+
+    def collide(self):
+        '''
+        Checks whether balls bump into targets, removes hit targets and spawns their explosions.
+
+        Parameters:
+        - None
+
+        Returns:
+        - list: The targets destroyed this tick.
+        '''
+        self.collide_dynamic()
+        self.hit_tanks()
+        return self.destroy_targets(self.hit_targets())
+
+    def hit_targets(self):
+        '''
+        Finds the targets hit by balls, testing each ball only against the candidates from the BVH,
+        which are found for all balls in one batched query.
+
+        Parameters:
+        - None
+
+        Returns:
+        - list: Rows of the hit targets in the target store, ascending.
+        '''
+        balls = self.balls
+        coord, rad = balls['coord'], balls['rad'][:, np.newaxis]
+        query, rows = self.target_index.query_pairs(np.hstack([coord - rad, coord + rad]))
+        objects = self.target_index.targets
+        coord, rad = coord.tolist(), rad[:, 0].tolist()
+        hits = set()
+        for i, row in zip(query.tolist(), rows.tolist()):
+            # A target hit by several balls is only destroyed once
+            if row not in hits and objects[row].check_collision(Body(coord[i], rad[i])):
+                hits.add(row)
+        return sorted(hits)
+
+    def destroy_targets(self, rows):
+        '''
+        Removes hit targets, scores them and spawns their explosions in row order.
+
+        Parameters:
+        - rows (list): Rows of the hit targets in the target store, ascending.
+
+        Returns:
+        - list: The destroyed targets, in row order.
+        '''
+        if not rows:
+            return []
+        objects = self.targets['object']
+        hits = [objects[i] for i in rows]
+        self.score_t.t_destr += len(hits)
+        self.targets.remove(rows)
+        self.target_index.remove(rows)
+        for target in hits:
+            self.particles.spawn(target.coord, target.color)
+        return hits
+
+    def query_radius(self, point, radius):
+        '''
+        Finds the targets near a point.
+
+        Parameters:
+        - point (list): The point as [x, y].
+        - radius (float): The search radius.
+
+        Returns:
+        - list: Pairs (target, distance), nearest first.
+        '''
+        return self.target_index.query_radius(point, radius)
+
+    def query_aabb(self, box):
+        '''
+        Finds the targets whose bounding boxes overlap a box.
+
+        Parameters:
+        - box (list): [left, top, right, bottom].
+
+        Returns:
+        - list: The overlapping targets.
+        '''
+        return self.target_index.query_aabb(box)
+
+    def raycast(self, origin, direction, max_dist=math.inf):
+        '''
+        Finds the first target along a ray, e.g. for aiming or trajectory previews.
+
+        Parameters:
+        - origin (list): Start of the ray.
+        - direction (list): Direction of the ray.
+        - max_dist (float): Length of the ray. Default is infinite.
+
+        Returns:
+        - tuple or None: (target, distance) of the first hit, or None.
+        '''
+        return self.target_index.raycast(origin, direction, max_dist)
+
+    def collide_dynamic(self):
+        '''
+        Bounces balls off each other and off falling bombs. Candidate pairs come from the
+        sweep-and-prune broad phase; contacts are resolved with the physics model's refl_ort restitution.
+        Submunitions of cluster shells take no part.
+
+        Parameters:
+        - None
+
+        Returns:
+        - list: The contact pairs resolved this tick, as (shell handle, shell handle or ('bomb', id)).
+        '''
+        bombs = self.targetBombs
+        balls = self.balls
+        rows = np.flatnonzero(~balls['submunition'])
+        n_balls = len(rows)
+        if n_balls == 0 or n_balls + bombs.count < 2:
+            return []
+        rows = rows[np.argsort(balls['serial'][rows], kind='stable')]  # Bodies are numbered in firing order, then bombs
+        keys = balls.handles()[rows].tolist() + [('bomb', i) for i in bombs.ids[:bombs.count].tolist()]
+        bomb_vel = bombs.speed[:bombs.count]
+        ball_coord, ball_vel = balls['coord'], balls['vel']
+        coord = np.concatenate([ball_coord[rows], bombs.coord[:bombs.count]])  # Positions before any contact is resolved
+        rad = np.concatenate([balls['rad'][rows], np.full(bombs.count, BombPool.RAD, dtype=float)])
+        rows = rows.tolist()
+        left, right = (coord[:, 0] - rad).tolist(), (coord[:, 0] + rad).tolist()
+        top, bottom = (coord[:, 1] - rad).tolist(), (coord[:, 1] + rad).tolist()
+        restitution = self.physics.refl_ort
+
+        contacts = []
+        for i, j in self.broad_phase.pairs(keys, left, right, top, bottom):
+            if i >= n_balls and j >= n_balls:
+                continue  # Bombs don't bounce off each other
+            if i >= n_balls:
+                i, j = j, i
+            normal = coord[j] - coord[i]
+            dist = math.hypot(normal[0], normal[1])
+            overlap = float(rad[i] + rad[j] - dist)
+            if overlap <= 0 or dist == 0:
+                continue
+            normal /= dist
+            a = rows[i]
+            vel_i = ball_vel[a].copy()
+            if j < n_balls:
+                b = rows[j]
+                vel_j = ball_vel[b].copy()
+                closing = np.dot(vel_j - vel_i, normal)
+                if closing < 0:
+                    impulse = (1 + restitution) * closing / 2
+                    ball_vel[a] = vel_i + impulse * normal
+                    ball_vel[b] = vel_j - impulse * normal
+                ball_coord[a] -= normal * overlap / 2
+                ball_coord[b] += normal * overlap / 2
+            else:
+                # Bombs are unaffected by balls: the ball alone rebounds off the falling bomb
+                closing = np.dot(np.array([0, bomb_vel[j - n_balls]]) - vel_i, normal)
+                if closing < 0:
+                    ball_vel[a] = vel_i + (1 + restitution) * closing * normal
+                ball_coord[a] -= normal * overlap
+            contacts.append((keys[i], keys[j]))
+        return contacts
+
+    def hit_tanks(self):
+        '''
+        Tests every ball and bomb against every tank in one vectorized pass, applies the damage,
+        removes what hit and records the hits in the score table. A ball can't hit the tank that fired it.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        '''
+        boxes = np.array([gun.hitbox() for gun in self.gun], dtype=float)
+        bombs = self.targetBombs
+        damage = np.zeros(len(self.gun), dtype=int)
+        balls = self.balls
+        if len(balls):
+            owner = balls['owner']
+            hit = circles_hit_boxes(balls['coord'], balls['rad'], boxes) & (owner[:, np.newaxis] != np.arange(len(self.gun)))
+            damage += SHELL_DAMAGE * hit.sum(axis=0)
+            spent = np.flatnonzero(hit.any(axis=1))
+            spent = spent[np.argsort(balls['serial'][spent], kind='stable')]  # Explosions in firing order
+            for i in spent.tolist():
+                self.score_t.tank_hits[owner[i]] += 1
+                self.particles.spawn(balls['coord'][i], tuple(balls['color'][i].tolist()), amount=30)
+            balls.remove(spent)
+        if bombs.count:
+            hit = circles_hit_boxes(bombs.coord[:bombs.count], np.full(bombs.count, BombPool.RAD), boxes)
+            damage += BOMB_DAMAGE * hit.sum(axis=0)
+            landed = hit.any(axis=1)
+            if landed.any():
+                self.score_t.bomb_hits += int(landed.sum())
+                for coord in bombs.coord[:bombs.count][landed]:
+                    self.particles.spawn(coord, GRAY, amount=30)
+                bombs.remove(landed)
+        for i, gun in enumerate(self.gun):
+            gun.hp -= int(damage[i])
+            if gun.hp <= 0:
+                self.score_t.tank_destr[i] += 1
+                gun.hp = gun.max_hp
+
+
+class CannonEnv:
+    '''
+    Gym-style environment around Manager for training firing agents. The agent aims and fires
+    the red tank; every step runs frame_skip headless simulation ticks.
+
+    Actions are (angle, power) tuples, or None to wait without firing. The reward is the change
+    of ScoreTable.score() plus the hits landed on the blue tank.
+    '''
+
+    def __init__(self, n_targets=1, obs='state', frame_skip=4, max_steps=500, max_targets=16,
+                 max_bombs=8, frame_size=(84, 84), physics=None):
+        '''
+        Constructor method.
+
+        Parameters:
+        - n_targets (int): Targets of each type per mission. Default is 1.
+        - obs (str): 'state' for a state vector or 'frame' for a downscaled RGB frame. Default is 'state'.
+        - frame_skip (int): Simulation ticks per step. Default is 4.
+        - max_steps (int): Steps per episode. Default is 500.
+        - max_targets (int): Targets included in the state vector. Default is 16.
+        - max_bombs (int): Bombs nearest to the tank included in the state vector. Default is 8.
+        - frame_size (tuple): Size of frame observations. Default is (84, 84).
+        - physics (dict or None): Keyword arguments for each episode's PhysicsModel. Default is None.
+        '''
+        self.n_targets = n_targets
+        self.obs = obs
+        self.frame_skip = frame_skip
+        self.max_steps = max_steps
+        self.max_targets = max_targets
+        self.max_bombs = max_bombs
+        self.frame_size = frame_size
+        self.physics = physics or {}
+        self.mgr = None
+        self.steps = 0
+        self.random_state = None  # State of the random module for this env's game, swapped in by step()
+        self.surface = pg.Surface(SCREEN_SIZE) if obs == 'frame' else None
+        self.obs_size = 9 + 4 * max_targets + 2 * max_bombs
+
+    def reset(self, seed=None):
+        '''
+        Starts a new episode. The game draws from its own random stream, so a seed reproduces
+        the whole episode even when other environments run in the same process.
+
+        Parameters:
+        - seed (int or None): Seed for the missions, bomb intervals and wind. Default is None (drawn at random).
+
+        Returns:
+        - ndarray: The first observation.
+        '''
+        if seed is None:
+            seed = random.getrandbits(64)
+        outer = random.getstate()
+        random.seed(seed)
+        self.mgr = Manager(n_targets=self.n_targets, physics=PhysicsModel(**self.physics))
+        self.random_state = random.getstate()
+        random.setstate(outer)
+        self.steps = 0
+        return self.observe()
+
+    def step(self, action):
+        '''
+        Fires (unless action is None) and advances the game by frame_skip ticks.
+
+        Parameters:
+        - action (tuple or None): (angle in radians, power) for the red tank.
+
+        Returns:
+        - tuple: (observation, reward, done, info).
+        '''
+        mgr = self.mgr
+        gun = mgr.gun[0]
+        before = mgr.score_t.score() + mgr.score_t.tank_hits[0]  # Before firing, so the shot's cost counts
+        outer = random.getstate()
+        random.setstate(self.random_state)  # The shell's color is drawn from it too
+        try:
+            if action is not None:
+                gun.angle = float(action[0])
+                gun.pow = min(max(float(action[1]), gun.min_pow), gun.max_pow)
+                mgr.add_ball(gun.strike())
+            for _ in range(self.frame_skip):
+                mgr.simulate()
+        finally:
+            self.random_state = random.getstate()
+            random.setstate(outer)
+        self.steps += 1
+        reward = mgr.score_t.score() + mgr.score_t.tank_hits[0] - before
+        info = {'score': mgr.score_t.score(), 'hp': gun.hp}
+        return self.observe(), reward, self.steps >= self.max_steps, info
+
+    def observe(self):
+        '''
+        Returns the current observation.
+
+        Returns:
+        - ndarray: float32 state vector, or uint8 frame of shape (height, width, 3).
+        '''
+        mgr = self.mgr
+        if self.obs == 'frame':
+            self.surface.fill(BLACK)
+            mgr.draw(self.surface)
+            small = pg.transform.smoothscale(self.surface, self.frame_size)
+            return pg.surfarray.array3d(small).transpose(1, 0, 2)
+        width, height = WORLD_SIZE
+        red, blue = mgr.gun
+        state = np.zeros(self.obs_size, dtype=np.float32)
+        state[:9] = (red.coord[0] / width, red.coord[1] / height, red.angle, red.pow / red.max_pow,
+                     red.hp / red.max_hp, blue.coord[0] / width, blue.coord[1] / height,
+                     blue.hp / blue.max_hp, mgr.physics.wind / 10)
+        for i, target in enumerate(mgr.targets['object'][:self.max_targets]):
+            box = target.aabb()
+            state[9 + 4 * i:13 + 4 * i] = (target.coord[0] / width, target.coord[1] / height,
+                                           (box[2] - box[0]) / width, 1)
+        bombs = mgr.targetBombs.coord[:mgr.targetBombs.count]
+        if len(bombs):
+            nearest = bombs[np.argsort(np.abs(bombs[:, 0] - red.coord[0]))[:self.max_bombs]] / WORLD_SIZE
+            offset = 9 + 4 * self.max_targets
+            state[offset:offset + 2 * len(nearest)] = nearest.ravel()
+        return state
+
+
+def env_worker(conn, n_envs, env_kwargs):
+    '''
+    Worker process of VectorCannonEnv. Hosts n_envs environments and answers
+    ('reset', seeds), ('step', actions) and ('close', None) commands sent over conn.
+
+    Parameters:
+    - conn: The worker's end of a multiprocessing Pipe.
+    - n_envs (int): Number of environments hosted by the worker.
+    - env_kwargs (dict): Keyword arguments for CannonEnv.
+    '''
+    envs = VectorCannonEnv(n_envs, **env_kwargs)
+    while True:
+        command, data = conn.recv()
+        if command == 'reset':
+            conn.send(envs.reset(data))
+        elif command == 'step':
+            conn.send(envs.step(data))
+        else:
+            conn.close()
+            return
+
+
+class VectorCannonEnv:
+    '''
+    Steps many CannonEnv instances in lockstep, either in this process or split across worker
+    processes. Episodes that end are reset automatically; the returned observation is then the
+    first one of the new episode and info['final_obs'] holds the last one of the old episode.
+    '''
+
+    def __init__(self, n_envs, workers=0, **env_kwargs):
+        '''
+        Constructor method.
+
+        Parameters:
+        - n_envs (int): Number of environments.
+        - workers (int): Worker processes to spread the environments over (0: run in this process). Default is 0.
+        - **env_kwargs: Keyword arguments for CannonEnv.
+        '''
+        self.n_envs = n_envs
+        self.envs = []
+        self.conns = []
+        self.procs = []
+        self.seeds = [None] * n_envs
+        if workers == 0:
+            self.envs = [CannonEnv(**env_kwargs) for _ in range(n_envs)]
+            return
+        self.split = np.array_split(np.arange(n_envs), workers)
+        for part in self.split:
+            conn, child = multiprocessing.Pipe()
+            proc = multiprocessing.Process(target=env_worker, args=(child, len(part), env_kwargs), daemon=True)
+            proc.start()
+            self.conns.append(conn)
+            self.procs.append(proc)
+
+    def reset(self, seed=None):
+        '''
+        Resets all environments. Environment i gets seed + i.
+
+        Parameters:
+        - seed (int, list or None): Base seed, or one seed per environment. Default is None.
+
+        Returns:
+        - ndarray: Stacked observations.
+        '''
+        if seed is None or isinstance(seed, (list, tuple)):
+            seeds = list(seed) if seed is not None else [None] * self.n_envs
+        else:
+            seeds = [seed + i for i in range(self.n_envs)]
+        if self.conns:
+            for conn, part in zip(self.conns, self.split):
+                conn.send(('reset', [seeds[i] for i in part]))
+            return np.concatenate([conn.recv() for conn in self.conns])
+        self.seeds = seeds
+        return np.stack([env.reset(s) for env, s in zip(self.envs, seeds)])
+
+    def step(self, actions):
+        '''
+        Steps all environments with one action each.
+
+        Parameters:
+        - actions (list): One action per environment (see CannonEnv.step).
+
+        Returns:
+        - tuple: (observations, rewards, dones, infos) with stacked arrays and a list of info dicts.
+        '''
+        if self.conns:
+            for conn, part in zip(self.conns, self.split):
+                conn.send(('step', [actions[i] for i in part]))
+            results = [conn.recv() for conn in self.conns]
+            return (np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results]),
+                    np.concatenate([r[2] for r in results]), sum([r[3] for r in results], []))
+        obs, rewards, dones, infos = [], [], [], []
+        for i, (env, action) in enumerate(zip(self.envs, actions)):
+            o, r, d, info = env.step(action)
+            if d:
+                info['final_obs'] = o
+                self.seeds[i] = None if self.seeds[i] is None else self.seeds[i] + self.n_envs
+                o = env.reset(self.seeds[i])
+            obs.append(o)
+            rewards.append(r)
+            dones.append(d)
+            infos.append(info)
+        return np.stack(obs), np.array(rewards, dtype=np.float32), np.array(dones), infos
+
+    def close(self):
+        '''
+        Stops the worker processes.
+        '''
+        for conn in self.conns:
+            conn.send(('close', None))
+        for proc in self.procs:
+            proc.join()
+        self.conns, self.procs = [], []
+
+
+class SessionRecorder:
+    '''
+    Records a session as the input of every tick plus periodic checkpoints of the full state.
+    Replaying the inputs from any checkpoint reproduces the session, which lets replay_export.py
+    render chunks between checkpoints independently.
+    '''
+    EVENTS = (pg.QUIT, pg.KEYDOWN, pg.MOUSEBUTTONDOWN, pg.MOUSEBUTTONUP)  # Events handle_events reacts to
+    KEYS = (pg.K_LEFT, pg.K_RIGHT, pg.K_a, pg.K_d)  # Keys handle_events polls
+
+    def __init__(self, checkpoint_every=150):
+        '''
+        Constructor method.
+
+        Parameters:
+        - checkpoint_every (int): Ticks between checkpoints. Default is 150 (10 s at FPS).
+        '''
+        self.checkpoint_every = checkpoint_every
+        self.start = None  # Tick of the first recorded input
+        self.inputs = []  # Encoded input of every tick from start on
+        self.checkpoints = {}  # Tick -> Manager.snapshot() taken before that tick's input
+
+    def record(self, mgr, events, keys, mouse_pos):
+        '''
+        Records the input of the tick the Manager is about to run, checkpointing first when due.
+
+        Parameters:
+        - mgr (Manager): The recorded game.
+        - events (list): The tick's pygame events.
+        - keys: The tick's pressed keys.
+        - mouse_pos (tuple or None): The tick's mouse position.
+
+        Returns:
+        None
+        '''
+        if self.start is None:
+            self.start = mgr.ticks
+        if (mgr.ticks - self.start) % self.checkpoint_every == 0:
+            self.checkpoints[mgr.ticks] = mgr.snapshot()
+        self.inputs.append(self.encode(events, keys, mouse_pos))
+
+    def truncate(self, tick):
+        '''
+        Forgets the inputs and checkpoints from a tick on, before a rollback records them again.
+
+        Parameters:
+        - tick (int): First tick to forget.
+
+        Returns:
+        None
+        '''
+        if self.start is None:
+            return
+        del self.inputs[max(0, tick - self.start):]
+        for checkpoint in [t for t in self.checkpoints if t >= tick]:
+            del self.checkpoints[checkpoint]
+
+    def encode(self, events, keys, mouse_pos):
+        '''
+        Converts a tick's input into plain, picklable values.
+
+        Returns:
+        - tuple: (events as (type, key, button) tuples, pressed keys, mouse position).
+        '''
+        return ([(e.type, getattr(e, 'key', None), getattr(e, 'button', None)) for e in events if e.type in self.EVENTS],
+                [key for key in self.KEYS if keys[key]],
+                None if mouse_pos is None else tuple(mouse_pos))
+
+    @staticmethod
+    def decode(encoded):
+        '''
+        Converts an encoded input back into arguments for Manager.tick.
+
+        Parameters:
+        - encoded (tuple): A value returned by encode().
+
+        Returns:
+        - tuple: (events, keys, mouse_pos).
+        '''
+        events, pressed, mouse_pos = encoded
+        events = [pg.event.Event(kind, {name: value for name, value in (('key', key), ('button', button))
+                                        if value is not None}) for kind, key, button in events]
+        return events, collections.defaultdict(bool, {key: True for key in pressed}), mouse_pos
+
+    def save(self, path):
+        '''
+        Writes the session to a gzip-compressed pickle file.
+
+        Parameters:
+        - path (str): Output file.
+        '''
+        with gzip.open(path, 'wb') as f:
+            pickle.dump({'start': self.start, 'inputs': self.inputs, 'checkpoints': self.checkpoints,
+                         'checkpoint_every': self.checkpoint_every}, f)
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Reads a session written by save().
+
+        Parameters:
+        - path (str): The session file.
+
+        Returns:
+        - SessionRecorder: The recorded session.
+        '''
+        with gzip.open(path, 'rb') as f:
+            data = pickle.load(f)
+        session = cls(data['checkpoint_every'])
+        session.start, session.inputs, session.checkpoints = data['start'], data['inputs'], data['checkpoints']
+        return session
+
+
+class TraceRecorder:
+    '''
+    Records the state after every tick into column files for offline analysis and training.
+    Every column is a raw np.memmap file, preallocated and doubled when full. Shells, targets and
+    bombs have a variable number of rows per tick: the ticks table holds the index of each tick's
+    first row in them, so any range of ticks is one contiguous slice of every column. Rows are
+    buffered and written in batches; meta.json, rewritten after every batch, says how many rows
+    are complete.
+    '''
+    # Table -> columns as (name, dtype, values per row)
+    TABLES = {'ticks': (('tick', 'i8', 1), ('shells', 'i8', 1), ('targets', 'i8', 1), ('bombs', 'i8', 1),
+                        ('wind', 'f8', 1), ('x', 'f8', 2), ('y', 'f8', 2), ('angle', 'f8', 2), ('pow', 'f8', 2),
+                        ('hp', 'f8', 2), ('t_destr', 'i8', 1), ('b_used', 'i8', 1), ('bomb_hits', 'i8', 1),
+                        ('tank_hits', 'i8', 2), ('tank_destr', 'i8', 2)),
+              'shells': (('serial', 'i8', 1), ('owner', 'i8', 1), ('coord', 'f8', 2), ('vel', 'f8', 2)),
+              'targets': (('handle', 'i8', 1), ('coord', 'f8', 2)),
+              'bombs': (('id', 'i8', 1), ('coord', 'f8', 2), ('speed', 'f8', 1))}
+    RAGGED = ('shells', 'targets', 'bombs')
+
+    def __init__(self, directory, batch=256, capacity=4096):
+        '''
+        Constructor method. Creates the column files, replacing an earlier trace in the directory.
+
+        Parameters:
+        - directory (str): Directory of the trace.
+        - batch (int): Ticks buffered before they are written. Default is 256.
+        - capacity (int): Initial rows per column file. Default is 4096.
+        '''
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.batch = batch
+        self.rows = {table: 0 for table in self.TABLES}  # Rows written to the files
+        self.capacity = {table: 0 for table in self.TABLES}
+        self.columns = {table: {} for table in self.TABLES}  # Table -> column -> memmap
+        for table in self.TABLES:
+            self.grow(table, capacity)
+        self.pending = {table: [] for table in self.TABLES}  # Buffered rows: per tick, a dict of column arrays
+        self.next_row = {table: 0 for table in self.RAGGED}  # Rows written or buffered
+        self.write_meta()
+
+    def path(self, table, column):
+        '''
+        Returns the file of a column.
+        '''
+        return os.path.join(self.directory, '{}.{}.bin'.format(table, column))
+
+    def grow(self, table, capacity):
+        '''
+        Enlarges the column files of a table to a number of rows and maps them again.
+        '''
+        for name, dtype, width in self.TABLES[table]:
+            shape = (capacity,) if width == 1 else (capacity, width)
+            path = self.path(table, name)
+            self.columns[table].pop(name, None)  # Unmaps the old file
+            with open(path, 'r+b' if self.capacity[table] else 'w+b') as f:
+                f.truncate(capacity * width * np.dtype(dtype).itemsize)  # Sparse until written
+            self.columns[table][name] = np.memmap(path, dtype=dtype, mode='r+', shape=shape)
+        self.capacity[table] = capacity
+
+    def record(self, mgr):
+        '''
+        Buffers the state of a Manager after a tick, writing the batch when it is full.
+
+        Parameters:
+        - mgr (Manager): The recorded game.
+
+        Returns:
+        None
+        '''
+        balls, targets, bombs = mgr.balls, mgr.targets, mgr.targetBombs
+        n = bombs.count
+        rows = {'shells': {'serial': balls['serial'].copy(), 'owner': balls['owner'].copy(),
+                           'coord': balls['coord'].copy(), 'vel': balls['vel'].copy()},
+                'targets': {'handle': targets.handles(),
+                            'coord': np.array([target.coord for target in targets['object']], dtype=float).reshape(-1, 2)},
+                'bombs': {'id': bombs.ids[:n].copy(), 'coord': bombs.coord[:n].copy(), 'speed': bombs.speed[:n].copy()}}
+        score, gun = mgr.score_t, mgr.gun
+        tick = {'tick': mgr.ticks, 'wind': mgr.physics.wind,
+                'x': [g.coord[0] for g in gun], 'y': [g.coord[1] for g in gun], 'angle': [g.angle for g in gun],
+                'pow': [g.pow for g in gun], 'hp': [g.hp for g in gun], 't_destr': score.t_destr,
+                'b_used': score.b_used, 'bomb_hits': score.bomb_hits, 'tank_hits': score.tank_hits,
+                'tank_destr': score.tank_destr}
+        for table in self.RAGGED:
+            tick[table] = self.next_row[table]
+            self.next_row[table] += len(rows[table][self.TABLES[table][0][0]])
+            self.pending[table].append(rows[table])
+        self.pending['ticks'].append(tick)
+        if len(self.pending['ticks']) >= self.batch:
+            self.flush()
+
+    def flush(self):
+        '''
+        Writes the buffered ticks with one slice assignment per column and updates meta.json.
+        '''
+        if not self.pending['ticks']:
+            return
+        for table, batch in self.pending.items():
+            start = self.rows[table]
+            values = {name: np.concatenate([np.asarray(row[name], dtype=dtype).reshape(-1, width) for row in batch])
+                      for name, dtype, width in self.TABLES[table]}
+            count = len(next(iter(values.values())))
+            if start + count > self.capacity[table]:
+                self.grow(table, max(2 * self.capacity[table], start + count))
+            for name, dtype, width in self.TABLES[table]:
+                column = self.columns[table][name]
+                column[start:start + count] = values[name] if width > 1 else values[name][:, 0]
+            self.rows[table] = start + count
+            batch.clear()
+        self.write_meta()
+
+    def write_meta(self):
+        '''
+        Replaces meta.json, the index readers rely on, in one step.
+        '''
+        meta = {'tables': {table: {'rows': self.rows[table],
+                                   'columns': [[name, dtype, width] for name, dtype, width in columns]}
+                           for table, columns in self.TABLES.items()}}
+        path = os.path.join(self.directory, 'meta.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(path + '.tmp', path)
+
+    def truncate(self, tick):
+        '''
+        Forgets the states recorded after a tick, before a rollback records them again.
+
+        Parameters:
+        - tick (int): Last tick to keep.
+
+        Returns:
+        None
+        '''
+        self.flush()
+        ticks = self.columns['ticks']['tick'][:self.rows['ticks']]
+        keep = int(np.searchsorted(ticks, tick, side='right'))
+        if keep == self.rows['ticks']:
+            return
+        for table in self.RAGGED:
+            self.rows[table] = self.next_row[table] = int(self.columns['ticks'][table][keep])
+        self.rows['ticks'] = keep
+        self.write_meta()
+
+    def close(self):
+        '''
+        Writes the buffered ticks and trims the files to the rows written.
+        '''
+        self.flush()
+        for table, columns in self.TABLES.items():
+            for name, dtype, width in columns:
+                self.columns[table][name].flush()
+                del self.columns[table][name]
+                with open(self.path(table, name), 'r+b') as f:
+                    f.truncate(self.rows[table] * width * np.dtype(dtype).itemsize)
+
+
+class TraceReader:
+    '''
+    Reads a trace written by TraceRecorder. Columns are read-only memmaps, so slicing a range
+    of ticks copies nothing; only meta.json is read up front.
+    '''
+
+    def __init__(self, directory):
+        '''
+        Constructor method.
+
+        Parameters:
+        - directory (str): Directory of the trace.
+        '''
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        self.columns = {}  # Table -> column -> array of the complete rows
+        for table, info in meta['tables'].items():
+            rows = info['rows']
+            self.columns[table] = {}
+            for name, dtype, width in info['columns']:
+                shape = (rows,) if width == 1 else (rows, width)
+                path = os.path.join(directory, '{}.{}.bin'.format(table, name))
+                # np.memmap can't map zero bytes
+                self.columns[table][name] = (np.memmap(path, dtype=dtype, mode='r', shape=shape) if rows
+                                             else np.zeros(shape, dtype=dtype))
+
+    def __len__(self):
+        return len(self.columns['ticks']['tick'])
+
+    def ticks(self, start=0, stop=None):
+        '''
+        Returns the per-tick columns (tanks, score, wind, ...) of a range of recorded ticks.
+
+        Parameters:
+        - start (int): First row, i.e. index among the recorded ticks. Default is 0.
+        - stop (int or None): Row after the last. Default is None (to the end).
+
+        Returns:
+        - dict: Column name -> array view.
+        '''
+        return {name: column[start:stop] for name, column in self.columns['ticks'].items()}
+
+    def rows(self, table, start=0, stop=None):
+        '''
+        Returns the shells, targets or bombs of a range of recorded ticks.
+
+        Parameters:
+        - table (str): 'shells', 'targets' or 'bombs'.
+        - start (int): First tick row. Default is 0.
+        - stop (int or None): Tick row after the last. Default is None (to the end).
+
+        Returns:
+        - tuple: (dict of column name -> array view, offsets) where the rows of tick row start + i
+          are offsets[i]:offsets[i + 1] of the columns.
+        '''
+        first = self.columns['ticks'][table]
+        start, stop, _ = slice(start, stop).indices(len(first))
+        total = len(next(iter(self.columns[table].values())))
+        lo = int(first[start]) if start < len(first) else total
+        hi = int(first[stop]) if stop < len(first) else total
+        offsets = np.append(first[start:stop], hi) - lo
+        return {name: column[lo:hi] for name, column in self.columns[table].items()}, offsets
+
+
+def render_chunk(task):
+    '''
+    Renders the frames of one chunk of a session onto an offscreen surface. Runs in a worker process.
+
+    Parameters:
+    - task (tuple): (checkpoint state, encoded inputs, first tick, output directory, 'png' or 'raw').
+
+    Returns:
+    - int: Number of frames rendered.
+    '''
+    state, inputs, first, out_dir, fmt = task
+    mgr = Manager(n_targets=state['n_targets'])
+    mgr.restore(state)
+    surface = pg.Surface(SCREEN_SIZE)
+    raw = open(os.path.join(out_dir, 'chunk_{:08d}.rgb'.format(first)), 'wb') if fmt == 'raw' else None
+    for i, encoded in enumerate(inputs):
+        mgr.tick(*SessionRecorder.decode(encoded))
+        surface.fill(BLACK)
+        mgr.draw(surface)
+        if raw is None:
+            pg.image.save(surface, os.path.join(out_dir, 'frame_{:06d}.png'.format(first + i)))
+        else:
+            raw.write(pg.image.tostring(surface, 'RGB'))
+    if raw is not None:
+        raw.close()
+    return len(inputs)
+
+
+def export_replay(session_path, out_dir, workers=None, fmt='png'):
+    '''
+    Renders a recorded session to numbered PNG frames or one raw RGB24 stream (frames.rgb).
+    The session is split into chunks at its checkpoints and the chunks are rendered in parallel
+    worker processes.
+
+    Parameters:
+    - session_path (str): File written by SessionRecorder.save().
+    - out_dir (str): Output directory, created if needed.
+    - workers (int or None): Number of worker processes. Default is None (one per core).
+    - fmt (str): 'png' or 'raw'. Default is 'png'.
+
+    Returns:
+    - int: Number of frames written.
+    '''
+    session = SessionRecorder.load(session_path)
+    os.makedirs(out_dir, exist_ok=True)
+    starts = sorted(session.checkpoints)
+    ends = starts[1:] + [session.start + len(session.inputs)]
+    tasks = [(session.checkpoints[a], session.inputs[a - session.start:b - session.start], a, out_dir, fmt)
+             for a, b in zip(starts, ends)]
+    pool = multiprocessing.Pool(workers)
+    frames = sum(pool.imap_unordered(render_chunk, tasks))
+    # SDL traps SIGTERM in the workers, so Pool.terminate() would hang; let them exit on their own
+    pool.close()
+    pool.join()
+    if fmt == 'raw':
+        with open(os.path.join(out_dir, 'frames.rgb'), 'wb') as stream:
+            for first in starts:
+                chunk = os.path.join(out_dir, 'chunk_{:08d}.rgb'.format(first))
+                with open(chunk, 'rb') as f:
+                    while True:
+                        block = f.read(2**22)
+                        if not block:
+                            break
+                        stream.write(block)
+                os.remove(chunk)
+    return frames
+
+
+class ReferenceManager(Manager):
+    '''
+    The engine as it was before batching: shells are CircleShell/EllipseShell objects moved one by
+    one with their own move(), and every ball is tested against every target and tank with scalar
+    code. Slow, but it is the behavior the optimized Manager has to reproduce. With a physics model
+    other than the default, e.g. from a recorded session, every shell is moved on its own by that
+    model instead. It only simulates; use Manager to draw.
+    '''
+    def __init__(self, n_targets=1):
+        super().__init__(n_targets)
+        self.balls = []
+
+    def restore(self, state):
+        '''
+        Restores a state captured by Manager.snapshot(), turning the shell arrays into shell objects.
+
+        Parameters:
+        - state (dict): The state.
+
+        Returns:
+        - None
+        '''
+        self.balls = EntityStore(self.SHELL_COMPONENTS)
+        super().restore(state)
+        balls = self.balls
+        shells = []
+        for coord, vel, rad, size, color, owner, serial, split, submunition in zip(
+                balls['coord'].tolist(), balls['vel'].tolist(), balls['rad'].tolist(), balls['size'].tolist(),
+                balls['color'].tolist(), balls['owner'].tolist(), balls['serial'].tolist(), balls['split'].tolist(),
+                balls['submunition'].tolist()):
+            if size[0]:
+                ball = EllipseShell(coord, vel, rad, tuple(color), size)
+            else:
+                ball = CircleShell(coord, vel, rad, tuple(color))
+            ball.owner = self.gun[owner] if owner >= 0 else None
+            ball.serial = serial
+            ball.split = split
+            ball.submunition = submunition
+            shells.append(ball)
+        self.balls = sorted(shells, key=lambda ball: ball.serial)
+
+    def shell_state(self):
+        '''
+        Same as Manager.shell_state(), reading the shell objects.
+        '''
+        return {('shell', ball.serial): tuple(ball.coord + ball.vel) for ball in self.balls}
+
+    def add_ball(self, ball):
+        '''
+        Adds a shell object fired by a tank and counts it in the score table, unless MAX_SHELLS shells are alive.
+        '''
+        if len(self.balls) >= MAX_SHELLS:
+            return
+        ball.serial = self.next_serial
+        self.next_serial += 1
+        self.balls.append(ball)
+        self.score_t.b_used += 1
+
+    def move_balls(self):
+        '''
+        Moves every shell with its own move(), or with the physics model one shell at a time when
+        the model differs from move(). Removes shells that died or hit the terrain and replaces
+        cluster shells at the top of their flight by their submunitions, one at a time.
+        '''
+        bursting = []
+        scalar = self.physics.matches_move()
+        for ball in self.balls:
+            rising = ball.vel[1] < 0
+            if scalar:
+                ball.move(grav=GRAV)
+            else:
+                self.physics.step([ball], GRAV)
+            if self.terrain.collide(ball.coord, ball.rad / 2):
+                self.terrain.carve(ball.coord, 2 * ball.rad)
+                ball.is_alive = False
+            elif ball.is_alive and rising and ball.vel[1] >= 0 and getattr(ball, 'split', 0) > 0:
+                bursting.append(ball)
+                ball.is_alive = False
+        self.balls = [ball for ball in self.balls if ball.is_alive]
+        for ball in bursting:
+            for dx, dy in cluster_fan().tolist():
+                if len(self.balls) >= MAX_SHELLS:
+                    return
+                sub = CircleShell(list(ball.coord), [ball.vel[0] + dx, ball.vel[1] + dy], CLUSTER_RAD, ball.color)
+                sub.owner = ball.owner
+                sub.serial = self.next_serial
+                sub.split = ball.split - 1
+                sub.submunition = True
+                self.next_serial += 1
+                self.balls.append(sub)
+
+    def move_targets(self):
+        '''
+        Moves every target, asleep or not, and refits the BVH to all of them.
+        '''
+        for target in self.targets['object']:
+            target.move()
+        self.target_index.refit()
+
+    def collide_dynamic(self):
+        '''
+        Bounces balls other than submunitions off each other and off bombs, testing every pair.
+        '''
+        bombs = self.targetBombs
+        bomb_coord = bombs.coord[:bombs.count].tolist()
+        bomb_speed = bombs.speed[:bombs.count].tolist()
+        balls = [ball for ball in self.balls if not getattr(ball, 'submunition', False)]
+        # Positions before any contact is resolved, balls first, then bombs
+        bodies = [(list(ball.coord), ball.rad) for ball in balls] + [(coord, BombPool.RAD) for coord in bomb_coord]
+        n_balls = len(balls)
+        restitution = self.physics.refl_ort
+        contacts = []
+        for i in range(n_balls):
+            ball = balls[i]
+            for j in range(i + 1, len(bodies)):
+                normal = np.array(bodies[j][0], dtype=float) - bodies[i][0]
+                dist = math.hypot(normal[0], normal[1])
+                overlap = float(bodies[i][1] + bodies[j][1] - dist)
+                if overlap <= 0 or dist == 0:
+                    continue
+                normal /= dist
+                vel_i = np.array(ball.vel, dtype=float)
+                if j < n_balls:
+                    other = balls[j]
+                    vel_j = np.array(other.vel, dtype=float)
+                    closing = np.dot(vel_j - vel_i, normal)
+                    if closing < 0:
+                        impulse = (1 + restitution) * closing / 2
+                        ball.vel[:] = (vel_i + impulse * normal).tolist()
+                        other.vel[:] = (vel_j - impulse * normal).tolist()
+                    ball.coord[:] = (ball.coord - normal * overlap / 2).tolist()
+                    other.coord[:] = (other.coord + normal * overlap / 2).tolist()
+                else:
+                    closing = np.dot(np.array([0, bomb_speed[j - n_balls]]) - vel_i, normal)
+                    if closing < 0:
+                        ball.vel[:] = (vel_i + (1 + restitution) * closing * normal).tolist()
+                    ball.coord[:] = (ball.coord - normal * overlap).tolist()
+                contacts.append((i, j))
+        return contacts
+
+    def hit_tanks(self):
+        '''
+        Tests every ball and bomb against every tank one at a time and applies the damage.
+        '''
+        boxes = [gun.hitbox() for gun in self.gun]
+
+        def touches(coord, rad, box):
+            dx = coord[0] - min(max(coord[0], box[0]), box[2])
+            dy = coord[1] - min(max(coord[1], box[1]), box[3])
+            return dx * dx + dy * dy <= rad * rad
+
+        damage = [0] * len(self.gun)
+        survivors = []
+        for ball in self.balls:
+            hit = [i for i, box in enumerate(boxes) if self.gun[i] is not ball.owner and touches(ball.coord, ball.rad, box)]
+            for i in hit:
+                damage[i] += SHELL_DAMAGE
+            if hit:
+                self.score_t.tank_hits[self.gun.index(ball.owner) if ball.owner in self.gun else -1] += 1
+                self.particles.spawn(ball.coord, ball.color, amount=30)
+            else:
+                survivors.append(ball)
+        self.balls = survivors
+        bombs = self.targetBombs
+        landed = np.zeros(bombs.count, dtype=bool)
+        for k, coord in enumerate(bombs.coord[:bombs.count].tolist()):
+            hit = [i for i, box in enumerate(boxes) if touches(coord, BombPool.RAD, box)]
+            for i in hit:
+                damage[i] += BOMB_DAMAGE
+            landed[k] = bool(hit)
+        if landed.any():
+            self.score_t.bomb_hits += int(landed.sum())
+            for coord in bombs.coord[:bombs.count][landed]:
+                self.particles.spawn(coord, GRAY, amount=30)
+            bombs.remove(landed)
+        for i, gun in enumerate(self.gun):
+            gun.hp -= damage[i]
+            if gun.hp <= 0:
+                self.score_t.tank_destr[i] += 1
+                gun.hp = gun.max_hp
+
+    def hit_targets(self):
+        '''
+        Finds the rows of the targets hit by balls with check_collision over all ball-target pairs.
+        '''
+        hits = set()
+        for ball in self.balls:
+            for row, target in enumerate(self.targets['object']):
+                if row not in hits and target.check_collision(ball):
+                    hits.add(row)
+        return sorted(hits)
+
+
+def scripted_inputs(ticks, seed=0, cluster=False):
+    '''
+    Generates a reproducible input sequence that moves both tanks, aims around and fires often.
+
+    Parameters:
+    - ticks (int): Number of ticks.
+    - seed (int): Seed of the sequence. Default is 0.
+    - cluster (bool): Fire every other shot as a cluster shell. Default is False.
+
+    Returns:
+    - list: Inputs in the format of SessionRecorder.encode().
+    '''
+    rng = random.Random(seed)
+    inputs = []
+    release = None
+    for tick in range(ticks):
+        events = []
+        button = 3 if cluster and tick // 12 % 2 else 1
+        if tick % 12 == 0:
+            events.append((pg.MOUSEBUTTONDOWN, None, button))
+            release = tick + rng.randint(3, 11)  # Hold to charge, then fire
+        elif tick == release:
+            events.append((pg.MOUSEBUTTONUP, None, button))
+        pressed = [key for key in SessionRecorder.KEYS if rng.random() < 0.15]
+        inputs.append((events, pressed, (rng.randint(0, SCREEN_SIZE[0]), rng.randint(0, SCREEN_SIZE[1] // 2))))
+    return inputs
+
+
+class DeterminismHarness:
+    '''
+    Runs the optimized Manager and the scalar ReferenceManager side by side from the same state and
+    inputs. Both states are hashed every tick; on a mismatch the entities are compared one by one
+    and the first that differs by more than the tolerance is reported.
+    '''
+    def __init__(self, n_targets=1, seed=0, physics=None, tolerance=0.0, state=None):
+        '''
+        Constructor method.
+
+        Parameters:
+        - n_targets (int): Targets per type in each mission. Default is 1.
+        - seed (int): Seed of the random module for the first mission. Default is 0.
+        - physics (PhysicsModel or None): Physics of both engines. Default is None (the one matching CircleShell.move).
+        - tolerance (float): Largest absolute difference accepted in any state value. Default is 0 (bit-exact).
+        - state (dict or None): Manager.snapshot() to start from instead of a new game, e.g. a session checkpoint.
+        '''
+        random.seed(seed)
+        self.optimized = Manager(n_targets, physics=physics)
+        if state is not None:
+            self.optimized.restore(state)
+        state = self.optimized.snapshot()
+        self.reference = ReferenceManager(state['n_targets'])
+        self.reference.restore(state)
+        self.engines = (self.reference, self.optimized)
+        self.random_states = [state['random'], state['random']]  # Each engine has its own random stream
+        self.tolerance = tolerance
+        self.hashes = []  # (reference, optimized) state hashes of every tick
+
+    def step(self, encoded):
+        '''
+        Runs one tick with the same input on both engines.
+
+        Parameters:
+        - encoded (tuple): Input in the format of SessionRecorder.encode().
+
+        Returns:
+        - tuple or None: (entity key, reference value, optimized value) of the first divergence, or None.
+        '''
+        for k, mgr in enumerate(self.engines):
+            random.setstate(self.random_states[k])
+            mgr.tick(*SessionRecorder.decode(encoded))
+            self.random_states[k] = random.getstate()
+        states = [mgr.entity_state() for mgr in self.engines]
+        hashes = tuple(hashlib.sha1(repr(sorted((key, tuple(map(float, value))) for key, value in state.items())).encode())
+                       .hexdigest() for state in states)
+        self.hashes.append(hashes)
+        if hashes[0] == hashes[1]:
+            return None
+        reference, optimized = states
+        for key in sorted(set(reference) | set(optimized)):
+            a, b = reference.get(key), optimized.get(key)
+            if a is None or b is None or len(a) != len(b) or any(abs(x - y) > self.tolerance for x, y in zip(a, b)):
+                return key, a, b
+        return None
+
+    def run(self, inputs):
+        '''
+        Runs both engines over an input sequence until they diverge.
+
+        Parameters:
+        - inputs (list): Inputs in the format of SessionRecorder.encode().
+
+        Returns:
+        - dict or None: {'tick', 'entity', 'reference', 'optimized'} of the first divergence, or None.
+        '''
+        for encoded in inputs:
+            divergence = self.step(encoded)
+            if divergence is not None:
+                key, a, b = divergence
+                return {'tick': self.optimized.ticks, 'entity': key, 'reference': a, 'optimized': b}
+        return None
+
+
+def play(mgr, viewport, fps=FPS, pacer=None, frames=None):
+    '''
+    Runs the game loop: one tick and one drawn frame every 1/fps seconds, or frames paced by a FramePacer.
+
+    Parameters:
+    - mgr (Manager): The game.
+    - viewport (Viewport): The game window. Its latency probe, if any, also times the frames.
+    - fps (int): Frame rate without a pacer. Default is FPS.
+    - pacer (FramePacer or None): Paces the frames instead. Default is None.
+    - frames (int or None): Stops after this many frames. Default is None (until the window is closed).
+
+    Returns:
+    - None
+    '''
+    clock = pg.time.Clock()
+    done = False
+    frame = 0
+    while not done and (frames is None or frame < frames):
+        frame += 1
+        if pacer is not None:
+            done = pacer.run_frame(mgr, viewport)
+            continue
+        if viewport.probe is not None:
+            busy = viewport.probe.tick(fps)  # Keeps stamping events while it waits, unlike clock.tick
+        else:
+            clock.tick(fps)
+            busy = clock.get_rawtime()
+        mgr.governor.update(busy)
+        done = mgr.process(viewport.events(), viewport.begin())
+
+        viewport.present()
+
+
+if __name__ == '__main__':
+    viewport = Viewport()
+    pg.display.set_caption("The gun of Khiryanov")
+
+    mgr = Manager(n_targets=1, physics=PhysicsModel(integrator='verlet', drag=0.0003, wind_max=6,
+                                                     max_step=15, truncate=False))
+    writer = None
+    if TELEMETRY_FILE is not None:
+        mgr.telemetry = Telemetry()
+        writer = TelemetryWriter(mgr.telemetry, TELEMETRY_FILE, fmt=TELEMETRY_FORMAT)
+        writer.start()
+    if RECORD_FILE is not None:
+        mgr.recorder = SessionRecorder()
+    if TRACE_DIR is not None:
+        mgr.tracer = TraceRecorder(TRACE_DIR)
+
+    mgr.viewport = viewport
+    if PREFETCH_MISSIONS:
+        mgr.missions = MissionBuilder()
+    if ALLOC_PROFILE:
+        mgr.profiler = AllocationProfiler()
+        mgr.profiler.start()
+    if LATENCY_PROBE:
+        viewport.probe = LatencyProbe(mgr.telemetry)
+    pacer = FramePacer(max_skip=MAX_FRAME_SKIP) if PACING else None
+
+    play(mgr, viewport, pacer=pacer)
+
+    if pacer is not None:
+        print(pacer.report())
+    if viewport.probe is not None:
+        print(viewport.probe.report())
+    if mgr.missions is not None:
+        print(mgr.missions.report())
+    if mgr.profiler is not None:
+        mgr.profiler.stop()
+        print(mgr.profiler.report())
+    if writer is not None:
+        writer.stop()
+    if mgr.recorder is not None:
+        mgr.recorder.save(RECORD_FILE)
+    if mgr.tracer is not None:
+        mgr.tracer.close()
+
+    pg.quit()
@@ -0,0 +1,81 @@
+'''
+Measures input-to-display latency of the game loop under synthetic input.
+
+Usage:
+    python latency_bench.py [--fps F] [--pacing] [--max-skip N] [--seconds S] [--rate R] [--targets T]
+
+Runs the real game loop (cannon.play) headless with a cannon.LatencyProbe while a background
+thread posts aiming, firing and moving events at random times, R per second on average.
+Prints the latency percentiles per kind of input, so tick-rate and pacing changes can be compared.
+'''
+import argparse
+import os
+import random
+import threading
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')  # The window is not shown
+
+import pygame as pg
+
+import cannon
+
+
+def inject(rate, stop, seed):
+    '''
+    Posts input events at exponentially distributed intervals until stop is set.
+
+    Parameters:
+    - rate (float): Mean number of inputs per second.
+    - stop (threading.Event): Ends the injection.
+    - seed (int): Seed of the input sequence.
+
+    Returns:
+    None
+    '''
+    rng = random.Random(seed)
+    while not stop.wait(rng.expovariate(rate)):
+        kind = rng.choice(('aim', 'aim', 'strike', 'move'))
+        if kind == 'aim':
+            pos = (rng.randint(0, cannon.SCREEN_SIZE[0] - 1), rng.randint(0, cannon.SCREEN_SIZE[1] // 2))
+            pg.event.post(pg.event.Event(pg.MOUSEMOTION, pos=pos, rel=(0, 0), buttons=(0, 0, 0)))
+        elif kind == 'strike':
+            pg.event.post(pg.event.Event(pg.MOUSEBUTTONDOWN, button=1, pos=(0, 0)))
+            pg.event.post(pg.event.Event(pg.MOUSEBUTTONUP, button=1, pos=(0, 0)))
+        else:
+            pg.event.post(pg.event.Event(pg.KEYDOWN, key=rng.choice(cannon.LatencyProbe.MOVE_KEYS), mod=0))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Input-to-display latency of the cannon game loop.')
+    parser.add_argument('--fps', type=int, default=cannon.FPS, help='frame rate (default: FPS)')
+    parser.add_argument('--pacing', action='store_true', help='run the loop with a FramePacer')
+    parser.add_argument('--max-skip', type=int, default=cannon.MAX_FRAME_SKIP, help='maximum frames skipped when pacing')
+    parser.add_argument('--seconds', type=float, default=10, help='length of the run (default: 10)')
+    parser.add_argument('--rate', type=float, default=20, help='inputs per second (default: 20)')
+    parser.add_argument('--targets', type=int, default=1, help='targets per type (default: 1)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the game and the input (default: 0)')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    viewport = cannon.Viewport()
+    viewport.probe = cannon.LatencyProbe()
+    mgr = cannon.Manager(n_targets=args.targets)
+    mgr.viewport = viewport
+    pacer = cannon.FramePacer(fps=args.fps, max_skip=args.max_skip) if args.pacing else None
+
+    stop = threading.Event()
+    injector = threading.Thread(target=inject, args=(args.rate, stop, args.seed), daemon=True)
+    injector.start()
+    start = time.perf_counter()
+    cannon.play(mgr, viewport, fps=args.fps, pacer=pacer, frames=round(args.seconds * args.fps))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    injector.join()
+
+    print('{} frames at {} fps{} in {:.1f} s'.format(round(args.seconds * args.fps), args.fps,
+                                                     ' (paced)' if pacer is not None else '', elapsed))
+    if pacer is not None:
+        print(pacer.report())
+    print(viewport.probe.report())
+    pg.quit()
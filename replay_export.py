@@ -0,0 +1,30 @@
+'''
+Renders a session recorded with cannon.RECORD_FILE to video frames.
+
+Usage:
+    python replay_export.py session.rec frames/ [--raw] [--workers N]
+
+Writes numbered PNG frames (frame_000000.png, ...) or, with --raw, a single RGB24 stream
+frames.rgb of 800x600 frames that can be piped into a video encoder, e.g.
+    ffmpeg -f rawvideo -pix_fmt rgb24 -s 800x600 -r 15 -i frames/frames.rgb clip.mp4
+'''
+import argparse
+import os
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')  # Frames are rendered offscreen
+
+import cannon
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render a recorded cannon session to frames.')
+    parser.add_argument('session', help='session file written by SessionRecorder')
+    parser.add_argument('out_dir', help='output directory')
+    parser.add_argument('--raw', action='store_true', help='write one raw RGB24 stream instead of PNG files')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per core)')
+    args = parser.parse_args()
+    start = time.perf_counter()
+    frames = cannon.export_replay(args.session, args.out_dir, args.workers, 'raw' if args.raw else 'png')
+    elapsed = time.perf_counter() - start
+    print('{} frames in {:.1f} s ({:.0f} frames/s)'.format(frames, elapsed, frames / elapsed))
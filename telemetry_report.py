@@ -0,0 +1,95 @@
+'''
+Offline report tool for the JSON-lines files written by cannon.TelemetryWriter.
+
+Usage:
+    python telemetry_report.py telemetry.jsonl telemetry.jsonl.1 ...
+
+Merges all records per build label and prints a percentile table (in milliseconds)
+for the frame time and every Manager.process phase, followed by the entity-count gauges.
+'''
+import argparse
+import json
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def load(paths):
+    '''
+    Reads telemetry records and merges them per build.
+
+    Parameters:
+    - paths (list): JSON-lines files to read.
+
+    Returns:
+    - dict: build -> {'histograms': {name: {value: count}}, 'gauges': {name: [max values]}, 'seconds': float}
+    '''
+    builds = {}
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                build = builds.setdefault(record['build'], {'histograms': {}, 'gauges': {}, 'seconds': 0.0})
+                build['seconds'] += record['end'] - record['start']
+                for name, hist in record['histograms'].items():
+                    counts = build['histograms'].setdefault(name, {})
+                    for value, count in hist['counts'].items():
+                        counts[int(value)] = counts.get(int(value), 0) + count
+                for name, gauge in record['gauges'].items():
+                    build['gauges'].setdefault(name, []).append(gauge['max'])
+    return builds
+
+
+def percentile(counts, p):
+    '''
+    Returns the p-th percentile of a merged histogram.
+
+    Parameters:
+    - counts (dict): Bucket value -> count.
+    - p (float): The percentile, between 0 and 100.
+
+    Returns:
+    - int: The percentile value (0 for an empty histogram).
+    '''
+    total = sum(counts.values())
+    seen = 0
+    for value in sorted(counts):
+        seen += counts[value]
+        if seen >= total * p / 100:
+            return value
+    return 0
+
+
+def report(builds):
+    '''
+    Formats the percentile tables of all builds.
+
+    Parameters:
+    - builds (dict): Result of load().
+
+    Returns:
+    - str: The report.
+    '''
+    lines = []
+    header = '{:<10}{:>10}' + '{:>10}' * (len(PERCENTILES) + 1)
+    for build in sorted(builds):
+        data = builds[build]
+        lines.append('Build {} ({:.0f} s recorded)'.format(build, data['seconds']))
+        lines.append(header.format('phase', 'count', *['p{}'.format(p) for p in PERCENTILES], 'max'))
+        for name, counts in sorted(data['histograms'].items()):
+            if not counts:
+                continue
+            row = [percentile(counts, p) / 1000 for p in PERCENTILES] + [max(counts) / 1000]
+            lines.append(('{:<10}{:>10}' + '{:>10.2f}' * len(row)).format(name, sum(counts.values()), *row))
+        for name, peaks in sorted(data['gauges'].items()):
+            lines.append('{:<10} max {} avg of interval peaks {:.1f}'.format(name, max(peaks), sum(peaks) / len(peaks)))
+        lines.append('')
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Percentile tables from cannon telemetry files.')
+    parser.add_argument('paths', nargs='+', help='JSON-lines telemetry files (rotated files included)')
+    print(report(load(parser.parse_args().paths)))